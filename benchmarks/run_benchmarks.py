@@ -0,0 +1,307 @@
+"""
+Benchmarks of the client-side hot paths of the examples.
+
+For qb_flip, bell_states_qiskit, ghz and bernstein_vazirani in Qiskit and ghz, qb_flip and the
+batch submission examples in Cirq this times
+
+- circuit construction
+- transpilation, or decomposition and routing in Cirq
+- serialization into the IQM run request
+- post-processing of the counts into histograms and metrics
+
+and finally complete runs on the simulator and on a local stand-in of the Cortex server
+(helmi_utils/mock_cortex.py), so the submission, polling and result parsing of the IQM clients
+are included without network access. Pass --url to run against another server instead.
+
+The results are written as JSON together with the versions of the installed packages.
+Comparing them with --compare shows regressions between releases of iqm-client, qiskit-iqm
+and cirq-iqm.
+
+Example usage:
+    python run_benchmarks.py --output results.json
+    python run_benchmarks.py --output new.json --compare results.json
+"""
+import os
+
+# iqm_client reads the polling interval when it is imported, poll often to time the client and not the sleep
+os.environ.setdefault("IQM_CLIENT_SECONDS_BETWEEN_CALLS", "0.01")
+
+import argparse  # noqa: E402
+import importlib.util  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import statistics  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from datetime import datetime, timezone  # noqa: E402
+from importlib.metadata import PackageNotFoundError, version  # noqa: E402
+
+import numpy as np  # noqa: E402
+import sympy  # noqa: E402
+from iqm.cirq_iqm import IQMSampler  # noqa: E402
+from iqm.cirq_iqm.iqm_sampler import serialize_circuit  # noqa: E402
+from iqm.qiskit_iqm import IQMProvider  # noqa: E402
+
+import cirq  # noqa: E402
+from qiskit import Aer, ClassicalRegister, QuantumCircuit, QuantumRegister, transpile  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+from helmi_utils.compile_pipeline import compile_circuit, compile_circuits, simplify_circuits  # noqa: E402
+from helmi_utils.compiled_template import CompiledTemplate  # noqa: E402
+from helmi_utils.ghz import ghz_target  # noqa: E402
+from helmi_utils.histogram import bitstring_counts  # noqa: E402
+from helmi_utils.metrics import distribution_metrics  # noqa: E402
+from helmi_utils.mock_cortex import MockCortex  # noqa: E402
+from helmi_utils.transpile_cache import TranspileCache  # noqa: E402
+
+PACKAGES = ["iqm-client", "qiskit-iqm", "cirq-iqm", "qiskit", "qiskit-aer", "cirq-core", "numpy"]
+
+SHOTS = 1000
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmarks of the example scripts")
+    parser.add_argument(
+        "--output", type=str, default=None,
+        help="JSON file for the results.",
+    )
+    parser.add_argument(
+        "--compare", type=str, default=None,
+        help="JSON file of earlier results to compare with.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=10,
+        help="Number of timed repeats of every benchmark. Default is 10.",
+    )
+    parser.add_argument(
+        "--url", type=str, default=None,
+        help="Cortex URL to run against instead of a local stand-in server.",
+    )
+    parser.add_argument(
+        "--filter", type=str, default=None,
+        help="Only run benchmarks whose name contains this string.",
+    )
+    return parser.parse_args()
+
+
+def load_example(path: str, name: str):
+    """
+    Imports an example script as a module under a unique name.
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def package_versions() -> dict:
+    """
+    Returns the installed versions of the packages the examples depend on.
+    """
+    versions = {"python": platform.python_version()}
+    for package in PACKAGES:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def measure(function, repeat: int) -> dict:
+    """
+    Calls function once to warm up and then repeat times, and returns statistics of the
+    wall times in seconds.
+    """
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "repeat": repeat,
+    }
+
+
+def qiskit_benchmarks(backend, simulator) -> dict:
+    """
+    Returns the benchmarks of the Qiskit examples as a dict of functions without arguments.
+    """
+    qb_flip = load_example("qiskit/qb_flip.py", "qiskit_qb_flip")
+    bell_states = load_example("qiskit/bell_states_qiskit.py", "qiskit_bell_states")
+    ghz = load_example("qiskit/ghz.py", "qiskit_ghz")
+    bernstein_vazirani = load_example("qiskit/bernstein_vazirani.py", "qiskit_bernstein_vazirani")
+    coupling_map = backend.coupling_map.get_edges()
+
+    flip, flip_mapping = qb_flip.flip_circuit([0, 1, 2, 3, 4])
+    flip_transpiled = transpile(flip, backend, initial_layout=flip_mapping)
+    flip_counts = simulator.run(flip_transpiled, shots=SHOTS).result().get_counts()
+
+    qubit_pairs = [(qb, 2) for qb in [0, 1, 3, 4]]
+    pairs = bell_states.bell_pair_circuits(qubit_pairs)
+    pairs_transpiled = [transpile(qc, backend, initial_layout=mapping) for _, qc, mapping, _ in pairs]
+    pairs_counts = simulator.run(pairs_transpiled, shots=SHOTS).result().get_counts()
+    transpile_cache = TranspileCache(backend)
+
+    ghz_qc, ghz_mapping = ghz.ghz_circuit(5, coupling_map)
+    ghz_transpiled = transpile(ghz_qc, backend, initial_layout=ghz_mapping)
+    ghz_counts = simulator.run(ghz_transpiled, shots=SHOTS).result().get_counts()
+
+    oracle = bernstein_vazirani.BVoracle(backend, num=5)
+
+    def bv_circuit():
+        qc = QuantumCircuit(QuantumRegister(5, "QB"), ClassicalRegister(4, "c"))
+        return oracle._prepare_circuit(qc, qc.qregs[0])
+
+    bv_qc, bv_layout = bv_circuit()
+    bv_transpiled = transpile(bv_qc, backend, initial_layout=bv_layout)
+    bv_results = [simulator.run(bv_transpiled, shots=SHOTS).result().get_counts() for _ in range(5)]
+
+    return {
+        "qiskit.qb_flip.construct": lambda: qb_flip.flip_circuit([0, 1, 2, 3, 4]),
+        "qiskit.qb_flip.transpile": lambda: transpile(flip, backend, initial_layout=flip_mapping),
+        "qiskit.qb_flip.serialize": lambda: backend.serialize_circuit(flip_transpiled),
+        "qiskit.qb_flip.postprocess": lambda: qb_flip.calculate_success_probability(flip_counts, SHOTS, "11111"),
+        "qiskit.bell_states.construct": lambda: bell_states.bell_pair_circuits(qubit_pairs),
+        "qiskit.bell_states.transpile": lambda: [
+            transpile(qc, backend, initial_layout=mapping) for _, qc, mapping, _ in pairs
+        ],
+        "qiskit.bell_states.transpile_cached": lambda: [
+            transpile_cache.transpile(qc, initial_layout=mapping) for _, qc, mapping, _ in pairs
+        ],
+        "qiskit.bell_states.serialize": lambda: [backend.serialize_circuit(qc) for qc in pairs_transpiled],
+        "qiskit.bell_states.postprocess": lambda: [
+            distribution_metrics(counts, {"00": 0.5, "11": 0.5}) for counts in pairs_counts
+        ],
+        "qiskit.ghz.construct": lambda: ghz.ghz_circuit(5, coupling_map),
+        "qiskit.ghz.transpile": lambda: transpile(ghz_qc, backend, initial_layout=ghz_mapping),
+        "qiskit.ghz.serialize": lambda: backend.serialize_circuit(ghz_transpiled),
+        "qiskit.ghz.postprocess": lambda: distribution_metrics(ghz_counts, ghz_target(5)),
+        "qiskit.bernstein_vazirani.construct": bv_circuit,
+        "qiskit.bernstein_vazirani.transpile": lambda: transpile(bv_qc, backend, initial_layout=bv_layout),
+        "qiskit.bernstein_vazirani.serialize": lambda: backend.serialize_circuit(bv_transpiled),
+        "qiskit.bernstein_vazirani.postprocess": lambda: bernstein_vazirani.most_frequent(
+            [max(counts, key=counts.get) for counts in bv_results],
+        ),
+        "qiskit.ghz.run_simulator": lambda: simulator.run(ghz_transpiled, shots=SHOTS).result().get_counts(),
+        "qiskit.ghz.run_server": lambda: backend.run(ghz_transpiled, shots=SHOTS).result().get_counts(),
+        "qiskit.bell_states.run_server_batch": lambda: backend.run(pairs_transpiled, shots=SHOTS).result(),
+    }
+
+
+def cirq_benchmarks(sampler) -> dict:
+    """
+    Returns the benchmarks of the Cirq examples as a dict of functions without arguments.
+    """
+    ghz = load_example("cirq/ghz.py", "cirq_ghz")
+    qb_flip = load_example("cirq/qb_flip.py", "cirq_qb_flip")
+    device = sampler.device
+    coupling_map = list(device.metadata.nx_graph.edges)
+    simulator = cirq.Simulator(seed=1)
+
+    ghz_circuit = ghz.ghz_circuit(5, coupling_map)
+    # The examples place their qubits on the device already, so they are only decomposed
+    ghz_routed = device.decompose_circuit(ghz_circuit)
+    ghz_measurements = simulator.run(ghz_circuit, repetitions=SHOTS).measurements["M"]
+
+    flip = qb_flip.flip_circuit(list(range(1, 6)))
+    flip_routed = device.decompose_circuit(flip)
+    flip_measurements = simulator.run(flip, repetitions=SHOTS).measurements["M"]
+
+    alice, bob = cirq.NamedQubit("Alice"), cirq.NamedQubit("Bob")
+    bell = cirq.Circuit(cirq.H(alice), cirq.CNOT(alice, bob), cirq.measure(alice, bob, key="m"))
+    batch = [bell] * 10
+
+    theta = sympy.Symbol("theta")
+    template = cirq.Circuit(
+        cirq.H(alice), cirq.CNOT(alice, bob), cirq.Z(alice) ** theta, cirq.Z(bob) ** theta,
+        cirq.CNOT(alice, bob), cirq.H(alice), cirq.measure(alice, bob, key="m"),
+    )
+    sweep = cirq.Linspace(theta.name, start=0, stop=1, length=10)
+    compiled_template = CompiledTemplate(device, template)
+
+    return {
+        "cirq.ghz.construct": lambda: ghz.ghz_circuit(5, coupling_map),
+        "cirq.ghz.decompose": lambda: device.decompose_circuit(ghz_circuit),
+        "cirq.ghz.serialize": lambda: serialize_circuit(ghz_routed),
+        "cirq.ghz.postprocess": lambda: distribution_metrics(bitstring_counts(ghz_measurements), ghz_target(5)),
+        "cirq.qb_flip.construct": lambda: qb_flip.flip_circuit(list(range(1, 6))),
+        "cirq.qb_flip.decompose": lambda: device.decompose_circuit(flip),
+        "cirq.qb_flip.serialize": lambda: serialize_circuit(flip_routed),
+        "cirq.qb_flip.postprocess": lambda: bitstring_counts(flip_measurements),
+        "cirq.batch_submission.route": lambda: compile_circuits(device, batch, simplify=False),
+        "cirq.batch_submission.route_single": lambda: compile_circuit(device, bell, simplify=False),
+        "cirq.batched_parameterized.template": lambda: CompiledTemplate(device, template),
+        "cirq.batched_parameterized.resolve": lambda: simplify_circuits(
+            compiled_template.resolve_sweep(sweep, simplify=False),
+        ),
+        "cirq.ghz.run_simulator": lambda: simulator.run(ghz_circuit, repetitions=SHOTS),
+        "cirq.ghz.run_server": lambda: sampler.run(ghz_routed, repetitions=SHOTS),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float = 1.2):
+    """
+    Prints the ratio of the median times to a baseline, marking benchmarks that are
+    more than threshold times slower.
+    """
+    print(f"\n{'benchmark':45} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        ratio = stats["median"] / baseline[name]["median"]
+        flag = "  SLOWER" if ratio > threshold else ""
+        print(f"{name:45} {baseline[name]['median']:12.6f} {stats['median']:12.6f} {ratio:8.2f}{flag}")
+
+
+def main():
+    args = get_args()
+    np.random.seed(1)
+
+    cortex = None
+    url = args.url
+    if url is None:
+        cortex = MockCortex(seed=1).start()
+        url = cortex.url
+
+    try:
+        backend = IQMProvider(url).get_backend()
+        simulator = Aer.get_backend("aer_simulator")
+        sampler = IQMSampler(url)
+
+        benchmarks = {**qiskit_benchmarks(backend, simulator), **cirq_benchmarks(sampler)}
+
+        results = {}
+        for name, function in benchmarks.items():
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = measure(function, args.repeat)
+            print(f"{name:45} median {results[name]['median'] * 1e3:10.3f} ms")
+    finally:
+        if cortex is not None:
+            cortex.stop()
+
+    output = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "server": "local stand-in" if cortex is not None else url,
+        "shots": SHOTS,
+        "versions": package_versions(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
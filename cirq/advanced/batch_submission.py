@@ -1,52 +1,58 @@
 """
 This example demonstrates how to submit multiple circuits as a batch using IQMSampler.
+
+The circuits are decomposed and routed in parallel on the CPUs allocated with
+--cpus-per-task in SLURM, see helmi_utils/compile_pipeline.py.
 """
 import os
+import sys
 
 from iqm.cirq_iqm import IQMSampler
 
 import cirq
 
-HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
-sampler = IQMSampler(HELMI_CORTEX_URL)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from helmi_utils.compile_pipeline import compile_circuits  # noqa: E402
 
-# Create a list to store the circuits
 
-circuit_list = []
+def main():
+    HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
+    sampler = IQMSampler(HELMI_CORTEX_URL)
 
-# Create 2 example Bell state circuits
-q1, q2 = cirq.NamedQubit('Alice'), cirq.NamedQubit('Bob')
-circuit1 = cirq.Circuit()
-circuit1.append(cirq.H(q1))
-circuit1.append(cirq.CNOT(q1, q2))
-circuit1.append(cirq.measure(q1, q2, key='m'))
+    # Create a list to store the circuits
 
-print("Circuit 1")
-print(circuit1)
+    circuit_list = []
 
+    # Create 2 example Bell state circuits
+    q1, q2 = cirq.NamedQubit('Alice'), cirq.NamedQubit('Bob')
+    circuit1 = cirq.Circuit()
+    circuit1.append(cirq.H(q1))
+    circuit1.append(cirq.CNOT(q1, q2))
+    circuit1.append(cirq.measure(q1, q2, key='m'))
 
-circuit2 = cirq.Circuit()
-circuit2.append(cirq.H(q1))
-circuit2.append(cirq.CNOT(q2, q1))
-circuit2.append(cirq.measure(q1, q2, key='m'))
+    print("Circuit 1")
+    print(circuit1)
 
-print("Circuit 2")
-print(circuit2)
+    circuit2 = cirq.Circuit()
+    circuit2.append(cirq.H(q1))
+    circuit2.append(cirq.CNOT(q2, q1))
+    circuit2.append(cirq.measure(q1, q2, key='m'))
 
-# Decompose the circuits
+    print("Circuit 2")
+    print(circuit2)
 
-decomposed_circuit1 = sampler.device.decompose_circuit(circuit1)
+    circuit_list.append(circuit1)
+    circuit_list.append(circuit2)
 
-decomposed_circuit2 = sampler.device.decompose_circuit(circuit2)
+    # Decompose and route the circuits, keeping their order
 
-routed_circuit_1, _, _ = sampler.device.route_circuit(decomposed_circuit1)
+    routed_circuits = compile_circuits(sampler.device, circuit_list, simplify=False)
 
-routed_circuit_2, _, _ = sampler.device.route_circuit(decomposed_circuit2)
+    results = sampler.run_iqm_batch(routed_circuits, repetitions=100)
 
-circuit_list.append(routed_circuit_1)
-circuit_list.append(routed_circuit_2)
+    for result in results:
+        print(result.histogram(key="m"))
 
-results = sampler.run_iqm_batch(circuit_list, repetitions=100)
 
-for result in results:
-    print(result.histogram(key="m"))
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,16 @@
 This advanced example demonstrates how to use the run_sweep method to sweep a set of parameters in a circuit
 """
 import os
+import sys
 
-import numpy as np
 import sympy
 from iqm.cirq_iqm import IQMSampler
 from iqm.cirq_iqm.optimizers import simplify_circuit
 
 import cirq
 
-
-def fold_func(x: np.ndarray) -> str:
-    """Fold the measured bit arrays into strings."""
-    return ''.join(map(lambda x: chr(x + ord('0')), x))
-
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from helmi_utils.histogram import bitstring_counts  # noqa: E402
 
 HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
 sampler = IQMSampler(HELMI_CORTEX_URL)
@@ -46,4 +43,4 @@ results = sampler.run_sweep(
 )
 
 for result in results:
-    print(f'{result.params}: {result.histogram(key="m", fold_func=fold_func)}')
+    print(f'{result.params}: {bitstring_counts(result.measurements["m"])}')
@@ -1,17 +1,16 @@
 import argparse
 import os
+import sys
 from argparse import RawTextHelpFormatter
 
-import numpy as np
 from iqm.cirq_iqm import Adonis, IQMSampler
 
 import cirq
 
-
-def fold_func(x: np.ndarray) -> str:
-    """Fold the measured bit arrays into strings."""
-    return ''.join(map(lambda x: chr(x + ord('0')), x))
-
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.ghz import ghz_schedule, ghz_target  # noqa: E402
+from helmi_utils.histogram import bitstring_counts  # noqa: E402
+from helmi_utils.metrics import distribution_metrics  # noqa: E402
 
 """
 
@@ -20,7 +19,8 @@ This example creates a 5 qubit GHZ state in cirq
 First a Bell state is prepared between QB3 and all the other qubits.
 From this we can measure the trace distance between QB3 and each of the other qubits.
 
-A 5 qubit GHZ state is then created
+A GHZ state is then created, by default with 5 qubits. The CNOTs fan out along the
+coupling map of the device so that the circuit is as shallow as possible.
 
 
 """
@@ -48,6 +48,18 @@ def get_args():
         choices=["helmi", "simulator"],
     )
 
+    args_parser.add_argument(
+        "--qubits",
+        help="""
+        Number of qubits in the GHZ state.
+        The CNOTs are laid out along the coupling map of the backend.
+        Default = 5
+        """,
+        required=False,
+        type=int,
+        default=5,
+    )
+
     args_parser.add_argument(
         "--verbose",
         "-v",
@@ -61,6 +73,21 @@ def get_args():
     return args_parser.parse_args()
 
 
+def ghz_circuit(num_qubits: int, coupling_map: list) -> cirq.Circuit:
+    """
+    Returns a GHZ circuit with its CNOTs placed along the coupling map in as few layers as possible.
+    """
+    qubits, layers = ghz_schedule(num_qubits, coupling_map)
+    circuit = cirq.Circuit()
+
+    circuit.append(cirq.H(qubits[0]))
+    for layer in layers:
+        circuit.append(cirq.Moment(cirq.CNOT(control, target) for control, target in layer))
+
+    circuit.append(cirq.measure(*qubits, key="M"))
+    return circuit
+
+
 def main():
     offset = " " * 37
     offset_2 = " " * 10
@@ -75,13 +102,15 @@ def main():
                 "Environment variable HELMI_CORTEX_URL is not set",
             )
         sampler = IQMSampler(HELMI_CORTEX_URL)
+        device = sampler.device
     else:
         sampler = cirq.Simulator()
+        device = adonis
 
     shots = 10000
 
     bell_vd = []
-    id_dist = [0.5, 0, 0, 0.5]
+    bell_target = {'00': 0.5, '11': 0.5}
 
     print(" ")
     print(offset + "================================ ")
@@ -99,22 +128,15 @@ def main():
 
         circuit.append(cirq.measure(*q, key="M"))
 
-        decomposed_circuit = adonis.decompose_circuit(circuit)
+        decomposed_circuit = device.decompose_circuit(circuit)
 
         result = sampler.run(decomposed_circuit, repetitions=shots)
-        counts = result.histogram(key='M', fold_func=fold_func)
+        counts = bitstring_counts(result.measurements['M'])
 
-        values = counts.values()
-        values_list = list(values)
+        metrics = distribution_metrics(counts, bell_target)
+        fid1 = metrics['fidelity']  # Fidelity
 
-        vd = 0  # Variational distance
-        fid1 = 0  # Fidelity
-        for i in range(len(counts)):
-            vd += np.abs(values_list[i] / shots - id_dist[i])
-            vd = 0.5 * vd
-            fid1 += np.sqrt((values_list[i] / shots) * id_dist[i])
-
-        bell_vd.append(vd)
+        bell_vd.append(metrics['tvd'])  # Variational distance
 
         if args.verbose:
             print(" ")
@@ -128,37 +150,18 @@ def main():
 
         count += 1
 
-    id_dist = [0 for i in range(32)]
-    id_dist[0] = 0.5
-    id_dist[31] = 0.5
-
-    q = [cirq.NamedQubit(f"QB{j + 1}") for j in range(5)]
-    circuit = cirq.Circuit()
-
-    circuit.append(cirq.H(q[2]))
-    for qb in [0, 1, 3, 4]:
-        circuit.append(cirq.CNOT(q[2], q[qb]))
+    circuit = ghz_circuit(args.qubits, device.metadata.nx_graph.edges)
 
-    circuit.append(cirq.measure(*q, key="M"))
-
-    decomposed_circuit = adonis.decompose_circuit(circuit)
+    decomposed_circuit = device.decompose_circuit(circuit)
 
     result = sampler.run(decomposed_circuit, repetitions=shots)
-    counts = result.histogram(key='M', fold_func=fold_func)
-
-    values = counts.values()
-    values_list = list(values)
+    counts = bitstring_counts(result.measurements['M'])
 
-    vd = 0
-    fid2 = 0
-    for i in range(len(counts)):
-        vd += np.abs(values_list[i] / shots - id_dist[i])
-        vd = 0.5 * vd
-        fid2 += np.sqrt((values_list[i] / shots) * id_dist[i])
+    metrics = distribution_metrics(counts, ghz_target(args.qubits))
 
     print(" ")
     print(offset + "================================ ")
-    print(offset + "    Preparing a GHZ-5 State")
+    print(offset + f"    Preparing a GHZ-{args.qubits} State")
     print(offset + "================================ ")
     print(" ")
 
@@ -167,8 +170,9 @@ def main():
         print(circuit)
         print(counts)
 
-    print(offset_2 + "GHZ-5 -> Fidelity = ", round(fid2, 3))
-    print(offset_2 + "GHZ-5 -> Distance from target ([0,1]) = ", round(vd, 3))
+    print(offset_2 + f"GHZ-{args.qubits} -> Fidelity = ", round(metrics['fidelity'], 3))
+    print(offset_2 + f"GHZ-{args.qubits} -> Distance from target ([0,1]) = ", round(metrics['tvd'], 3))
+    print(offset_2 + f"GHZ-{args.qubits} -> Hellinger distance = ", round(metrics['hellinger'], 3))
 
     print(" ")
     print(" ")
@@ -3,17 +3,15 @@ A more advanced example to flip qubits with either Helmi or the simulator.
 """
 import argparse
 import os
+import sys
 from argparse import RawTextHelpFormatter
 
-import numpy as np
 from iqm.cirq_iqm import IQMSampler
 
 import cirq
 
-
-def fold_func(x: np.ndarray) -> str:
-    """Fold the measured bit arrays into strings."""
-    return ''.join(map(lambda x: chr(x + ord('0')), x))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.histogram import bitstring_counts  # noqa: E402
 
 
 def get_args():
@@ -32,6 +30,10 @@ def get_args():
         "--shots", type=int, default=1000,
         help="Number of shots to run the circuit. Default is 1000.",
     )
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="Submit all flip circuits as a single job instead of one job per qubit.",
+    )
     parser.add_argument(
         "--verbose", "-v", action="store_true",
         help="Verbose output",
@@ -71,7 +73,7 @@ def flip_circuit(qubits: list[int]):
     return circuit
 
 
-def flip_qubits(qubits: list[int], backend: str, shots: int, verbose: bool):
+def flip_qubits(qubits: list[int], backend: str, shots: int, verbose: bool, batch: bool = False):
     """
     Function to run the flip circuit
     """
@@ -96,20 +98,27 @@ def flip_qubits(qubits: list[int], backend: str, shots: int, verbose: bool):
             circuit = single_flip_circuit(qb)
             circuits.append(circuit)
 
-    for i, circuit in enumerate(circuits):
+    if batch and isinstance(sampler, IQMSampler):
+        # One job for all qubits, results come back in the same order as the circuits
+        results = sampler.run_iqm_batch(circuits, repetitions=shots)
+    elif batch:
+        results = [result for [result] in sampler.run_batch(circuits, repetitions=shots)]
+    else:
+        results = (sampler.run(circuit, repetitions=shots) for circuit in circuits)
+
+    for i, (circuit, result) in enumerate(zip(circuits, results)):
         if verbose:
             print(f"Circuit {i+1}:\n")
             print(circuit)
 
-        result = sampler.run(circuit, repetitions=shots)
-
-        counts = result.histogram(key='M', fold_func=fold_func)
+        counts = bitstring_counts(result.measurements['M'])
 
         if qubits is None:
             success_probability = calculate_success_probability(
                 counts, shots, '11111',
             )
         else:
+            print(f"\nQB{qubits[i]}")
             success_probability = calculate_success_probability(
                 counts, shots, '1',
             )
@@ -120,10 +129,9 @@ def flip_qubits(qubits: list[int], backend: str, shots: int, verbose: bool):
 
 
 def main():
-
     args = get_args()
 
-    flip_qubits(args.qubits, args.backend, args.shots, args.verbose)
+    flip_qubits(args.qubits, args.backend, args.shots, args.verbose, args.batch)
 
 
 if __name__ == "__main__":
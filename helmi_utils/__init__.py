@@ -0,0 +1,6 @@
+"""
+Shared helpers for the Helmi examples.
+
+The examples add the repository root to ``sys.path`` so that these modules can be
+imported when running a script directly, e.g. ``python ghz.py --backend helmi``.
+"""
@@ -0,0 +1,322 @@
+"""
+Calibration data and figures of merit of Helmi.
+
+get_calibration_data queries the ``calibration/metrics`` endpoint of the IQM server through
+an IQMClient, see scripts/get_calibration_data.py for an example.
+
+CalibrationCache stores the responses locally as compressed JSON, one file per calibration
+set ID. A calibration set never changes once it has been published, so historical sets are
+cached forever. The latest calibration set is only fetched again once ``ttl`` seconds have
+passed, and then with a conditional request so that an unchanged set is not downloaded again.
+Scripts that check the calibration before every job then make one request per calibration
+cycle instead of one per run.
+
+CalibrationSession sends all requests through one pooled ``requests.Session`` so that the
+connection to the server is kept alive, and reuses the bearer token until it is about to
+expire. get_calibration_data_bulk and CalibrationCache.get_many fetch many historical
+calibration sets concurrently through it, e.g. months of history for drift analysis.
+"""
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from iqm.iqm_client import IQMClient  # Requires iqm_client==15.3
+from requests.adapters import HTTPAdapter
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "helmi_examples", "calibration")
+
+# Get a new bearer token when the current one expires in less than this many seconds
+TOKEN_REFRESH_MARGIN = 60
+
+
+def calibration_url(client: IQMClient, calibration_set_id: str = None) -> str:
+    """
+    Returns the URL of the latest or of a historical calibration set.
+    """
+    url = os.path.join(client._base_url, 'calibration/metrics/latest')
+    if calibration_set_id:
+        url = os.path.join(url, str(calibration_set_id))
+    return url
+
+
+def calibration_headers(client: IQMClient) -> dict:
+    """
+    Returns the headers for authenticating calibration data requests.
+    """
+    headers = {'User-Agent': client._signature}
+    bearer_token = client._get_bearer_token()
+    if bearer_token:
+        headers['Authorization'] = bearer_token
+    return headers
+
+
+def get_calibration_data(client: IQMClient, calibration_set_id=None, filename: str = None):
+    """
+    Return the calibration data and figures of merit using IQMClient.
+    Optionally you can input a calibration set id (UUID) to query historical results
+    Optionally save the response to a json file, if filename is provided
+    """
+    response = requests.get(calibration_url(client, calibration_set_id), headers=calibration_headers(client))
+    response.raise_for_status()  # will raise an HTTPError if the response was not ok
+
+    data = response.json()
+
+    if filename:
+        save_calibration_data(data, filename)
+
+    return data
+
+
+def save_calibration_data(data: dict, filename: str):
+    """
+    Saves calibration data to a json file.
+    """
+    with open(filename, 'w') as f:
+        f.write(json.dumps(data, indent=4))
+    print(f"Data saved to {filename}")
+
+
+def load_calibration_data(source: str, client: IQMClient = None) -> dict:
+    """
+    Returns calibration data from a json file saved with save_calibration_data,
+    or the latest calibration data through a CalibrationCache if source is 'latest'.
+    """
+    if source == 'latest':
+        if client is None:
+            raise ValueError("The latest calibration data can only be fetched from Helmi")
+        return CalibrationCache(client).latest()
+    with open(source) as f:
+        return json.load(f)
+
+
+def token_expiry(bearer_token: str) -> float:
+    """
+    Returns the expiry time of a JWT bearer token, or None if it does not have one.
+    """
+    try:
+        payload = bearer_token.split(' ')[-1].split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class CalibrationSession:
+    """
+    Pooled HTTP session for calibration data requests with up to max_workers connections.
+    """
+
+    def __init__(self, client: IQMClient, max_workers: int = 8):
+        self.client = client
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._headers = None
+        self._expiry = None
+        self._lock = threading.Lock()
+
+    def headers(self) -> dict:
+        """
+        Returns the request headers, only asking the client for a new bearer token
+        when the current one is about to expire.
+        """
+        with self._lock:
+            if self._headers is None or (
+                self._expiry is not None and self._expiry - time.time() < TOKEN_REFRESH_MARGIN
+            ):
+                self._headers = calibration_headers(self.client)
+                bearer_token = self._headers.get('Authorization')
+                self._expiry = token_expiry(bearer_token) if bearer_token else None
+            return dict(self._headers)
+
+    def request(self, calibration_set_id=None, etag: str = None) -> requests.Response:
+        """
+        Requests the latest or a historical calibration set.
+        """
+        headers = self.headers()
+        if etag:
+            headers['If-None-Match'] = etag
+        response = self.session.get(calibration_url(self.client, calibration_set_id), headers=headers)
+        response.raise_for_status()
+        return response
+
+    def get(self, calibration_set_id=None) -> dict:
+        """
+        Returns the calibration data of the latest or a historical calibration set.
+        """
+        return self.request(calibration_set_id).json()
+
+    def get_many(self, calibration_set_ids: list) -> dict:
+        """
+        Fetches many calibration sets concurrently and returns them keyed by calibration set ID.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            data = pool.map(self.get, calibration_set_ids)
+            return {str(calibration_set_id): d for calibration_set_id, d in zip(calibration_set_ids, data)}
+
+    def close(self):
+        self.session.close()
+
+
+def get_calibration_data_bulk(client: IQMClient, calibration_set_ids: list, max_workers: int = 8) -> dict:
+    """
+    Return the calibration data of many historical calibration sets, keyed by calibration set id.
+    The sets are fetched concurrently through one pooled session.
+    """
+    session = CalibrationSession(client, max_workers=max_workers)
+    try:
+        return session.get_many(calibration_set_ids)
+    finally:
+        session.close()
+
+
+def calibration_set_id_of(data: dict) -> str:
+    """
+    Returns the calibration set ID of a calibration data response, if it has one.
+    """
+    calibration_set_id = data.get('calibration_set_id')
+    return str(calibration_set_id) if calibration_set_id else None
+
+
+def calibration_timestamp(data: dict) -> float:
+    """
+    Returns the creation time of a calibration set as a POSIX timestamp, or NaN if unknown.
+    """
+    for key in ('calibration_set_created_timestamp', 'calibration_set_end_timestamp', 'timestamp'):
+        if data.get(key):
+            timestamp = str(data[key]).replace('Z', '+00:00')
+            return datetime.fromisoformat(timestamp).timestamp()
+    return float('nan')
+
+
+def calibration_metrics(data: dict):
+    """
+    Yields a (component, metric, value) tuple for every numeric figure of merit in a
+    calibration data response. Keys such as 'QB3.t1_time' or 'QB1__QB3.cz_gate_fidelity'
+    are split into the qubit or coupler and the metric name.
+    """
+    metrics = data.get('metrics', data)
+    for key, entry in metrics.items():
+        value = entry.get('value') if isinstance(entry, dict) else entry
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        component, _, metric = key.rpartition('.')
+        yield component, metric, value
+
+
+class CalibrationCache:
+    """
+    Local cache of calibration data keyed by calibration set ID.
+
+    Files are stored in cache_dir as ``<calibration set id>.json.gz``. The latest
+    calibration set is refreshed after ttl seconds.
+    """
+
+    def __init__(
+        self, client: IQMClient, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = 300, max_workers: int = 8,
+    ):
+        self.client = client
+        self.session = CalibrationSession(client, max_workers=max_workers)
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.requests = 0
+        self._memory = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}.json.gz")
+
+    def _read(self, name: str) -> dict:
+        if name in self._memory:
+            return self._memory[name]
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt') as f:
+            data = json.load(f)
+        self._memory[name] = data
+        return data
+
+    def _write(self, name: str, data: dict):
+        self._memory[name] = data
+        path = self._path(name)
+        with gzip.open(path + ".tmp", 'wt') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(path + ".tmp", path)
+
+    def get(self, calibration_set_id=None) -> dict:
+        """
+        Returns the calibration data of the given calibration set, or of the latest one,
+        only querying the server when the cached copy is missing or out of date.
+        """
+        if calibration_set_id:
+            data = self._read(str(calibration_set_id))
+            if data is None:
+                data = self._fetch(calibration_set_id)
+                self._write(str(calibration_set_id), data)
+            return data
+        return self.latest()
+
+    def get_many(self, calibration_set_ids: list) -> dict:
+        """
+        Returns the calibration data of many historical calibration sets keyed by calibration
+        set ID, fetching the ones that are not cached yet concurrently.
+        """
+        calibration_set_ids = [str(calibration_set_id) for calibration_set_id in calibration_set_ids]
+        data = {calibration_set_id: self._read(calibration_set_id) for calibration_set_id in calibration_set_ids}
+        missing = [calibration_set_id for calibration_set_id, d in data.items() if d is None]
+        if missing:
+            self.requests += len(missing)
+            for calibration_set_id, d in self.session.get_many(missing).items():
+                self._write(calibration_set_id, d)
+                data[calibration_set_id] = d
+        return data
+
+    def latest(self) -> dict:
+        """
+        Returns the latest calibration data, refreshing it once it is older than the TTL.
+        """
+        data = self._read("latest")
+        path = self._path("latest")
+        if data is not None and time.time() - os.path.getmtime(path) < self.ttl:
+            return data
+
+        etag_path = os.path.join(self.cache_dir, "latest.etag")
+        etag = None
+        if data is not None and os.path.exists(etag_path):
+            with open(etag_path) as f:
+                etag = f.read().strip()
+
+        response = self._request(None, etag)
+        if response.status_code == 304:
+            # Unchanged on the server, only restart the TTL
+            os.utime(path)
+            return data
+
+        data = response.json()
+        self._write("latest", data)
+        if response.headers.get('ETag'):
+            with open(etag_path, 'w') as f:
+                f.write(response.headers['ETag'])
+
+        calibration_set_id = calibration_set_id_of(data)
+        if calibration_set_id:
+            self._write(calibration_set_id, data)
+        return data
+
+    def _fetch(self, calibration_set_id) -> dict:
+        return self._request(calibration_set_id).json()
+
+    def _request(self, calibration_set_id, etag: str = None) -> requests.Response:
+        self.requests += 1
+        return self.session.request(calibration_set_id, etag)
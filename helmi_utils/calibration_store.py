@@ -0,0 +1,141 @@
+"""
+Columnar store of calibration history.
+
+Answering questions such as "T1 of QB3 over the last 90 days" from the saved JSON responses
+means parsing every file. CalibrationStore flattens the figures of merit of many calibration
+sets into NumPy columns in a directory:
+
+- ``timestamp.npy``: creation time of the calibration set (POSIX seconds)
+- ``value.npy``: value of the figure of merit
+- ``calibration_set.npy``: index into the list of calibration set IDs
+- ``index.json``: the calibration set IDs and the rows of every (metric, component) series
+
+The rows are sorted by metric, component and timestamp, so one series is a contiguous slice of
+the columns. A query memory-maps the columns, reads only that slice and finds the time range
+with a binary search.
+"""
+import json
+import os
+from collections.abc import Iterable
+
+import numpy as np
+
+from helmi_utils.calibration import calibration_metrics, calibration_set_id_of, calibration_timestamp
+
+COLUMNS = ("timestamp", "value", "calibration_set")
+DTYPES = {"timestamp": np.float64, "value": np.float64, "calibration_set": np.int32}
+
+
+class CalibrationStore:
+    """
+    Calibration history stored as NumPy columns in a directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {"calibration_sets": [], "series": {}}
+
+    def _series_key(self, metric: str, component: str) -> str:
+        return f"{metric}/{component}"
+
+    def _column(self, name: str, mmap_mode: str = "r") -> np.ndarray:
+        path = os.path.join(self.path, f"{name}.npy")
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=DTYPES[name])
+        return np.load(path, mmap_mode=mmap_mode)
+
+    def ingest(self, calibration_data: Iterable[dict]) -> int:
+        """
+        Adds calibration data responses to the store, skipping calibration sets that are
+        already stored. Returns the number of calibration sets added.
+        """
+        calibration_sets = self.index["calibration_sets"]
+        known = set(calibration_sets)
+        added = 0
+        rows = []
+        for data in calibration_data:
+            calibration_set_id = calibration_set_id_of(data)
+            if calibration_set_id is None or calibration_set_id in known:
+                continue
+            known.add(calibration_set_id)
+            calibration_sets.append(calibration_set_id)
+            added += 1
+            timestamp = calibration_timestamp(data)
+            code = len(calibration_sets) - 1
+            rows.extend(
+                (metric, component, timestamp, value, code)
+                for component, metric, value in calibration_metrics(data)
+            )
+        if not rows:
+            return added
+
+        # Merge the existing series with the new rows and rewrite the columns in sorted order
+        series = [
+            (*key.split("/", 1), start, stop) for key, (start, stop) in self.index["series"].items()
+        ]
+        columns = {name: np.array(self._column(name, mmap_mode=None)) for name in COLUMNS}
+        keys = [None] * len(columns["value"])
+        for metric, component, start, stop in series:
+            keys[start:stop] = [(metric, component)] * (stop - start)
+
+        keys.extend((metric, component) for metric, component, _, _, _ in rows)
+        columns["timestamp"] = np.concatenate([columns["timestamp"], [row[2] for row in rows]])
+        columns["value"] = np.concatenate([columns["value"], [row[3] for row in rows]])
+        columns["calibration_set"] = np.concatenate([columns["calibration_set"], [row[4] for row in rows]])
+
+        labels = sorted(set(keys))
+        codes = {label: i for i, label in enumerate(labels)}
+        key_codes = np.array([codes[key] for key in keys])
+        order = np.lexsort((columns["timestamp"], key_codes))
+
+        for name in COLUMNS:
+            np.save(os.path.join(self.path, f"{name}.npy"), columns[name][order].astype(DTYPES[name]))
+
+        sorted_codes = key_codes[order]
+        starts = np.searchsorted(sorted_codes, np.arange(len(labels)), side="left")
+        stops = np.searchsorted(sorted_codes, np.arange(len(labels)), side="right")
+        self.index["series"] = {
+            self._series_key(*label): [int(start), int(stop)]
+            for label, start, stop in zip(labels, starts, stops)
+        }
+        with open(os.path.join(self.path, "index.json"), "w") as f:
+            json.dump(self.index, f)
+        return added
+
+    def query(self, metric: str, component: str = "", start: float = None, end: float = None) -> dict:
+        """
+        Returns the timestamps, values and calibration set IDs of one figure of merit of one
+        qubit or coupler, e.g. query('t1_time', 'QB3', start=time.time() - 90 * 86400).
+        The timestamp of a calibration set without one is NaN, and it is only returned when
+        neither start nor end is given.
+        """
+        rows = self.index["series"].get(self._series_key(metric, component))
+        if rows is None:
+            raise KeyError(f"No calibration data for {metric} of {component}")
+        first, last = rows
+
+        timestamps = self._column("timestamp")[first:last]
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side="right"))
+        if start is not None or end is not None:
+            # Calibration sets without a timestamp (NaN) sort last and are in no time range
+            hi = min(hi, int(np.searchsorted(timestamps, np.inf, side="right")))
+
+        calibration_sets = self._column("calibration_set")[first + lo:first + hi]
+        return {
+            "timestamp": np.array(timestamps[lo:hi]),
+            "value": np.array(self._column("value")[first + lo:first + hi]),
+            "calibration_set_id": [self.index["calibration_sets"][code] for code in calibration_sets],
+        }
+
+    def series(self) -> list[tuple[str, str]]:
+        """
+        Returns the (metric, component) pairs that have been stored.
+        """
+        return [tuple(key.split("/", 1)) for key in self.index["series"]]
@@ -0,0 +1,81 @@
+"""
+Compile large batches of Cirq circuits on several processes.
+
+Decomposing, routing and simplifying circuits for an IQM device is CPU bound and independent
+for every circuit. compile_circuits spreads this work over a ProcessPoolExecutor and returns the
+compiled circuits in the same order as the input, ready for IQMSampler.run_iqm_batch.
+
+The number of worker processes defaults to the CPUs given to the SLURM job with
+``--cpus-per-task`` (the SLURM_CPUS_PER_TASK environment variable), falling back to the CPUs
+available to the process. With a single worker everything runs in the main process.
+
+Scripts using the pipeline must keep their code under ``if __name__ == "__main__":`` as the
+worker processes may import the main module. Forking a process that runs other threads can
+copy locks held by those threads, so outside the main thread, e.g. in
+helmi_utils/experiment_runner.py, the workers are started with forkserver or spawn instead.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from iqm.cirq_iqm.optimizers import simplify_circuit
+
+import cirq
+
+
+def default_workers() -> int:
+    """
+    Returns the number of CPUs allocated by SLURM, or else the CPUs available to this process.
+    Under SLURM this is --cpus-per-task, which scripts/batch_script.sh and scripts/int_job.sh set to 4.
+    """
+    slurm_cpus = os.getenv("SLURM_CPUS_PER_TASK")
+    if slurm_cpus:
+        return max(1, int(slurm_cpus))
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def parallel_map(function, items: list, max_workers: int = None) -> list:
+    """
+    Applies a picklable function to every item on a process pool, keeping the input order.
+    """
+    workers = min(max_workers or default_workers(), len(items))
+    if workers <= 1:
+        return [function(item) for item in items]
+    chunksize = max(1, len(items) // (4 * workers))
+    context = None
+    if threading.current_thread() is not threading.main_thread():
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return list(pool.map(function, items, chunksize=chunksize))
+
+
+def compile_circuit(device, circuit: cirq.Circuit, simplify: bool = True) -> cirq.Circuit:
+    """
+    Decomposes and routes a circuit for the device, optionally simplifying the result.
+    """
+    decomposed_circuit = device.decompose_circuit(circuit)
+    routed_circuit, _, _ = device.route_circuit(decomposed_circuit)
+    if simplify:
+        return simplify_circuit(routed_circuit)
+    return routed_circuit
+
+
+def compile_circuits(
+    device, circuits: list[cirq.Circuit], max_workers: int = None, simplify: bool = True,
+) -> list[cirq.Circuit]:
+    """
+    Compiles every circuit for the device on a pool of max_workers processes.
+    """
+    return parallel_map(partial(compile_circuit, device, simplify=simplify), circuits, max_workers)
+
+
+def simplify_circuits(circuits: list[cirq.Circuit], max_workers: int = None) -> list[cirq.Circuit]:
+    """
+    Simplifies every circuit on a pool of max_workers processes.
+    """
+    return parallel_map(simplify_circuit, circuits, max_workers)
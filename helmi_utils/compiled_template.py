@@ -0,0 +1,47 @@
+"""
+Compile a parameterized Cirq circuit once and resolve its parameters afterwards.
+
+Decomposing and routing a circuit for an IQM device is much more expensive than resolving
+its parameters. Sweeping a template by resolving the parameters first repeats the full
+compilation for every point of the sweep. CompiledTemplate decomposes and routes the symbolic
+template once, and each point of the sweep only substitutes the parameter values into the
+routed circuit. The resolved circuits are then simplified, which is linear in the number of
+gates, since simplifying the symbolic circuit is not exact for every parameter value.
+"""
+from iqm.cirq_iqm.optimizers import simplify_circuit
+
+import cirq
+from helmi_utils.compile_pipeline import simplify_circuits
+
+
+class CompiledTemplate:
+    """
+    A parameterized circuit that has been decomposed and routed for an IQM device.
+    """
+
+    def __init__(self, device, circuit_template: cirq.Circuit):
+        self.device = device
+        self.template = circuit_template
+        decomposed_circuit = device.decompose_circuit(circuit_template)
+        self.circuit, self.initial_mapping, self.final_mapping = device.route_circuit(decomposed_circuit)
+
+    def resolve(self, param_resolver: cirq.ParamResolverOrSimilarType, simplify: bool = True) -> cirq.Circuit:
+        """
+        Returns the routed circuit with the given parameter values substituted.
+        """
+        resolved_circuit = cirq.resolve_parameters(self.circuit, param_resolver)
+        if simplify:
+            return simplify_circuit(resolved_circuit)
+        return resolved_circuit
+
+    def resolve_sweep(
+        self, sweep: cirq.Sweepable, simplify: bool = True, max_workers: int = None,
+    ) -> list[cirq.Circuit]:
+        """
+        Returns one routed circuit for every point of the parameter sweep, in order.
+        The resolved circuits are simplified on max_workers processes, see compile_pipeline.
+        """
+        resolved_circuits = [self.resolve(resolver, simplify=False) for resolver in cirq.to_resolvers(sweep)]
+        if simplify:
+            return simplify_circuits(resolved_circuits, max_workers)
+        return resolved_circuits
@@ -0,0 +1,297 @@
+"""
+Run many example scripts in one warm Python process.
+
+Running every example with its own ``python -u script.py`` pays again for starting the
+interpreter, importing Qiskit or Cirq and creating a provider and backend, which fetches the
+quantum architecture from the server. ExperimentRunner runs the experiments of a manifest,
+each a script and its arguments, in threads of one process instead:
+
+- Qiskit, Cirq and matplotlib are imported once before the first experiment starts
+- IQMProvider, IQMSampler and noisy_simulator are replaced by versions that return the same
+  object to every experiment that asks for the same URL or calibration file, and a provider
+  returns the same backend for the same name
+- every backend.run of the shared backends goes through one submission queue, so the jobs of
+  experiments that run at the same time are submitted in turn and wait in the Helmi queue
+  together, while each experiment polls for its own results
+- the Qiskit transpiler is not thread safe, so transpile is replaced by a version that lets
+  one experiment transpile at a time
+
+Each script is executed as ``__main__`` with its arguments in place of sys.argv, which
+argparse reads through a context variable so that experiments in different threads do not
+see each other's arguments. What an experiment prints to standard output and error is
+collected and returned with its status and wall time. The blocking run of a Cirq sampler
+returns the results and not a job, so Cirq experiments share the sampler but do not go
+through the submission queue.
+
+The working directory is shared by all threads of the process, so every experiment runs in
+the working directory of the runner. Files a script writes to a relative path, such as
+``plt.savefig('test.png')``, end up there, and experiments that write the same file name
+overwrite each other's files.
+
+A manifest is a JSON list of experiments, e.g.
+``[{"script": "../qiskit/ghz.py", "args": "--backend helmi"}]``, where the script is relative
+to the manifest and the arguments are a string or a list. The name of an experiment defaults
+to its script.
+"""
+import argparse
+import builtins
+import contextvars
+import importlib
+import io
+import json
+import os
+import shlex
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Modules imported before the experiments start, when installed. Importing them from several
+# threads at once could see partially initialised modules.
+PRELOAD = ("qiskit", "qiskit_aer", "iqm.qiskit_iqm", "cirq", "iqm.cirq_iqm", "matplotlib.pyplot")
+
+_argv = contextvars.ContextVar("argv", default=None)
+_output = contextvars.ContextVar("output", default=None)
+
+
+def load_manifest(filename: str) -> list[dict]:
+    """
+    Returns the experiments of a manifest with absolute script paths and argument lists.
+    """
+    with open(filename, "r") as f:
+        manifest = json.load(f)
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    experiments = []
+    for entry in manifest:
+        if "script" not in entry:
+            raise ValueError(f"Experiment {entry} of {filename} has no script")
+        args = entry.get("args", [])
+        if isinstance(args, str):
+            args = shlex.split(args)
+        experiments.append({
+            "name": entry.get("name", entry["script"]),
+            "script": os.path.join(directory, entry["script"]),
+            "args": [str(arg) for arg in args],
+        })
+    return experiments
+
+
+class _ThreadOutput(io.TextIOBase):
+    """
+    Standard output or error that writes to the buffer of the current experiment, if any.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def _target(self):
+        return _output.get() or self.stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+
+def _key(args, kwargs) -> str:
+    """
+    Returns a key of call arguments, which may not be hashable.
+    """
+    return repr((args, sorted(kwargs.items())))
+
+
+def _shared_class(cls, share):
+    """
+    Returns a subclass of cls that returns one instance for the same constructor arguments.
+    share(instance) is called on every new instance.
+    """
+    instances = {}
+    lock = threading.Lock()
+
+    class Shared(cls):
+        def __new__(klass, *args, **kwargs):
+            key = _key(args, kwargs)
+            with lock:
+                if key not in instances:
+                    instance = super().__new__(klass)
+                    cls.__init__(instance, *args, **kwargs)
+                    share(instance)
+                    instances[key] = instance
+            return instances[key]
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+    Shared.__name__ = cls.__name__
+    Shared.__qualname__ = cls.__qualname__
+    return Shared
+
+
+def _shared_function(function, share=None):
+    """
+    Returns a version of function that returns one object for the same arguments.
+    """
+    objects = {}
+    lock = threading.Lock()
+
+    def shared(*args, **kwargs):
+        key = _key(args, kwargs)
+        with lock:
+            if key not in objects:
+                returned = function(*args, **kwargs)
+                objects[key] = share(returned) if share else returned
+        return objects[key]
+    return shared
+
+
+def _locked(function, lock):
+    """
+    Returns a version of function that holds lock while it runs.
+    """
+    def locked(*args, **kwargs):
+        with lock:
+            return function(*args, **kwargs)
+    return locked
+
+
+def _parse_known_args(parse_known_args):
+    """
+    Returns a version of ArgumentParser.parse_known_args that parses the arguments of the
+    current experiment by default.
+    """
+    def wrapper(self, args=None, namespace=None):
+        if args is None and _argv.get() is not None:
+            args = _argv.get()
+        return parse_known_args(self, args, namespace)
+    return wrapper
+
+
+class ExperimentRunner:
+    """
+    Runs experiments in max_parallel threads of this process.
+
+    The jobs of the shared backends are submitted by max_submitters threads, one job at a time
+    each, in the order the experiments submit them.
+    """
+
+    def __init__(self, max_parallel: int = 4, max_submitters: int = 1):
+        self.max_parallel = max_parallel
+        self.max_submitters = max_submitters
+        self._submitter = None
+
+    def _queued(self, backend):
+        """
+        Routes backend.run through the submission queue and returns the backend.
+        """
+        run = backend.run
+
+        def queued_run(*args, **kwargs):
+            # Submit in the context of the experiment, which tells a Tracer which calls are its own
+            return self._submitter.submit(contextvars.copy_context().run, run, *args, **kwargs).result()
+
+        backend.run = queued_run
+        return backend
+
+    def _share_backends(self, provider):
+        """
+        Makes provider.get_backend return one queued backend per name.
+        """
+        provider.get_backend = _shared_function(provider.get_backend, self._queued)
+
+    def _patches(self) -> list[tuple]:
+        """
+        Returns the (owner, attribute, replacement) of every function and class to replace.
+        """
+        patches = [(argparse.ArgumentParser, "parse_known_args",
+                    _parse_known_args(argparse.ArgumentParser.parse_known_args))]
+        # Scripts import transpile from qiskit, execute and TranspileCache from the modules they live in
+        compile_lock = threading.RLock()
+        for module in ("qiskit", "qiskit.compiler", "qiskit.execute_function", "helmi_utils.transpile_cache"):
+            try:
+                owner = importlib.import_module(module)
+            except ImportError:
+                continue
+            patches.append((owner, "transpile", _locked(owner.transpile, compile_lock)))
+        # Older scripts import the provider from qiskit_iqm instead of iqm.qiskit_iqm
+        for module in ("iqm.qiskit_iqm", "qiskit_iqm"):
+            try:
+                qiskit_iqm = importlib.import_module(module)
+            except ImportError:
+                continue
+            patches.append((qiskit_iqm, "IQMProvider", _shared_class(qiskit_iqm.IQMProvider, self._share_backends)))
+        try:
+            cirq_iqm = importlib.import_module("iqm.cirq_iqm")
+            patches.append((cirq_iqm, "IQMSampler", _shared_class(cirq_iqm.IQMSampler, lambda sampler: None)))
+        except ImportError:
+            pass
+        try:
+            noise_model = importlib.import_module("helmi_utils.noise_model")
+            simulator = _shared_function(noise_model.noisy_simulator, self._queued)
+            patches.append((noise_model, "noisy_simulator", simulator))
+        except ImportError:
+            pass
+        return patches
+
+    def run_one(self, experiment: dict) -> dict:
+        """
+        Runs one experiment in this thread and returns it with its status, wall time and output.
+        """
+        output = io.StringIO()
+        _argv.set(experiment["args"])
+        _output.set(output)
+        start = time.time()
+        status = "ok"
+        try:
+            with open(experiment["script"], "r") as f:
+                code = compile(f.read(), experiment["script"], "exec")
+            exec(code, {"__name__": "__main__", "__file__": experiment["script"], "__builtins__": builtins})
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                status = "failed"
+                output.write(f"Exited with {e.code}\n")
+        except Exception:
+            status = "failed"
+            output.write(traceback.format_exc())
+        return {**experiment, "status": status, "seconds": time.time() - start, "output": output.getvalue()}
+
+    def run(self, experiments: list[dict], callback=None) -> list[dict]:
+        """
+        Runs the experiments and returns their results in the order of the experiments.
+        callback(index, result) is called in the order the experiments finish.
+        """
+        os.environ.setdefault("MPLBACKEND", "Agg")
+        for module in PRELOAD:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                pass
+
+        patches = self._patches()
+        originals = [(owner, name, getattr(owner, name)) for owner, name, _ in patches]
+        stdout, stderr = sys.stdout, sys.stderr
+        results = [None] * len(experiments)
+        try:
+            for owner, name, replacement in patches:
+                setattr(owner, name, replacement)
+            sys.stdout, sys.stderr = _ThreadOutput(stdout), _ThreadOutput(stderr)
+            with ThreadPoolExecutor(self.max_submitters) as submitter, \
+                    ThreadPoolExecutor(self.max_parallel) as pool:
+                self._submitter = submitter
+                futures = {
+                    pool.submit(contextvars.copy_context().run, self.run_one, experiment): index
+                    for index, experiment in enumerate(experiments)
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    results[index] = future.result()
+                    if callback is not None:
+                        callback(index, results[index])
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            for owner, name, original in originals:
+                setattr(owner, name, original)
+            self._submitter = None
+        return results
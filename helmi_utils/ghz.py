@@ -0,0 +1,103 @@
+"""
+Topology-aware preparation of GHZ states with any number of qubits.
+
+The GHZ state is grown from a root qubit with a Hadamard gate followed by layers of CNOTs.
+In each layer every qubit that is already entangled copies its state to one new neighbour,
+so the number of entangled qubits can double per layer. This gives a CNOT tree of
+logarithmic depth on well connected devices, and never needs SWAPs since every CNOT acts
+on a coupled pair. Every qubit is tried as the root and the shallowest tree is kept.
+
+With a LayoutSelector from helmi_utils.layout_selector, trees of equal depth are compared by
+the calibrated readout and CZ fidelities of the qubits and couplers they use, so the GHZ state
+avoids the worst qubits of the day when it does not span the whole device.
+
+The ideal distribution only has two outcomes, so the target returned by ghz_target is
+sparse and the metrics in helmi_utils.metrics stay proportional to the observed outcomes.
+"""
+from collections.abc import Hashable, Iterable
+
+from helmi_utils.topology import adjacency
+
+
+def _fan_out(root: Hashable, neighbours: dict, num_qubits: int, selector=None) -> list[list[tuple]]:
+    """
+    Returns the CNOT layers that entangle num_qubits qubits starting from root,
+    or None if the qubits connected to root are not enough.
+    """
+    entangled = [root]
+    used = {root}
+    layers = []
+    while len(entangled) < num_qubits:
+        layer = []
+        for control in entangled:
+            if len(entangled) + len(layer) == num_qubits:
+                break
+            free = [qubit for qubit in neighbours[control] if qubit not in used]
+            if not free:
+                continue
+            # Prefer targets that can fan out further in the next layers, then the best calibrated ones
+            target = min(
+                free, key=lambda qubit: (
+                    -len(neighbours[qubit] - used), -_score(selector, control, qubit), str(qubit),
+                ),
+            )
+            used.add(target)
+            layer.append((control, target))
+        if not layer:
+            return None
+        entangled.extend(target for _, target in layer)
+        layers.append(layer)
+    return layers
+
+
+def _score(selector, control: Hashable, target: Hashable) -> float:
+    """
+    Returns the calibration score of adding target with a CNOT from control, 0 without a selector.
+    """
+    if selector is None:
+        return 0.0
+    return selector.edge_score(control, target) + selector.qubit_score(target)
+
+
+def ghz_schedule(
+    num_qubits: int, coupling_map: Iterable[tuple[Hashable, Hashable]], selector=None,
+) -> tuple[list, list]:
+    """
+    Returns the physical qubits of a minimum depth GHZ state and its CNOT layers.
+
+    The first returned qubit is the root which gets the Hadamard gate. Each layer is a list
+    of (control, target) pairs of coupled qubits that can be applied in parallel.
+    Trees of equal depth are ranked with the optional LayoutSelector.
+    """
+    neighbours = adjacency(coupling_map)
+    if num_qubits == 1 and neighbours:
+        if selector is None:
+            return [min(neighbours, key=str)], []
+        return [max(neighbours, key=lambda qubit: (selector.qubit_score(qubit), str(qubit)))], []
+
+    best = None
+    # Ties are broken in favour of the best connected root, e.g. QB3 on Helmi
+    for root in sorted(neighbours, key=lambda qubit: (-len(neighbours[qubit]), str(qubit))):
+        layers = _fan_out(root, neighbours, num_qubits, selector)
+        if layers is None:
+            continue
+        score = sum(_score(selector, control, target) for layer in layers for control, target in layer)
+        if selector is not None:
+            score += selector.qubit_score(root)
+        if best is None or (len(layers), -score) < (len(best[1]), -best[2]):
+            best = (root, layers, score)
+
+    if best is None:
+        raise ValueError(
+            f"The coupling map does not contain {num_qubits} connected qubits",
+        )
+    root, layers, _ = best
+    qubits = [root] + [target for layer in layers for _, target in layer]
+    return qubits, layers
+
+
+def ghz_target(num_qubits: int) -> dict[str, float]:
+    """
+    Returns the ideal GHZ distribution, only storing its two non-zero outcomes.
+    """
+    return {'0' * num_qubits: 0.5, '1' * num_qubits: 0.5}
@@ -0,0 +1,55 @@
+"""
+Fast histograms of measurement results.
+
+Folding every shot into a string with a Python function, as ``result.histogram(fold_func=...)``
+does, dominates the post-processing time for large numbers of shots. Here each row of the raw
+measurement array is packed into an integer with NumPy, the integers are counted and only the
+observed outcomes are formatted as bitstrings.
+"""
+from collections import Counter
+
+import numpy as np
+
+# Largest register for which every possible outcome gets its own bin in np.bincount
+MAX_BINCOUNT_QUBITS = 20
+
+
+def measurements_to_ints(measurements: np.ndarray) -> np.ndarray:
+    """
+    Packs each row of a (shots, qubits) array of measured bits into an integer.
+    The first column is the most significant bit, matching the folded bitstrings.
+    """
+    bits = np.asarray(measurements, dtype=np.uint64)
+    num_qubits = bits.shape[1]
+    if num_qubits > 64:
+        raise ValueError(f"Cannot pack {num_qubits} qubits into a 64 bit integer")
+    weights = np.left_shift(np.uint64(1), np.arange(num_qubits - 1, -1, -1, dtype=np.uint64))
+    return bits @ weights
+
+
+def bitstring_counts(measurements: np.ndarray) -> Counter:
+    """
+    Returns a Counter of bitstrings, e.g. {'00': 501, '11': 499}, from a (shots, qubits)
+    array of measured bits such as ``result.measurements['M']``.
+    Gives the same counts as ``result.histogram(key='M', fold_func=fold_func)``.
+    """
+    measurements = np.asarray(measurements)
+    num_qubits = measurements.shape[1]
+
+    if num_qubits > 64:
+        outcomes, counts = np.unique(measurements, axis=0, return_counts=True)
+        return Counter({
+            ''.join(map(str, row)): int(count) for row, count in zip(outcomes, counts)
+        })
+
+    values = measurements_to_ints(measurements)
+    if num_qubits <= MAX_BINCOUNT_QUBITS:
+        bins = np.bincount(values.astype(np.int64), minlength=1)
+        outcomes = np.flatnonzero(bins)
+        counts = bins[outcomes]
+    else:
+        outcomes, counts = np.unique(values, return_counts=True)
+
+    return Counter({
+        format(int(outcome), f'0{num_qubits}b'): int(count) for outcome, count in zip(outcomes, counts)
+    })
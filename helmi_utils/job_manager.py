@@ -0,0 +1,82 @@
+"""
+Submit many jobs at once and process their results as they finish.
+
+Calling job.result() right after every submission makes the wall time of an experiment the
+sum of the latencies of its jobs. JobManager submits all jobs without waiting, polls their
+status with exponential backoff and passes each result to a callback as soon as its job
+finishes, while the other jobs are still queued. The wall time then becomes roughly that of
+the slowest job.
+
+Each submission is a function without arguments that submits a job, for example
+``functools.partial(backend.run, circuit, shots=1000)``. Returned objects with an
+``in_final_state()`` method, such as Qiskit jobs, are polled until they are done. Anything
+else, such as the results of a blocking ``sampler.run`` call in Cirq, is treated as the
+finished result.
+The blocking client calls run in threads and at most max_concurrency of them run at a time.
+"""
+import asyncio
+import inspect
+import time
+
+
+class JobManager:
+    """
+    Submits jobs concurrently and streams their results to a callback.
+
+    The callback is called as callback(index, result) in the order the jobs finish, where
+    index is the position of the submission. It may be a coroutine function.
+    """
+
+    def __init__(
+        self, max_concurrency: int = 8, poll_interval: float = 1.0,
+        max_poll_interval: float = 30.0, backoff: float = 2.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.job_ids = {}
+        self.wall_times = {}
+
+    async def _call(self, semaphore: asyncio.Semaphore, function):
+        async with semaphore:
+            return await asyncio.to_thread(function)
+
+    async def _run_one(self, index: int, submit, callback, semaphore: asyncio.Semaphore, start: float):
+        job = await self._call(semaphore, submit)
+
+        if hasattr(job, "in_final_state"):
+            if hasattr(job, "job_id"):
+                self.job_ids[index] = job.job_id()
+            delay = self.poll_interval
+            while not await self._call(semaphore, job.in_final_state):
+                await asyncio.sleep(delay)
+                delay = min(delay * self.backoff, self.max_poll_interval)
+            result = await self._call(semaphore, job.result)
+        else:
+            result = job
+
+        self.wall_times[index] = time.time() - start
+
+        if callback is not None:
+            returned = callback(index, result)
+            if inspect.isawaitable(returned):
+                await returned
+        return result
+
+    async def run_async(self, submissions: list, callback=None) -> list:
+        """
+        Submits every job and returns their results in the order of the submissions.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        start = time.time()
+        return await asyncio.gather(*(
+            self._run_one(index, submit, callback, semaphore, start)
+            for index, submit in enumerate(submissions)
+        ))
+
+    def run(self, submissions: list, callback=None) -> list:
+        """
+        Blocking version of run_async for use in scripts.
+        """
+        return asyncio.run(self.run_async(submissions, callback))
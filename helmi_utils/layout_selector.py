@@ -0,0 +1,163 @@
+"""
+Choose qubits and couplers from the current calibration data.
+
+LayoutSelector indexes the readout fidelity of every qubit and the CZ fidelity of every coupler
+from a get_calibration_data response. A layout is scored with the sum of the log fidelities of
+the couplers it uses and of the qubits it measures, i.e. the log of the probability that no
+readout or CZ error happens. Pairs are ranked once when the selector is created and layouts for
+a circuit are memoised, so repeated lookups only cost a dictionary access.
+
+The names of the figures of merit can be changed with the readout_metric and cz_metric
+arguments. Qubits or couplers without a value get the mean of the known values.
+"""
+import math
+import re
+from itertools import combinations
+
+from helmi_utils.calibration import calibration_metrics
+from helmi_utils.topology import HELMI_COUPLING_MAP, adjacency
+
+READOUT_FIDELITY = "single_shot_readout_fidelity"
+CZ_FIDELITY = "cz_gate_fidelity"
+
+
+def qubit_index(name: str) -> int:
+    """
+    Returns the index of a qubit name, e.g. 'QB3' -> 2.
+    """
+    return int(re.fullmatch(r"QB(\d+)", name).group(1)) - 1
+
+
+def _log(fidelity: float) -> float:
+    return math.log(min(max(fidelity, 1e-12), 1.0))
+
+
+class LayoutSelector:
+    """
+    Index of qubit and coupler quality for choosing initial layouts.
+    """
+
+    def __init__(
+        self, calibration_data: dict, coupling_map=HELMI_COUPLING_MAP,
+        readout_metric: str = READOUT_FIDELITY, cz_metric: str = CZ_FIDELITY,
+    ):
+        readout = {}
+        cz = {}
+        for component, metric, value in calibration_metrics(calibration_data):
+            if metric == readout_metric and re.fullmatch(r"QB\d+", component):
+                readout[qubit_index(component)] = value
+            elif metric == cz_metric and "__" in component:
+                qubit_a, qubit_b = (qubit_index(name) for name in component.split("__"))
+                cz[frozenset((qubit_a, qubit_b))] = value
+
+        self.neighbours = adjacency(coupling_map)
+        self.qubits = sorted(self.neighbours)
+        edges = {frozenset(edge) for edge in coupling_map}
+
+        mean_readout = sum(readout.values()) / len(readout) if readout else 1.0
+        mean_cz = sum(cz.values()) / len(cz) if cz else 1.0
+        self.readout_fidelity = {qubit: readout.get(qubit, mean_readout) for qubit in self.qubits}
+        self.cz_fidelity = {edge: cz.get(edge, mean_cz) for edge in edges}
+
+        self._qubit_scores = {qubit: _log(fidelity) for qubit, fidelity in self.readout_fidelity.items()}
+        self._edge_scores = {edge: _log(fidelity) for edge, fidelity in self.cz_fidelity.items()}
+        self._ranked_pairs = sorted(
+            (tuple(sorted(edge)) for edge in edges),
+            key=lambda pair: (-self.pair_score(*pair), pair),
+        )
+        self._layouts = {}
+
+    def qubit_score(self, qubit: int) -> float:
+        """
+        Returns the log readout fidelity of a qubit.
+        """
+        return self._qubit_scores.get(qubit, -math.inf)
+
+    def edge_score(self, qubit_a: int, qubit_b: int) -> float:
+        """
+        Returns the log CZ fidelity of a coupler, or -inf if the qubits are not coupled.
+        """
+        return self._edge_scores.get(frozenset((qubit_a, qubit_b)), -math.inf)
+
+    def pair_score(self, qubit_a: int, qubit_b: int) -> float:
+        """
+        Returns the score of measuring both qubits after a CZ between them.
+        """
+        return self.edge_score(qubit_a, qubit_b) + self.qubit_score(qubit_a) + self.qubit_score(qubit_b)
+
+    def ranked_pairs(self) -> list[tuple[int, int]]:
+        """
+        Returns the coupled qubit pairs from best to worst.
+        """
+        return list(self._ranked_pairs)
+
+    def best_pair(self) -> tuple[int, int]:
+        """
+        Returns the best coupled qubit pair.
+        """
+        return self._ranked_pairs[0]
+
+    def best_layout(self, num_qubits: int, interactions=()) -> list[int]:
+        """
+        Returns the physical qubit for each of num_qubits virtual qubits such that every
+        interacting pair of virtual qubits is coupled, maximising the layout score.
+        Interactions are pairs of virtual qubit indices, with one entry per two-qubit gate.
+        """
+        interactions = tuple(sorted(tuple(sorted(pair)) for pair in interactions))
+        key = (num_qubits, interactions)
+        if key not in self._layouts:
+            self._layouts[key] = self._search(num_qubits, interactions)
+        return list(self._layouts[key])
+
+    def _search(self, num_qubits: int, interactions: tuple) -> list[int]:
+        partners = {virtual: [] for virtual in range(num_qubits)}
+        for virtual_a, virtual_b in interactions:
+            partners[virtual_a].append(virtual_b)
+            partners[virtual_b].append(virtual_a)
+        # Place the most connected virtual qubits first to prune early
+        order = sorted(range(num_qubits), key=lambda virtual: -len(partners[virtual]))
+
+        best = (-math.inf, None)
+        layout = {}
+
+        def place(position: int, score: float):
+            nonlocal best
+            if score <= best[0]:
+                return
+            if position == num_qubits:
+                best = (score, [layout[virtual] for virtual in range(num_qubits)])
+                return
+            virtual = order[position]
+            used = set(layout.values())
+            for physical in self.qubits:
+                if physical in used:
+                    continue
+                gain = self.qubit_score(physical)
+                for partner in partners[virtual]:
+                    if partner in layout:
+                        gain += self.edge_score(physical, layout[partner])
+                if gain == -math.inf:
+                    continue
+                layout[virtual] = physical
+                place(position + 1, score + gain)
+                del layout[virtual]
+
+        place(0, 0.0)
+        if best[1] is None:
+            raise ValueError(f"No layout of {num_qubits} qubits fits the coupling map")
+        return best[1]
+
+    def best_qubits(self, num_qubits: int) -> list[int]:
+        """
+        Returns the num_qubits qubits with the best readout fidelity.
+        """
+        return sorted(self.qubits, key=lambda qubit: (-self.qubit_score(qubit), qubit))[:num_qubits]
+
+    def worst_pairs(self, threshold: float) -> list[tuple[int, int]]:
+        """
+        Returns the coupled pairs whose CZ fidelity is below the threshold.
+        """
+        return [
+            pair for pair in combinations(self.qubits, 2)
+            if frozenset(pair) in self.cz_fidelity and self.cz_fidelity[frozenset(pair)] < threshold
+        ]
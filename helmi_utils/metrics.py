@@ -0,0 +1,118 @@
+"""
+Distances between measured counts and a target distribution.
+
+Counts and targets are dictionaries of bitstrings, e.g. {'00000': 0.5, '11111': 0.5}.
+They are converted to sparse probability vectors indexed by the integer value of each
+bitstring, so outcomes are compared by bitstring and not by dictionary order, and only
+the observed outcomes are stored. This keeps GHZ targets of 20+ qubits cheap, as the
+2^n possible outcomes are never allocated.
+
+- Fidelity is the classical fidelity (Bhattacharyya coefficient) sum_x sqrt(p(x) q(x)).
+    A value of 1 is attained if and only if the two distributions are identical.
+- Total variation distance is 0.5 * sum_x |p(x) - q(x)|, the classical counterpart of the trace distance.
+- Hellinger distance is sqrt(1 - fidelity).
+
+mode_confidence tells how sure one can be that the most frequent bitstring of a finite number
+of shots is also the most likely outcome, for stopping an experiment once its answer is known.
+"""
+import numpy as np
+from scipy import stats
+
+
+def sparse_distribution(counts: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the sorted integer outcomes and their normalised probabilities from a
+    counts or probability dictionary keyed by bitstrings.
+    Spaces between classical registers in Qiskit bitstrings are ignored.
+    """
+    outcomes = np.fromiter(
+        (int(key.replace(' ', ''), 2) for key in counts), dtype=np.uint64, count=len(counts),
+    )
+    values = np.fromiter(counts.values(), dtype=float, count=len(counts))
+    order = np.argsort(outcomes)
+    return outcomes[order], values[order] / values.sum()
+
+
+def probability_vector(counts: dict, num_qubits: int) -> np.ndarray:
+    """
+    Returns a dense probability vector of length 2^num_qubits indexed by the integer value
+    of each bitstring. Only use this for small registers.
+    """
+    outcomes, probabilities = sparse_distribution(counts)
+    vector = np.zeros(2**num_qubits)
+    vector[outcomes.astype(np.int64)] = probabilities
+    return vector
+
+
+def _aligned(counts: dict, target: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the two distributions as dense vectors over the union of their outcomes.
+    """
+    p_outcomes, p = sparse_distribution(counts)
+    q_outcomes, q = sparse_distribution(target)
+    support = np.union1d(p_outcomes, q_outcomes)
+    p_aligned = np.zeros(len(support))
+    q_aligned = np.zeros(len(support))
+    p_aligned[np.searchsorted(support, p_outcomes)] = p
+    q_aligned[np.searchsorted(support, q_outcomes)] = q
+    return p_aligned, q_aligned
+
+
+def distribution_metrics(counts: dict, target: dict) -> dict[str, float]:
+    """
+    Returns the fidelity, total variation distance and Hellinger distance between the measured
+    counts and the target distribution, computed in one pass over their outcomes.
+    """
+    p, q = _aligned(counts, target)
+    fidelity = float(np.sum(np.sqrt(p * q)))
+    return {
+        'fidelity': fidelity,
+        'tvd': float(0.5 * np.sum(np.abs(p - q))),
+        'hellinger': float(np.sqrt(max(0.0, 1.0 - fidelity))),
+    }
+
+
+def classical_fidelity(counts: dict, target: dict) -> float:
+    """
+    Returns the classical fidelity between the measured counts and the target distribution.
+    """
+    return distribution_metrics(counts, target)['fidelity']
+
+
+def total_variation_distance(counts: dict, target: dict) -> float:
+    """
+    Returns the total variation distance between the measured counts and the target distribution.
+    """
+    return distribution_metrics(counts, target)['tvd']
+
+
+def hellinger_distance(counts: dict, target: dict) -> float:
+    """
+    Returns the Hellinger distance between the measured counts and the target distribution.
+    """
+    return distribution_metrics(counts, target)['hellinger']
+
+
+def mode_confidence(
+    counts: dict, num_outcomes: int, samples: int = 4000, prior: float = 0.5, seed: int = None,
+) -> tuple[str, float]:
+    """
+    Returns the most frequent bitstring and the posterior probability that it is the most
+    likely of num_outcomes outcomes.
+
+    The outcome probabilities have a Dirichlet posterior with a Jeffreys prior, sampled as
+    independent gamma variables since only their order matters. Outcomes that have not been
+    seen share a prior, so only the largest of them is sampled and 2^n outcomes stay cheap.
+    """
+    rng = np.random.default_rng(seed)
+    keys = list(counts)
+    values = np.fromiter(counts.values(), dtype=float, count=len(counts))
+    mode = int(np.argmax(values))
+
+    draws = rng.gamma(values + prior, size=(samples, len(values)))
+    others = np.delete(draws, mode, axis=1).max(axis=1, initial=0.0)
+    unseen = num_outcomes - len(values)
+    if unseen > 0:
+        # Inverse CDF of the maximum of unseen independent Gamma(prior) variables
+        others = np.maximum(others, stats.gamma.ppf(rng.random(samples) ** (1 / unseen), prior))
+    return keys[mode].replace(' ', ''), float(np.mean(draws[:, mode] > others))
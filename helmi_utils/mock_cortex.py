@@ -0,0 +1,291 @@
+"""
+Local stand-in for the Cortex server of Helmi.
+
+MockCortex implements the parts of the IQM server API that IQMClient, and therefore
+IQMProvider and IQMSampler, use:
+
+- ``GET /quantum-architecture``: the Adonis architecture of Helmi
+- ``POST /jobs``: submit a batch of circuits
+- ``GET /jobs/<id>/status`` and ``GET /jobs/<id>``: poll a job and download its results
+- ``POST /jobs/<id>/abort``: abort a queued job
+- ``GET /calibration/metrics/latest[/<calibration set id>]``: calibration data, with ETags
+
+Submitted jobs stay in ``pending compilation`` for queue_delay seconds and then run one at a
+time, as on the real device, on Aer. With a calibration data file the circuits are simulated
+with the noise model of helmi_utils.noise_model and the file is served as the latest
+calibration. The example scripts then run unchanged with HELMI_CORTEX_URL pointing to the
+server, which makes it possible to measure the client-side overhead of submitting, polling
+and parsing results without network access or queue time.
+
+See scripts/mock_cortex_server.py for running the server from the command line.
+"""
+import hashlib
+import json
+import queue
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from qiskit_aer import AerSimulator
+
+from helmi_utils.calibration import calibration_set_id_of
+from helmi_utils.layout_selector import qubit_index
+from helmi_utils.noise_model import noise_model_from_calibration
+from helmi_utils.topology import HELMI_ARCHITECTURE
+from qiskit import QuantumCircuit
+from qiskit.circuit.library import RGate
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def iqm_to_qiskit(circuit: dict, qubit_mapping: dict, num_qubits: int) -> tuple[QuantumCircuit, list]:
+    """
+    Returns a Qiskit circuit on the physical qubits of an IQM circuit, and the measurement key
+    and classical bits of each of its measurements.
+    """
+    num_clbits = sum(
+        len(instruction["qubits"]) for instruction in circuit["instructions"]
+        if instruction["name"] in ("measure", "measurement")
+    )
+    qc = QuantumCircuit(num_qubits, num_clbits)
+    measurements = []
+    clbit = 0
+    for instruction in circuit["instructions"]:
+        qubits = [qubit_index(qubit_mapping.get(name, name)) for name in instruction["qubits"]]
+        args = instruction.get("args", {})
+        if instruction["name"] in ("prx", "phased_rx"):
+            qc.append(RGate(2 * np.pi * args["angle_t"], 2 * np.pi * args["phase_t"]), qubits)
+        elif instruction["name"] == "cz":
+            qc.cz(*qubits)
+        elif instruction["name"] in ("measure", "measurement"):
+            clbits = list(range(clbit, clbit + len(qubits)))
+            qc.measure(qubits, clbits)
+            measurements.append((args["key"], clbits))
+            clbit += len(qubits)
+        elif instruction["name"] == "barrier":
+            qc.barrier(qubits)
+        else:
+            raise ValueError(f"Unsupported instruction {instruction['name']}")
+    return qc, measurements
+
+
+class MockCortex:
+    """
+    IQM server API served locally on an Aer simulator.
+
+    queue_delay is the time in seconds a job waits before it runs and execution_delay an
+    extra time spent running it. If port is 0 a free port is chosen.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, queue_delay: float = 0.0,
+        execution_delay: float = 0.0, calibration_file: str = None, seed: int = None,
+    ):
+        self.queue_delay = queue_delay
+        self.execution_delay = execution_delay
+        self.seed = seed
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+        noise_model = None
+        if calibration_file:
+            with open(calibration_file) as f:
+                self.calibration_data = json.load(f)
+            noise_model = noise_model_from_calibration(self.calibration_data)
+        else:
+            self.calibration_data = {"calibration_set_id": str(uuid.uuid4()), "metrics": {}}
+        self.calibration_set_id = calibration_set_id_of(self.calibration_data) or str(uuid.uuid4())
+        try:
+            uuid.UUID(self.calibration_set_id)
+        except ValueError:
+            # IQMClient only accepts UUIDs as calibration set IDs
+            self.calibration_set_id = str(uuid.uuid5(uuid.NAMESPACE_URL, self.calibration_set_id))
+        self._calibration_body = json.dumps(self.calibration_data).encode()
+        self._calibration_etag = '"' + hashlib.sha256(self._calibration_body).hexdigest() + '"'
+        self.simulator = AerSimulator(noise_model=noise_model)
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._threads = []
+
+    @property
+    def url(self) -> str:
+        """
+        Returns the URL to use as HELMI_CORTEX_URL.
+        """
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Starts serving requests and running jobs in background threads.
+        """
+        self._threads = [
+            threading.Thread(target=self.server.serve_forever, daemon=True),
+            threading.Thread(target=self._run_jobs, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        self._queue.put(None)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def submit(self, request: dict) -> str:
+        """
+        Queues a run request and returns its job ID.
+        """
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self.jobs[job_id] = {
+                "status": "pending compilation",
+                "request": request,
+                "submitted": time.time(),
+                "timestamps": {"job_start": _now()},
+            }
+        self._queue.put(job_id)
+        return job_id
+
+    def _run_jobs(self):
+        # Jobs run one at a time in submission order, like on a single QPU
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            job = self.jobs[job_id]
+            wait = job["submitted"] + self.queue_delay - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            if job["status"] == "aborted":
+                continue
+            job["status"] = "pending execution"
+            job["timestamps"]["execution_start"] = _now()
+            try:
+                measurements = self.execute(job["request"])
+                time.sleep(self.execution_delay)
+                job["measurements"] = measurements
+                job["status"] = "ready"
+            except Exception as error:
+                job["message"] = str(error)
+                job["status"] = "failed"
+            job["timestamps"]["execution_end"] = _now()
+
+    def execute(self, request: dict) -> list[dict]:
+        """
+        Runs the circuits of a run request and returns their measurement results.
+        """
+        qubit_mapping = {
+            mapping["logical_name"]: mapping["physical_name"] for mapping in request.get("qubit_mapping") or []
+        }
+        shots = request["shots"]
+        num_qubits = len(HELMI_ARCHITECTURE["qubits"])
+        circuits = [iqm_to_qiskit(circuit, qubit_mapping, num_qubits) for circuit in request["circuits"]]
+
+        result = self.simulator.run(
+            [qc for qc, _ in circuits], shots=shots, memory=True, seed_simulator=self.seed,
+        ).result()
+
+        measurements = []
+        for i, (_, keys) in enumerate(circuits):
+            # Qiskit memory strings have the first classical bit last
+            memory = result.get_memory(i)
+            bits = np.array([list(shot.replace(" ", "")[::-1]) for shot in memory], dtype=np.uint8)
+            measurements.append({key: bits[:, clbits].tolist() for key, clbits in keys})
+        return measurements
+
+    def run_result(self, job_id: str) -> dict:
+        """
+        Returns the RunResult of a job as sent by the IQM server.
+        """
+        job = self.jobs[job_id]
+        result = {
+            "status": job["status"],
+            "metadata": {
+                "calibration_set_id": self.calibration_set_id,
+                "request": job["request"],
+                "timestamps": dict(job["timestamps"]),
+            },
+        }
+        if job["status"] == "ready":
+            result["measurements"] = job["measurements"]
+        if "message" in job:
+            result["message"] = job["message"]
+        return result
+
+    def _handler(self):
+        cortex = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive between requests like the real server
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body=None, headers: dict = None):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                path = self.path.rstrip("/")
+                if path == "/quantum-architecture":
+                    return self._send(200, {"quantum_architecture": HELMI_ARCHITECTURE})
+
+                match = re.fullmatch(r"/calibration/metrics/latest(?:/([\w-]+))?", path)
+                if match:
+                    if match.group(1) not in (None, cortex.calibration_set_id):
+                        return self._send(404, {"detail": "Calibration set not found"})
+                    headers = {"ETag": cortex._calibration_etag}
+                    if self.headers.get("If-None-Match") == cortex._calibration_etag:
+                        return self._send(304, headers=headers)
+                    return self._send(200, cortex._calibration_body, headers)
+
+                match = re.fullmatch(r"/jobs/([\w-]+)(/status)?", path)
+                if match and match.group(1) in cortex.jobs:
+                    result = cortex.run_result(match.group(1))
+                    if match.group(2):
+                        result = {key: result[key] for key in ("status", "message") if key in result}
+                    return self._send(200, result)
+                return self._send(404, {"detail": "Not found"})
+
+            def do_POST(self):
+                path = self.path.rstrip("/")
+                if path == "/jobs":
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length))
+                    return self._send(202, {"id": cortex.submit(request)})
+
+                match = re.fullmatch(r"/jobs/([\w-]+)/abort", path)
+                if match and match.group(1) in cortex.jobs:
+                    job = cortex.jobs[match.group(1)]
+                    if job["status"] in ("ready", "failed"):
+                        return self._send(400, {"detail": f"Job is {job['status']}"})
+                    job["status"] = "aborted"
+                    return self._send(200, {})
+                return self._send(404, {"detail": "Not found"})
+
+        return Handler
@@ -0,0 +1,141 @@
+"""
+Noisy simulator of Helmi built from calibration data.
+
+noise_model_from_calibration turns a get_calibration_data response into an Aer noise model
+on Helmi's native gates, the PRX gate ``r`` and ``cz``:
+
+- thermal relaxation from the T1 and T2 times of each qubit during every gate
+- depolarizing noise that brings the average gate fidelity down to the calibrated
+  single qubit and CZ fidelities
+- a symmetric readout error from the readout fidelity of each qubit
+
+noisy_simulator returns an AerSimulator with the noise model and Helmi's coupling map. The
+noise model is pickled in a cache directory keyed by a hash of the calibration data, so
+later runs with the same calibration file skip building it.
+
+Qubits or couplers without calibrated values get no noise of that kind. The gate durations
+are not part of the calibration data and are set by PRX_DURATION and CZ_DURATION.
+"""
+import hashlib
+import json
+import os
+import pickle
+
+from qiskit_aer import AerSimulator
+from qiskit_aer.noise import NoiseModel, ReadoutError, depolarizing_error, thermal_relaxation_error
+
+from helmi_utils.calibration import calibration_metrics
+from helmi_utils.layout_selector import CZ_FIDELITY, READOUT_FIDELITY, qubit_index
+from helmi_utils.topology import HELMI_COUPLING_MAP
+from qiskit.quantum_info import average_gate_fidelity
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "helmi_examples", "noise_models")
+
+T1_TIME = "t1_time"
+T2_TIME = "t2_time"
+PRX_FIDELITY = "fidelity_1qb_gates_averaged"
+
+# Gate durations in seconds
+PRX_DURATION = 40e-9
+CZ_DURATION = 80e-9
+
+BASIS_GATES = ["r", "cz", "id"]
+
+
+def _gate_error(fidelity: float, relaxation, num_qubits: int):
+    """
+    Returns the relaxation error composed with the depolarizing error that gives the
+    calibrated average gate fidelity, if any.
+    """
+    if fidelity is None:
+        return relaxation
+    dim = 2 ** num_qubits
+    if relaxation is not None:
+        # Only the infidelity that relaxation does not explain is depolarizing
+        fidelity = fidelity / average_gate_fidelity(relaxation.to_quantumchannel())
+    depolarizing = min(max(dim * (1 - fidelity) / (dim - 1), 0.0), 1.0)
+    error = depolarizing_error(depolarizing, num_qubits)
+    return error if relaxation is None else error.compose(relaxation)
+
+
+def _relaxation(t1: float, t2: float, duration: float):
+    if t1 is None or t2 is None:
+        return None
+    return thermal_relaxation_error(t1, min(t2, 2 * t1), duration)
+
+
+def noise_model_from_calibration(calibration_data: dict, coupling_map=HELMI_COUPLING_MAP) -> NoiseModel:
+    """
+    Returns an Aer noise model of Helmi's native gates from calibration data.
+    """
+    qubits = {}
+    cz = {}
+    for component, metric, value in calibration_metrics(calibration_data):
+        if "__" in component:
+            if metric == CZ_FIDELITY:
+                cz[frozenset(qubit_index(name) for name in component.split("__"))] = value
+        elif component.startswith("QB"):
+            qubits.setdefault(qubit_index(component), {})[metric] = value
+
+    noise_model = NoiseModel(basis_gates=BASIS_GATES)
+    relaxation = {}
+    for qubit, metrics in qubits.items():
+        t1, t2 = metrics.get(T1_TIME), metrics.get(T2_TIME)
+        relaxation[qubit] = (t1, t2)
+
+        error = _gate_error(metrics.get(PRX_FIDELITY), _relaxation(t1, t2, PRX_DURATION), 1)
+        if error is not None:
+            noise_model.add_quantum_error(error, "r", [qubit])
+
+        readout_fidelity = metrics.get(READOUT_FIDELITY)
+        if readout_fidelity is not None:
+            p = 1 - readout_fidelity
+            noise_model.add_readout_error(ReadoutError([[1 - p, p], [p, 1 - p]]), [qubit])
+
+    for qubit_a, qubit_b in {tuple(sorted(edge)) for edge in coupling_map}:
+        fidelity = cz.get(frozenset((qubit_a, qubit_b)))
+        relax_a = _relaxation(*relaxation.get(qubit_a, (None, None)), CZ_DURATION)
+        relax_b = _relaxation(*relaxation.get(qubit_b, (None, None)), CZ_DURATION)
+        for first, second, relax_first, relax_second in (
+            (qubit_a, qubit_b, relax_a, relax_b), (qubit_b, qubit_a, relax_b, relax_a),
+        ):
+            two_qubit_relaxation = None
+            if relax_first is not None and relax_second is not None:
+                two_qubit_relaxation = relax_first.expand(relax_second)
+            error = _gate_error(fidelity, two_qubit_relaxation, 2)
+            if error is not None:
+                noise_model.add_quantum_error(error, "cz", [first, second])
+
+    return noise_model
+
+
+def noisy_simulator(
+    calibration_file: str, coupling_map=HELMI_COUPLING_MAP, cache_dir: str = DEFAULT_CACHE_DIR,
+) -> AerSimulator:
+    """
+    Returns an AerSimulator of Helmi with the noise described by a saved calibration data file.
+    The noise model is loaded from cache_dir when it has been built before.
+    """
+    with open(calibration_file, "rb") as f:
+        contents = f.read()
+
+    digest = hashlib.sha256(contents)
+    digest.update(f"{sorted(coupling_map)};{PRX_DURATION};{CZ_DURATION};".encode())
+    path = os.path.join(cache_dir, f"{digest.hexdigest()}.pkl") if cache_dir else None
+
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            noise_model = pickle.load(f)
+    else:
+        noise_model = noise_model_from_calibration(json.loads(contents), coupling_map)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(noise_model, f)
+            os.replace(path + ".tmp", path)
+
+    edges = [list(edge) for a, b in coupling_map for edge in ((a, b), (b, a))]
+    num_qubits = max(max(edge) for edge in coupling_map) + 1
+    return AerSimulator(
+        noise_model=noise_model, coupling_map=edges, basis_gates=noise_model.basis_gates, n_qubits=num_qubits,
+    )
@@ -0,0 +1,105 @@
+"""
+Topology-aware parity oracles for the Bernstein-Vazirani algorithm.
+
+The oracle of a secret bitstring s flips the phase of every input x with s.x = 1 by applying
+a CNOT from each input qubit with s_i = 1 to an ancilla in the |-> state. On a device that
+is not fully connected, CNOTs to inputs that are not coupled to the ancilla would make the
+transpiler insert SWAPs, three CNOTs each.
+
+parity_oracle_layout places the ancilla and the inputs on a breadth-first tree of the coupling
+map with the inputs of the set bits closest to the ancilla, and parity_cnots collects the
+parity of the set bits along the edges of the tree instead. An input qubit c that is not
+coupled to the ancilla adds its parity into its parent p, p passes it on and c adds it again
+to restore p. An unset bit on the way passes its own value on twice so that it cancels. Every
+qubit of the tree is tried as the ancilla and the oracle with the fewest CNOTs is kept, which
+on Helmi's star places the ancilla on QB3.
+"""
+from collections import deque
+from collections.abc import Hashable, Iterable
+
+from helmi_utils.topology import adjacency
+
+
+def _tree(root: Hashable, neighbours: dict, num_inputs: int) -> tuple[list, dict]:
+    """
+    Returns the num_inputs qubits closest to root in breadth-first order and the parent
+    of each of them, or None if fewer qubits are connected to root.
+    """
+    order = []
+    parent = {}
+    seen = {root}
+    queue = deque([root])
+    while queue and len(order) < num_inputs:
+        qubit = queue.popleft()
+        for neighbour in sorted(neighbours[qubit], key=str):
+            if neighbour not in seen and len(order) < num_inputs:
+                seen.add(neighbour)
+                parent[neighbour] = qubit
+                order.append(neighbour)
+                queue.append(neighbour)
+    if len(order) < num_inputs:
+        return None
+    return order, parent
+
+
+def _kick(qubit: Hashable, target: Hashable, marked: set, children: dict) -> list[tuple]:
+    """
+    Returns the CNOTs that add the parity of the marked qubits in the subtree of qubit to target
+    and leave the subtree unchanged.
+    """
+    active = children.get(qubit, [])
+    if not active:
+        return [(qubit, target)]
+    inner = [cnot for child in active for cnot in _kick(child, qubit, marked, children)]
+    # An unmarked qubit adds its own value twice so that only its subtree's parity remains
+    cancel = [] if qubit in marked else [(qubit, target)]
+    return cancel + inner + [(qubit, target)] + inner
+
+
+def parity_cnots(secret: list[int], inputs: list, parent: dict, ancilla: Hashable) -> list[tuple]:
+    """
+    Returns the (control, target) CNOTs on coupled qubits that add the parity s.x of the
+    inputs to the ancilla. inputs[i] is the qubit of bit i of the secret.
+    """
+    marked = {qubit for qubit, bit in zip(inputs, secret) if bit}
+    # Only the branches of the tree that lead to a marked qubit are needed
+    children = {}
+    for qubit in marked:
+        while qubit != ancilla:
+            siblings = children.setdefault(parent[qubit], [])
+            if qubit in siblings:
+                break
+            siblings.append(qubit)
+            qubit = parent[qubit]
+    for siblings in children.values():
+        siblings.sort(key=inputs.index)
+    return [cnot for qubit in children.get(ancilla, []) for cnot in _kick(qubit, ancilla, marked, children)]
+
+
+def parity_oracle_layout(
+    secret: list[int], coupling_map: Iterable[tuple[Hashable, Hashable]],
+) -> tuple[Hashable, list, dict]:
+    """
+    Returns the ancilla, the qubit of each bit of the secret and the parent of every input in
+    the tree with the fewest CNOTs.
+    """
+    neighbours = adjacency(coupling_map)
+    best = None
+    for root in sorted(neighbours, key=str):
+        tree = _tree(root, neighbours, len(secret))
+        if tree is None:
+            continue
+        order, parent = tree
+        # The set bits get the qubits closest to the ancilla
+        bits = sorted(range(len(secret)), key=lambda bit: not secret[bit])
+        inputs = [None] * len(secret)
+        for bit, qubit in zip(bits, order):
+            inputs[bit] = qubit
+        cost = len(parity_cnots(secret, inputs, parent, root))
+        if best is None or cost < best[0]:
+            best = (cost, root, inputs, parent)
+
+    if best is None:
+        raise ValueError(f"The coupling map has no {len(secret) + 1} connected qubits")
+    _, ancilla, inputs, parent = best
+    return ancilla, inputs, parent
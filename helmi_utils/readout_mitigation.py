@@ -0,0 +1,213 @@
+"""
+Readout error mitigation with one 2x2 assignment matrix per qubit.
+
+Helmi's readout errors are almost independent between qubits, so the 2^n x 2^n assignment
+matrix of an n qubit register is the tensor product of one 2x2 matrix per qubit, whose
+column j holds the probabilities of reading 0 and 1 after preparing j. ReadoutMitigator
+builds the matrices from the readout fidelities in calibration data or from counts of
+circuits that prepare every qubit in |1> (and optionally |0>), as in qb_flip.py, and applies
+their inverses one qubit at a time. The full matrix is never built:
+
+- the dense mode applies the inverse of each qubit's matrix along its axis of the
+  probability vector, n passes over 2^n numbers, and mitigates many histograms at once
+- the sparse mode only computes the mitigated probabilities of the observed bitstrings. The
+  product of the per-qubit entries between every pair of observed bitstrings is looked up
+  8 qubits at a time, so it scales with the square of the number of distinct outcomes and
+  not with 2^n. Probability that moves to bitstrings that were never observed is dropped,
+  which is a good approximation when the readout errors are small.
+
+Inverting the assignment matrix gives quasi-probabilities that may be slightly negative.
+By default they are projected onto the nearest probability distribution so that the results
+can be passed to helmi_utils.metrics. Bit i of a bitstring is its i:th character from the
+right, as in Qiskit counts.
+"""
+import numpy as np
+
+from helmi_utils.calibration import calibration_metrics
+from helmi_utils.layout_selector import READOUT_FIDELITY, qubit_index
+
+# Registers of at most this many qubits are mitigated densely in the 'auto' mode
+DENSE_MAX_QUBITS = 12
+
+# Rows of the pairwise factor matrix computed at a time in the sparse mode
+SPARSE_CHUNK = 2048
+
+
+def assignment_matrix(error_0_to_1: float, error_1_to_0: float) -> np.ndarray:
+    """
+    Returns the 2x2 matrix of the probabilities of reading each state (rows) after
+    preparing each state (columns).
+    """
+    return np.array([
+        [1 - error_0_to_1, error_1_to_0],
+        [error_0_to_1, 1 - error_1_to_0],
+    ])
+
+
+def project_to_probabilities(quasi: np.ndarray) -> np.ndarray:
+    """
+    Returns the probability distributions closest in Euclidean distance to quasi-probability
+    vectors along the last axis.
+    """
+    quasi = np.asarray(quasi, dtype=float)
+    descending = -np.sort(-quasi, axis=-1)
+    cumulative = np.cumsum(descending, axis=-1) - 1
+    steps = np.arange(1, quasi.shape[-1] + 1)
+    support = np.sum(descending - cumulative / steps > 0, axis=-1, keepdims=True)
+    threshold = np.take_along_axis(cumulative, support - 1, axis=-1) / support
+    return np.maximum(quasi - threshold, 0.0)
+
+
+def _outcomes(counts: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the integer value and count of every bitstring of a counts dictionary.
+    """
+    outcomes = np.fromiter((int(key.replace(' ', ''), 2) for key in counts), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=float, count=len(counts))
+    return outcomes, values
+
+
+class ReadoutMitigator:
+    """
+    Tensor product readout error mitigation of counts over len(matrices) bits.
+
+    matrices[i] is the 2x2 assignment matrix of bit i, see assignment_matrix.
+    """
+
+    def __init__(self, matrices: list[np.ndarray]):
+        self.matrices = [np.asarray(matrix, dtype=float) for matrix in matrices]
+        self.inverses = [np.linalg.inv(matrix) for matrix in self.matrices]
+        self.num_qubits = len(self.matrices)
+        self._tables = None
+
+    @classmethod
+    def from_calibration(cls, calibration_data: dict, qubits: list[int], metric: str = READOUT_FIDELITY):
+        """
+        Returns a mitigator from the readout fidelities of calibration data, where qubits[i]
+        is the physical qubit measured into bit i. Readout errors are taken to be symmetric
+        and qubits without a calibrated fidelity are not mitigated.
+        """
+        fidelities = {
+            qubit_index(component): value for component, name, value in calibration_metrics(calibration_data)
+            if name == metric and component.startswith("QB") and "__" not in component
+        }
+        matrices = []
+        for qubit in qubits:
+            error = 1 - fidelities.get(qubit, 1.0)
+            matrices.append(assignment_matrix(error, error))
+        return cls(matrices)
+
+    @classmethod
+    def from_flip_counts(cls, one_counts: dict, zero_counts: dict = None):
+        """
+        Returns a mitigator from the counts of a circuit that flips every measured qubit to |1>,
+        and optionally of one that leaves them in |0>. Without zero_counts the readout errors
+        are taken to be symmetric.
+        """
+        errors_1_to_0 = 1 - cls._marginal_ones(one_counts)
+        errors_0_to_1 = errors_1_to_0 if zero_counts is None else cls._marginal_ones(zero_counts)
+        return cls([assignment_matrix(e01, e10) for e01, e10 in zip(errors_0_to_1, errors_1_to_0)])
+
+    @staticmethod
+    def _marginal_ones(counts: dict) -> np.ndarray:
+        """
+        Returns the fraction of shots in which each bit was read as 1.
+        """
+        outcomes, values = _outcomes(counts)
+        num_bits = len(next(iter(counts)).replace(' ', ''))
+        bits = (outcomes[:, None] >> np.arange(num_bits)) & 1
+        return values @ bits / values.sum()
+
+    def mitigate_vectors(self, probabilities: np.ndarray) -> np.ndarray:
+        """
+        Returns the mitigated quasi-probabilities of dense probability vectors of length 2^n
+        along the last axis, e.g. an array of shape (histograms, 2^n).
+        """
+        probabilities = np.asarray(probabilities, dtype=float)
+        shape = probabilities.shape
+        vectors = probabilities.reshape(-1, 2**self.num_qubits)
+        for bit, inverse in enumerate(self.inverses):
+            # The middle axis is the value of this bit in the index of the outcome
+            vectors = np.einsum("ij,ajb->aib", inverse, vectors.reshape(-1, 2, 2**bit))
+        return vectors.reshape(shape)
+
+    def _byte_tables(self) -> list[np.ndarray]:
+        """
+        Returns, for every group of 8 bits, the 256 x 256 table of the products of the inverse
+        entries of its bits between every two values of the group.
+        """
+        if self._tables is None:
+            values = np.arange(256)
+            self._tables = []
+            for start in range(0, self.num_qubits, 8):
+                table = np.ones((256, 256))
+                for offset, inverse in enumerate(self.inverses[start:start + 8]):
+                    bits = (values >> offset) & 1
+                    table *= inverse[bits[:, None], bits[None, :]]
+                self._tables.append(table)
+        return self._tables
+
+    def mitigate_sparse(self, outcomes: np.ndarray, probabilities: np.ndarray) -> np.ndarray:
+        """
+        Returns the mitigated quasi-probabilities of the observed integer outcomes only.
+        """
+        outcomes = np.asarray(outcomes, dtype=np.int64)
+        tables = self._byte_tables()
+        groups = [(outcomes >> (8 * i)) & 0xFF for i in range(len(tables))]
+        mitigated = np.empty(len(outcomes))
+        for start in range(0, len(outcomes), SPARSE_CHUNK):
+            rows = slice(start, start + SPARSE_CHUNK)
+            factors = np.ones((len(outcomes[rows]), len(outcomes)))
+            for table, group in zip(tables, groups):
+                factors *= table[group[rows, None], group[None, :]]
+            mitigated[rows] = factors @ probabilities
+        return mitigated
+
+    def mitigate(self, counts: dict, mode: str = "auto", project: bool = True) -> dict:
+        """
+        Returns the mitigated probabilities of a counts dictionary. mode is 'dense', 'sparse'
+        or 'auto', which is dense for registers of at most DENSE_MAX_QUBITS qubits. With
+        project=False the quasi-probabilities are returned as they are.
+        """
+        outcomes, values = _outcomes(counts)
+        probabilities = values / values.sum()
+        if mode == "auto":
+            mode = "dense" if self.num_qubits <= DENSE_MAX_QUBITS else "sparse"
+
+        if mode == "dense":
+            vector = np.zeros(2**self.num_qubits)
+            vector[outcomes] = probabilities
+            mitigated = self.mitigate_vectors(vector)
+            outcomes = np.arange(2**self.num_qubits)
+        elif mode == "sparse":
+            mitigated = self.mitigate_sparse(outcomes, probabilities)
+            mitigated /= mitigated.sum()
+        else:
+            raise ValueError(f"Unknown mitigation mode {mode}, use 'dense', 'sparse' or 'auto'")
+
+        if project:
+            mitigated = project_to_probabilities(mitigated)
+        return {
+            f"{outcome:0{self.num_qubits}b}": float(value)
+            for outcome, value in zip(outcomes, mitigated) if value != 0
+        }
+
+    def mitigate_many(self, counts_list: list[dict], mode: str = "auto", project: bool = True) -> list[dict]:
+        """
+        Returns the mitigated probabilities of many counts dictionaries, mitigating them all
+        in one pass in the dense mode.
+        """
+        if mode == "sparse" or (mode == "auto" and self.num_qubits > DENSE_MAX_QUBITS):
+            return [self.mitigate(counts, "sparse", project) for counts in counts_list]
+
+        vectors = np.zeros((len(counts_list), 2**self.num_qubits))
+        for row, counts in enumerate(counts_list):
+            outcomes, values = _outcomes(counts)
+            vectors[row, outcomes] = values / values.sum()
+        mitigated = self.mitigate_vectors(vectors)
+        if project:
+            mitigated = project_to_probabilities(mitigated)
+        return [
+            {f"{outcome:0{self.num_qubits}b}": float(row[outcome]) for outcome in np.flatnonzero(row)}
+            for row in mitigated
+        ]
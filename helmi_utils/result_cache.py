@@ -0,0 +1,268 @@
+"""
+Cache of job results keyed by what was run.
+
+Re-running an example to re-analyse or re-plot its results submits the same circuits to
+Helmi again and waits in the queue for results that are already known. ResultCache stores
+the result of every job in a directory as compressed JSON and returns it instead of
+submitting when the same job is run again.
+
+The cache key is a hash of the transpiled circuits, their qubit mapping, the number of shots,
+the backend and the calibration set the job runs with. On Helmi the latest calibration set
+ID is looked up through a CalibrationCache before submitting and the job is pinned to it, so
+a cached result is only reused while Helmi is still running with the same calibration. The
+calibration set ID reported in the result is the one the entry is stored under.
+
+The least recently used entries are removed once there are more than max_entries of them or
+they take more than max_bytes on disk.
+
+In replay mode nothing is submitted: every job is answered from the cache with the most
+recently stored result of the same circuits and shots, whatever its calibration set, and a
+job that has not been run before raises LookupError. offline_helmi_backend returns a Helmi
+backend that can transpile circuits without network access, so results can be replayed
+offline.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+from iqm.iqm_client import QuantumArchitectureSpecification, RunRequest
+from iqm.qiskit_iqm.iqm_provider import IQMBackend
+
+from helmi_utils.calibration import CalibrationCache, calibration_set_id_of
+from helmi_utils.topology import HELMI_ARCHITECTURE
+from helmi_utils.transpile_cache import circuit_fingerprint, result_calibration_set_id
+from qiskit import QuantumCircuit
+from qiskit.providers import JobStatus
+from qiskit.result import Result
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "helmi_examples", "results")
+
+# Calibration set ID part of the file name of results from backends without calibrations
+NO_CALIBRATION = "none"
+
+
+class _OfflineClient:
+    """
+    Stands in for IQMClient when Helmi's architecture is needed without network access.
+    """
+
+    def get_quantum_architecture(self) -> QuantumArchitectureSpecification:
+        return QuantumArchitectureSpecification(**HELMI_ARCHITECTURE)
+
+
+def offline_helmi_backend() -> IQMBackend:
+    """
+    Returns a Helmi backend for transpiling circuits offline. It cannot submit jobs.
+    """
+    return IQMBackend(_OfflineClient())
+
+
+def backend_identity(backend) -> str:
+    """
+    Returns the name of the backend, with a hash of its noise model for noisy simulators.
+    """
+    noise_model = getattr(getattr(backend, "options", None), "noise_model", None)
+    if noise_model is None:
+        return backend.name
+    noise = json.dumps(noise_model.to_dict(serializable=True), sort_keys=True, default=str)
+    return f"{backend.name}:{hashlib.sha256(noise.encode()).hexdigest()}"
+
+
+def qubit_mapping_fingerprint(circuit: QuantumCircuit) -> str:
+    """
+    Returns the physical qubit of every virtual qubit of a transpiled circuit.
+    """
+    if circuit.layout is None:
+        return "None"
+    return str(circuit.layout.initial_index_layout())
+
+
+def result_to_dict(result: Result) -> dict:
+    """
+    Returns a result as a JSON serializable dict.
+    """
+    data = result.to_dict()
+    if isinstance(data.get("request"), RunRequest):
+        data["request"] = data["request"].model_dump(mode="json")
+    return json.loads(json.dumps(data, default=str))
+
+
+def result_from_dict(data: dict) -> Result:
+    """
+    Returns the result saved by result_to_dict.
+    """
+    data = dict(data)
+    if isinstance(data.get("request"), dict):
+        data["request"] = RunRequest.model_validate(data["request"])
+    return Result.from_dict(data)
+
+
+class CachedJob:
+    """
+    Finished job whose result came from the cache.
+    """
+
+    def __init__(self, result: Result):
+        self._result = result
+
+    def job_id(self) -> str:
+        return self._result.job_id
+
+    def status(self) -> JobStatus:
+        return JobStatus.DONE
+
+    def in_final_state(self) -> bool:
+        return True
+
+    def result(self) -> Result:
+        return self._result
+
+
+class CachingJob:
+    """
+    Submitted job that stores its result in the cache once it is done.
+    """
+
+    def __init__(self, cache: "ResultCache", job, key: str):
+        self.cache = cache
+        self.job = job
+        self.key = key
+        self._result = None
+
+    def job_id(self) -> str:
+        return self.job.job_id()
+
+    def status(self) -> JobStatus:
+        return self.job.status()
+
+    def in_final_state(self) -> bool:
+        return self.job.in_final_state()
+
+    def result(self) -> Result:
+        if self._result is None:
+            self._result = self.job.result()
+            if self._result.success:
+                self.cache.put(self.key, self._result)
+        return self._result
+
+
+class ResultCache:
+    """
+    On disk cache of the results of jobs run on one backend.
+
+    calibration_set_id is looked up from Helmi if it is not given and the backend has a client.
+    """
+
+    def __init__(
+        self, backend, cache_dir: str = DEFAULT_CACHE_DIR, max_entries: int = 1000,
+        max_bytes: int = 1024 ** 3, replay: bool = False, calibration_set_id: str = None,
+    ):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._backend_identity = backend_identity(backend)
+        # Results are stored from the threads of job_manager
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        client = getattr(backend, "client", None)
+        if calibration_set_id is None and not replay and client is not None:
+            calibration_set_id = calibration_set_id_of(CalibrationCache(client).latest())
+        self.calibration_set_id = calibration_set_id
+
+    def key(self, circuits, shots: int) -> str:
+        """
+        Returns the part of the cache key that does not depend on the calibration set.
+        """
+        circuits = [circuits] if isinstance(circuits, QuantumCircuit) else circuits
+        digest = hashlib.sha256()
+        digest.update(f"{self._backend_identity};{shots};".encode())
+        for circuit in circuits:
+            digest.update(circuit_fingerprint(circuit).encode())
+            digest.update(qubit_mapping_fingerprint(circuit).encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str, calibration_set_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{calibration_set_id or NO_CALIBRATION}.json.gz")
+
+    def _candidates(self, key: str) -> list:
+        if not self.replay:
+            return [self._path(key, self.calibration_set_id)]
+        return [
+            os.path.join(self.cache_dir, filename) for filename in os.listdir(self.cache_dir)
+            if filename.startswith(key + ".") and filename.endswith(".json.gz")
+        ]
+
+    def get(self, key: str) -> Result:
+        """
+        Returns the cached result of a job, or None.
+        """
+        entries = []
+        for path in self._candidates(key):
+            try:
+                with gzip.open(path, "rt") as f:
+                    entries.append((json.load(f), path))
+            except FileNotFoundError:
+                continue
+        if not entries:
+            return None
+        entry, path = max(entries, key=lambda entry: entry[0]["created"])
+        # The modification time orders the entries for eviction
+        os.utime(path)
+        return result_from_dict(entry["result"])
+
+    def put(self, key: str, result: Result):
+        """
+        Stores the result of a job under the calibration set it ran with.
+        """
+        calibration_set_id = result_calibration_set_id(result) or self.calibration_set_id
+        path = self._path(key, calibration_set_id)
+        entry = {"created": time.time(), "calibration_set_id": calibration_set_id, "result": result_to_dict(result)}
+        with self._lock:
+            with gzip.open(path + ".tmp", "wt") as f:
+                json.dump(entry, f, separators=(",", ":"))
+            os.replace(path + ".tmp", path)
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is within its limits.
+        """
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(".json.gz"):
+                stat = os.stat(os.path.join(self.cache_dir, filename))
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        for count, (_, size, filename) in enumerate(entries):
+            if len(entries) - count <= self.max_entries and total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, filename))
+            total -= size
+
+    def run(self, circuits, shots: int, submit=None):
+        """
+        Returns a finished job with the cached result of running circuits, or submits them with
+        submit(circuits, shots=shots, ...), by default backend.run, and caches the result.
+        """
+        key = self.key(circuits, shots)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return CachedJob(result)
+
+        if self.replay:
+            raise LookupError("No cached result to replay for this job, run it once without replay first")
+        self.misses += 1
+        submit = submit or self.backend.run
+        options = {"calibration_set_id": self.calibration_set_id} if self.calibration_set_id else {}
+        return CachingJob(self, submit(circuits, shots=shots, **options), key)
@@ -0,0 +1,132 @@
+"""
+Bootstrap confidence intervals for success probabilities and distribution metrics.
+
+A histogram of a finite number of shots only estimates the outcome probabilities, so a
+success rate or fidelity computed from it is itself uncertain. The multinomial bootstrap
+redraws the same number of shots from the observed frequencies many times and recomputes
+the quantity for every redraw; the percentiles of the redraws give its confidence interval.
+
+All redraws of many histograms are drawn with one call to NumPy's multinomial sampler on a
+matrix of histograms over the union of their outcomes, and the metrics are then computed
+for all of them at once with the formulas of helmi_utils.metrics. Histograms are processed
+in chunks that keep the redraws below MAX_ELEMENTS numbers. The time is spent drawing the
+binomials that make up each multinomial draw, about 10^7 per second, so a thousand redraws of
+a hundred five qubit histograms take a fraction of a second.
+
+Redrawing from the observed frequencies alone never produces an outcome that was not
+observed, so a histogram that only contains target outcomes would get an interval of zero
+width. The redraws therefore also include one bucket for every outcome that was neither
+observed nor in the target, with PSEUDO_COUNT counts, which stands for the errors that a
+finite number of shots could have missed.
+
+Success probabilities are single proportions, and their intervals are Wilson score intervals
+computed in closed form, which also have a non-zero width at a success rate of 0 or 1.
+"""
+import numpy as np
+from scipy.stats import norm
+
+# Largest number of resampled counts held in memory at a time
+MAX_ELEMENTS = 5 * 10**6
+
+# Counts given to the outcomes that were not observed when redrawing the shots
+PSEUDO_COUNT = 1.0
+
+
+def _matrix(counts_list: list[dict], extra: list[str] = ()) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the sorted integer outcomes seen in any of the histograms, or in extra, and the
+    counts of every histogram over them.
+    """
+    keys = [
+        np.fromiter((int(key.replace(' ', ''), 2) for key in counts), dtype=np.int64, count=len(counts))
+        for counts in counts_list
+    ]
+    extra = np.fromiter((int(key.replace(' ', ''), 2) for key in extra), dtype=np.int64, count=len(extra))
+    outcomes = np.unique(np.concatenate(keys + [extra]))
+    matrix = np.zeros((len(counts_list), len(outcomes)))
+    for row, (counts, key) in enumerate(zip(counts_list, keys)):
+        matrix[row, np.searchsorted(outcomes, key)] = list(counts.values())
+    return outcomes, matrix
+
+
+def _chunks(num_histograms: int, num_outcomes: int, resamples: int):
+    """
+    Yields slices of histograms whose resamples fit in MAX_ELEMENTS numbers.
+    """
+    size = max(1, MAX_ELEMENTS // max(1, resamples * num_outcomes))
+    for start in range(0, num_histograms, size):
+        yield slice(start, start + size)
+
+
+def resample(counts: np.ndarray, resamples: int = 1000, seed=None, pseudo_counts: np.ndarray = 0) -> np.ndarray:
+    """
+    Returns resampled frequencies of shape (resamples, histograms, outcomes) from a matrix of
+    counts of shape (histograms, outcomes), keeping the number of shots of every histogram.
+    The shots are drawn from the counts plus pseudo_counts.
+    """
+    rng = np.random.default_rng(seed)
+    shots = counts.sum(axis=1)
+    weights = counts + pseudo_counts
+    probabilities = weights / weights.sum(axis=1, keepdims=True)
+    draws = rng.multinomial(shots.astype(np.int64), probabilities, size=(resamples, len(counts)))
+    return draws / shots[:, None]
+
+
+def interval(samples: np.ndarray, confidence: float = 0.95) -> np.ndarray:
+    """
+    Returns the lower and upper percentile bounds of samples along the first axis.
+    """
+    alpha = (1 - confidence) / 2
+    return np.quantile(samples, [alpha, 1 - alpha], axis=0)
+
+
+def proportion_intervals(successes, shots, confidence: float = 0.95) -> np.ndarray:
+    """
+    Returns rows of (estimate, lower, upper) for success counts out of a number of shots,
+    with the Wilson score interval of every proportion.
+    """
+    successes = np.asarray(successes, dtype=float)
+    shots = np.broadcast_to(np.asarray(shots, dtype=float), successes.shape)
+    z = norm.ppf(1 - (1 - confidence) / 2)
+    estimate = successes / shots
+    scale = 1 + z**2 / shots
+    center = (estimate + z**2 / (2 * shots)) / scale
+    half_width = z * np.sqrt(estimate * (1 - estimate) / shots + z**2 / (4 * shots**2)) / scale
+    return np.column_stack([estimate, np.maximum(center - half_width, 0.0), np.minimum(center + half_width, 1.0)])
+
+
+def bootstrap_metrics(
+    counts_list: list[dict], target: dict, resamples: int = 1000, confidence: float = 0.95, seed=None,
+) -> dict[str, np.ndarray]:
+    """
+    Returns the fidelity, total variation distance and Hellinger distance between every
+    histogram and the target distribution, as arrays with rows of (estimate, lower, upper).
+    Every interval contains its estimate.
+    """
+    outcomes, matrix = _matrix(counts_list, list(target))
+    q = np.zeros(len(outcomes) + 1)
+    target_outcomes = [int(key.replace(' ', ''), 2) for key in target]
+    q[np.searchsorted(outcomes, target_outcomes)] = list(target.values())
+    q /= q.sum()
+    sqrt_q = np.sqrt(q)
+    # The last column stands for every outcome that was neither observed nor in the target
+    matrix = np.column_stack([matrix, np.zeros(len(matrix))])
+    pseudo_counts = np.zeros(matrix.shape[1])
+    pseudo_counts[-1] = PSEUDO_COUNT
+
+    rng = np.random.default_rng(seed)
+    results = {name: np.empty((len(counts_list), 3)) for name in ('fidelity', 'tvd', 'hellinger')}
+    for rows in _chunks(len(counts_list), len(outcomes), resamples):
+        p = matrix[rows] / matrix[rows].sum(axis=1, keepdims=True)
+        samples = resample(matrix[rows], resamples, rng, pseudo_counts)
+        for name, estimate, resampled in (
+            ('fidelity', np.sqrt(p) @ sqrt_q, np.sqrt(samples) @ sqrt_q),
+            ('tvd', 0.5 * np.abs(p - q).sum(axis=-1), 0.5 * np.abs(samples - q).sum(axis=-1)),
+        ):
+            lower, upper = interval(resampled, confidence)
+            # Near its bound a metric of the redraws can stay on one side of the estimate
+            results[name][rows] = np.column_stack([estimate, np.minimum(lower, estimate), np.maximum(upper, estimate)])
+        # Hellinger distance decreases with the fidelity, so its bounds swap
+        fidelity = results['fidelity'][rows]
+        results['hellinger'][rows] = np.sqrt(np.maximum(0.0, 1.0 - fidelity[:, [0, 2, 1]]))
+    return results
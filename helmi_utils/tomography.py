@@ -0,0 +1,210 @@
+"""
+Fast state tomography from Pauli basis measurements.
+
+tomography_circuits measures a circuit of n qubits in all 3^n combinations of the X, Y and Z
+bases. fit_density_matrix estimates the state from their counts in closed form:
+
+- the counts of all circuits are stacked into one tensor of probabilities indexed by the
+  basis and the outcome of every qubit
+- one tensor contraction turns it into the expectation values of all 4^n Pauli operators.
+  A Pauli operator with identities is averaged over every basis that measures it, which is
+  the least squares solution for this measurement set
+- a second contraction sums the Pauli operators weighted by their expectation values, the
+  linear inversion estimate of the density matrix
+- the eigenvalues of the estimate are projected onto the probability simplex, which gives
+  the closest positive semidefinite matrix with unit trace (Smolin, Gambetta and Smith,
+  PRL 108, 070502)
+
+parallel_tomography_circuits measures copies of a circuit on several disjoint groups of
+qubits in the same circuits, e.g. a Bell pair on every coupler of a device that shares no
+qubit with the others, and split_counts separates the counts of each copy for the analysis.
+
+For two qubits this takes about a millisecond, compared to seconds for the iterative
+fitters of qiskit-experiments. Qubit 0 is the least significant bit of the outcomes and of the
+matrix indices, as in Qiskit.
+"""
+import itertools
+import string
+
+import numpy as np
+
+from helmi_utils.readout_mitigation import project_to_probabilities
+from qiskit import ClassicalRegister, QuantumCircuit
+
+BASES = "XYZ"
+
+PAULIS = np.array([
+    [[1, 0], [0, 1]],
+    [[0, 1], [1, 0]],
+    [[0, -1j], [1j, 0]],
+    [[1, 0], [0, -1]],
+], dtype=complex)
+
+# Weight of each (Pauli I, X, Y or Z; measured basis X, Y or Z; outcome) in the expectation value
+# of the Pauli operator: the eigenvalue of the outcome in its own basis, and identities averaged
+# over the three bases.
+_WEIGHTS = np.zeros((4, 3, 2))
+_WEIGHTS[0] = 1 / 3
+for _basis in range(3):
+    _WEIGHTS[_basis + 1, _basis] = [1, -1]
+
+
+def tomography_bases(num_qubits: int) -> list[str]:
+    """
+    Returns every combination of measurement bases, with the basis of qubit 0 first.
+    """
+    return ["".join(bases) for bases in itertools.product(BASES, repeat=num_qubits)]
+
+
+def measured_circuit(circuit: QuantumCircuit, bases: str) -> QuantumCircuit:
+    """
+    Returns a copy of the circuit with qubit i measured in the basis bases[i], X, Y or Z, into
+    a new register. The bases are stored in the metadata of the circuit.
+    """
+    qc = circuit.copy(name=f"{circuit.name}_{bases}")
+    creg = ClassicalRegister(circuit.num_qubits, "tomo")
+    qc.add_register(creg)
+    qc.barrier()
+    for qubit, basis in enumerate(bases):
+        if basis == "X":
+            qc.h(qubit)
+        elif basis == "Y":
+            qc.sdg(qubit)
+            qc.h(qubit)
+    qc.measure(range(circuit.num_qubits), creg)
+    qc.metadata = {**(circuit.metadata or {}), "basis": bases}
+    return qc
+
+
+def tomography_circuits(circuit: QuantumCircuit) -> list[QuantumCircuit]:
+    """
+    Returns a copy of the circuit measured in each combination of Pauli bases.
+    The basis is stored in the metadata of each circuit.
+    """
+    return [measured_circuit(circuit, bases) for bases in tomography_bases(circuit.num_qubits)]
+
+
+def parallel_tomography_circuits(circuit: QuantumCircuit, groups: list[list[tuple]]) -> tuple[list, list]:
+    """
+    Returns the tomography circuits of every group of disjoint qubit tuples, each running a copy
+    of the circuit on every tuple of the group, and the initial layout of each circuit.
+    The tuples of a group are measured in the same bases at the same time.
+    """
+    width = circuit.num_qubits
+    circuits = []
+    layouts = []
+    for index, group in enumerate(groups):
+        combined = QuantumCircuit(width * len(group), name=f"{circuit.name}_group{index}")
+        for copy in range(len(group)):
+            combined.compose(circuit, qubits=range(copy * width, (copy + 1) * width), inplace=True)
+        layout = [qubit for qubits in group for qubit in qubits]
+        for bases in tomography_bases(width):
+            qc = measured_circuit(combined, bases * len(group))
+            qc.metadata = {"basis": bases, "qubits": [list(qubits) for qubits in group]}
+            circuits.append(qc)
+            layouts.append(layout)
+    return circuits, layouts
+
+
+def split_counts(counts: dict, num_copies: int, width: int) -> list[dict]:
+    """
+    Returns the counts of each copy of a circuit measured by parallel_tomography_circuits.
+    """
+    outcomes = np.fromiter((int(key.split(" ")[0], 2) for key in counts), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=float, count=len(counts))
+    split = []
+    for copy in range(num_copies):
+        marginal = np.bincount((outcomes >> (copy * width)) & (2**width - 1), weights=values, minlength=2**width)
+        split.append({f"{outcome:0{width}b}": value for outcome, value in enumerate(marginal) if value})
+    return split
+
+
+def probability_tensor(counts_list: list[dict], bases: list[str], num_qubits: int) -> np.ndarray:
+    """
+    Returns the measured probabilities as a tensor with a basis axis and an outcome axis per
+    qubit, both ordered from qubit n-1 to qubit 0 like the bits of the outcomes.
+    Only the register added by tomography_circuits, the first one in Qiskit bitstrings, is used.
+    """
+    tensor = np.zeros((3,) * num_qubits + (2,) * num_qubits)
+    for counts, basis in zip(counts_list, bases):
+        index = tuple(BASES.index(b) for b in reversed(basis))
+        vector = np.zeros(2**num_qubits)
+        for key, value in counts.items():
+            vector[int(key.split(" ")[0], 2)] += value
+        tensor[index] = (vector / vector.sum()).reshape((2,) * num_qubits)
+    return tensor
+
+
+def _subscripts(num_qubits: int) -> tuple[str, str, str]:
+    """
+    Returns three distinct einsum subscripts of num_qubits letters each.
+    """
+    letters = string.ascii_letters
+    return letters[:num_qubits], letters[num_qubits:2 * num_qubits], letters[2 * num_qubits:3 * num_qubits]
+
+
+def pauli_expectations(probabilities: np.ndarray) -> np.ndarray:
+    """
+    Returns the expectation values of all Pauli operators, indexed by I, X, Y, Z on every
+    qubit from qubit n-1 to qubit 0, from a tensor of probability_tensor.
+    """
+    num_qubits = probabilities.ndim // 2
+    paulis, bases, outcomes = _subscripts(num_qubits)
+    operands = [f"{p}{b}{o}" for p, b, o in zip(paulis, bases, outcomes)]
+    expression = ",".join(operands + [bases + outcomes]) + "->" + paulis
+    return np.einsum(expression, *([_WEIGHTS] * num_qubits), probabilities, optimize=True)
+
+
+def linear_inversion(expectations: np.ndarray) -> np.ndarray:
+    """
+    Returns the density matrix sum_P <P> P / 2^n of the Pauli expectation values.
+    """
+    num_qubits = expectations.ndim
+    paulis, rows, columns = _subscripts(num_qubits)
+    operands = [f"{p}{r}{c}" for p, r, c in zip(paulis, rows, columns)]
+    expression = ",".join([paulis] + operands) + "->" + rows + columns
+    matrix = np.einsum(expression, expectations, *([PAULIS] * num_qubits), optimize=True)
+    return matrix.reshape(2**num_qubits, 2**num_qubits) / 2**num_qubits
+
+
+def project_to_density_matrix(matrix: np.ndarray) -> np.ndarray:
+    """
+    Returns the positive semidefinite matrix with unit trace closest to a Hermitian matrix.
+    """
+    eigenvalues, eigenvectors = np.linalg.eigh((matrix + matrix.conj().T) / 2)
+    eigenvalues = project_to_probabilities(eigenvalues)
+    return (eigenvectors * eigenvalues) @ eigenvectors.conj().T
+
+
+def fit_density_matrix(counts_list: list[dict], bases: list[str]) -> np.ndarray:
+    """
+    Returns the density matrix estimated from the counts of the tomography circuits measured
+    in the given bases, e.g. from their metadata.
+    """
+    num_qubits = len(bases[0])
+    expectations = pauli_expectations(probability_tensor(counts_list, bases, num_qubits))
+    return project_to_density_matrix(linear_inversion(expectations))
+
+
+def fit_parallel(counts_list: list[dict], circuits: list[QuantumCircuit]) -> dict[tuple, np.ndarray]:
+    """
+    Returns the density matrix of every qubit tuple measured by parallel_tomography_circuits,
+    from the counts of its circuits.
+    """
+    data = {}
+    for counts, circuit in zip(counts_list, circuits):
+        groups = circuit.metadata["qubits"]
+        width = len(circuit.metadata["basis"])
+        for qubits, split in zip(groups, split_counts(counts, len(groups), width)):
+            counts_of, bases_of = data.setdefault(tuple(qubits), ([], []))
+            counts_of.append(split)
+            bases_of.append(circuit.metadata["basis"])
+    return {qubits: fit_density_matrix(counts_of, bases_of) for qubits, (counts_of, bases_of) in data.items()}
+
+
+def state_fidelity(density_matrix: np.ndarray, state: np.ndarray) -> float:
+    """
+    Returns the fidelity <psi|rho|psi> of a density matrix with a pure state vector.
+    """
+    state = np.asarray(state, dtype=complex)
+    return float(np.real(state.conj() @ density_matrix @ state))
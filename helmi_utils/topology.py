@@ -0,0 +1,53 @@
+"""
+Helpers for working with the qubit connectivity of a device.
+
+Couplings are given as pairs of qubits, e.g. ``backend.coupling_map`` in Qiskit or
+``device.metadata.nx_graph.edges`` in Cirq. Helmi's CZ gates are symmetric so the
+direction of each pair is ignored.
+"""
+from collections import defaultdict
+from collections.abc import Hashable, Iterable
+
+# Helmi's star topology, QB3 (index 2) is coupled to every other qubit
+HELMI_COUPLING_MAP = [(0, 2), (1, 2), (2, 3), (2, 4)]
+
+# Helmi's quantum architecture in the format of the IQM server API
+HELMI_ARCHITECTURE = {
+    "name": "Adonis",
+    "operations": ["phased_rx", "cz", "measurement", "barrier"],
+    "qubits": [f"QB{qubit + 1}" for qubit in range(5)],
+    "qubit_connectivity": [[f"QB{a + 1}", f"QB{b + 1}"] for a, b in HELMI_COUPLING_MAP],
+}
+
+
+def adjacency(coupling_map: Iterable[tuple[Hashable, Hashable]]) -> dict[Hashable, set]:
+    """
+    Returns the neighbours of each qubit in an undirected coupling map.
+    """
+    neighbours = defaultdict(set)
+    for qubit_a, qubit_b in coupling_map:
+        neighbours[qubit_a].add(qubit_b)
+        neighbours[qubit_b].add(qubit_a)
+    return dict(neighbours)
+
+
+def disjoint_pair_groups(coupling_map: Iterable[tuple[Hashable, Hashable]]) -> list[list[tuple]]:
+    """
+    Returns the couplings split into groups of pairs that share no qubit, so that the pairs
+    of a group can be operated on at the same time. Couplings of the busiest qubits are placed
+    first, which keeps the number of groups close to the largest number of couplings of a qubit.
+    """
+    neighbours = adjacency(coupling_map)
+    edges = sorted(
+        {tuple(sorted(edge, key=str)) for edge in coupling_map},
+        key=lambda edge: (-max(len(neighbours[qubit]) for qubit in edge), str(edge)),
+    )
+    groups = []
+    for edge in edges:
+        for group in groups:
+            if not any(qubit in pair for pair in group for qubit in edge):
+                group.append(edge)
+                break
+        else:
+            groups.append([edge])
+    return groups
@@ -0,0 +1,210 @@
+"""
+Per-phase timing of Qiskit jobs.
+
+Tracer records spans for the phases of a job and writes them as JSON lines in the style of
+OpenTelemetry spans, one line per span with its trace ID, span ID, name, start and end time
+in nanoseconds since the epoch and attributes. The phases are
+
+- ``build`` and ``transpile``, and ``postprocess`` after the results: timed by the script
+  with ``tracer.span(name)``
+- ``serialize`` and ``submit``: converting the circuits to IQM's format and the request
+  that submits them, timed inside backend.run by tracer.submit
+- ``queue`` and ``execution``: the time the job was seen pending compilation and pending
+  execution by the status polls
+- ``download``: fetching and parsing the results
+
+Every span of a job is tagged with its job ID and, once the results have been downloaded,
+its calibration set ID. The timestamps reported by the server are added to the download
+span. Together they tell whether a slow run is spent in the client, on the network or in
+the Helmi queue.
+
+tracer.submit returns a TracedJob, which can be used like the job it wraps, e.g. with
+JobManager. Spans are only written when tracer.path is set, and summary() returns the total
+time of each phase.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from helmi_utils.transpile_cache import result_calibration_set_id
+from qiskit.providers import JobStatus
+
+FINAL_STATES = (JobStatus.DONE, JobStatus.ERROR, JobStatus.CANCELLED)
+
+# Tracers of different experiments may share a backend, see helmi_utils/experiment_runner.py
+_SUBMIT_LOCK = threading.Lock()
+# Timings of the tracer.submit call of the current context. Calls of the wrapped methods from
+# other contexts, e.g. an untraced backend.run of another experiment, are not recorded.
+_timings = contextvars.ContextVar("timings", default=None)
+
+
+class Tracer:
+    """
+    Records timing spans and appends them to a JSON lines file if path is given.
+    """
+
+    def __init__(self, path: str = None, poll_interval: float = 0.5):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, end: float, **attributes) -> dict:
+        """
+        Records a span between two time.time() timestamps.
+        """
+        span = {
+            "trace_id": self.trace_id,
+            "span_id": uuid.uuid4().hex[:16],
+            "name": name,
+            "start_time_unix_nano": int(start * 1e9),
+            "end_time_unix_nano": int(end * 1e9),
+            "duration": end - start,
+            "attributes": {key: value for key, value in attributes.items() if value is not None},
+        }
+        with self._lock:
+            self.spans.append(span)
+            if self.path:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(span, default=str) + "\n")
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Times the body of a with block, e.g. ``with tracer.span("transpile"):``.
+        """
+        start = time.time()
+        try:
+            yield attributes
+        finally:
+            self.record(name, start, time.time(), **attributes)
+
+    def submit(self, backend, circuits, **options):
+        """
+        Runs circuits on the backend like backend.run and returns a TracedJob.
+        On IQM backends the serialization and the submit request are timed separately.
+        """
+        timings = {"serialize": [], "submit": []}
+        wrapped = []
+
+        def timed(name, function):
+            def wrapper(*args, **kwargs):
+                recorded = _timings.get()
+                if recorded is None:
+                    return function(*args, **kwargs)
+                start = time.time()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    recorded[name].append((start, time.time()))
+            return wrapper
+
+        # backend.run looks both methods up on the instance, so they can be wrapped for one call.
+        # Submissions from several threads take turns so that the wrappers do not overlap.
+        with _SUBMIT_LOCK:
+            client = getattr(backend, "client", None)
+            if hasattr(backend, "serialize_circuit") and client is not None:
+                backend.serialize_circuit = timed("serialize", backend.serialize_circuit)
+                client.submit_circuits = timed("submit", client.submit_circuits)
+                wrapped = [(backend, "serialize_circuit"), (client, "submit_circuits")]
+
+            start = time.time()
+            token = _timings.set(timings)
+            try:
+                job = backend.run(circuits, **options)
+            finally:
+                _timings.reset(token)
+                for owner, name in wrapped:
+                    # Remove the wrapper so that the method of the class is used again
+                    delattr(owner, name)
+        end = time.time()
+
+        job_id = job.job_id()
+        if timings["serialize"]:
+            self.record("serialize", timings["serialize"][0][0], timings["serialize"][-1][1], job_id=job_id)
+            self.record("submit", *timings["submit"][0], job_id=job_id)
+        else:
+            self.record("submit", start, end, job_id=job_id)
+        return TracedJob(self, job, end)
+
+    def summary(self) -> dict:
+        """
+        Returns the total time of each phase over all recorded spans.
+        """
+        totals = defaultdict(float)
+        for span in self.spans:
+            totals[span["name"]] += span["duration"]
+        return dict(totals)
+
+
+class TracedJob:
+    """
+    Job wrapper that times the queue, execution and download phases of a job.
+    """
+
+    def __init__(self, tracer: Tracer, job, submitted: float):
+        self.tracer = tracer
+        self.job = job
+        self._status = JobStatus.QUEUED
+        self._phases = {JobStatus.QUEUED: [submitted, None]}
+        self._result = None
+
+    def job_id(self) -> str:
+        return self.job.job_id()
+
+    def status(self) -> JobStatus:
+        """
+        Returns the status of the job, noting when it starts executing and finishes.
+        """
+        status = self.job.status()
+        now = time.time()
+        if status == JobStatus.RUNNING and JobStatus.RUNNING not in self._phases:
+            self._phases[JobStatus.QUEUED][1] = now
+            self._phases[JobStatus.RUNNING] = [now, None]
+        elif status in FINAL_STATES and self._status not in FINAL_STATES:
+            for phase in self._phases.values():
+                if phase[1] is None:
+                    phase[1] = now
+        self._status = status
+        return status
+
+    def in_final_state(self) -> bool:
+        return self.status() in FINAL_STATES
+
+    def result(self):
+        """
+        Waits for the job and returns its result, recording the spans of the job.
+        """
+        if self._result is not None:
+            return self._result
+
+        while not self.in_final_state():
+            time.sleep(self.tracer.poll_interval)
+
+        start = time.time()
+        result = self.job.result()
+        end = time.time()
+
+        job_id = self.job_id()
+        calibration_set_id = result_calibration_set_id(result)
+        names = {JobStatus.QUEUED: "queue", JobStatus.RUNNING: "execution"}
+        for status, (phase_start, phase_end) in self._phases.items():
+            self.tracer.record(
+                names[status], phase_start, phase_end, job_id=job_id, calibration_set_id=calibration_set_id,
+            )
+        self.tracer.record(
+            "download", start, end, job_id=job_id, calibration_set_id=calibration_set_id,
+            server_timestamps=getattr(result, "timestamps", None),
+        )
+        self._result = result
+        return result
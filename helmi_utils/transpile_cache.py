@@ -0,0 +1,169 @@
+"""
+Cache of transpiled Qiskit circuits.
+
+Transpiling the same circuit for the same backend always gives the same result, yet the
+examples rebuild and re-transpile their circuits on every run. TranspileCache keeps the
+transpiled circuits in memory and, optionally, in a directory on disk as QPY files so that
+repeated runs of an experiment skip transpilation completely.
+
+The cache key combines a canonical hash of the circuit, the initial layout, the optimization
+level and any other transpile options with a fingerprint of the backend's target. Circuit
+names are not part of the hash as Qiskit generates a new name for every unnamed circuit.
+When the backend reports a new calibration set all cached entries are dropped.
+"""
+import hashlib
+import os
+import threading
+
+import qiskit
+from qiskit import QuantumCircuit, qpy, transpile
+
+CALIBRATION_FILE = "calibration_set_id"
+
+
+def circuit_fingerprint(circuit: QuantumCircuit) -> str:
+    """
+    Returns a hash of the registers and instructions of a circuit.
+    """
+    digest = hashlib.sha256()
+    for register in circuit.qregs + circuit.cregs:
+        digest.update(f"{type(register).__name__}:{register.name}:{register.size};".encode())
+    for instruction in circuit.data:
+        operation = instruction.operation
+        qubits = [circuit.find_bit(qubit).index for qubit in instruction.qubits]
+        clbits = [circuit.find_bit(clbit).index for clbit in instruction.clbits]
+        params = [str(param) for param in operation.params]
+        digest.update(f"{operation.name}{params}{qubits}{clbits};".encode())
+    return digest.hexdigest()
+
+
+def layout_fingerprint(circuit: QuantumCircuit, initial_layout) -> str:
+    """
+    Returns a string describing an initial layout given as a dict or a list.
+    """
+    if initial_layout is None:
+        return "None"
+    if isinstance(initial_layout, dict):
+        return str(sorted(
+            (circuit.find_bit(virtual).index, physical) for virtual, physical in initial_layout.items()
+        ))
+    return str(list(initial_layout))
+
+
+def backend_fingerprint(backend) -> str:
+    """
+    Returns a hash of the backend's native operations, their qubits and the Qiskit version.
+    """
+    target = backend.target
+    digest = hashlib.sha256()
+    digest.update(f"{backend.name}:{target.num_qubits}:{qiskit.__version__};".encode())
+    for name in sorted(target.operation_names):
+        qargs = sorted(str(qarg) for qarg in target[name])
+        digest.update(f"{name}{qargs};".encode())
+    return digest.hexdigest()
+
+
+def result_calibration_set_id(result) -> str:
+    """
+    Returns the calibration set ID of a job result from Helmi, or None for other backends.
+    """
+    calibration_set_id = getattr(result.results[0], "calibration_set_id", None)
+    return str(calibration_set_id) if calibration_set_id else None
+
+
+class TranspileCache:
+    """
+    In memory and on disk cache of circuits transpiled for one backend.
+
+    If cache_dir is None the circuits are only kept in memory.
+    """
+
+    def __init__(self, backend, cache_dir: str = None, calibration_set_id: str = None):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.calibration_set_id = None
+        self.hits = 0
+        self.misses = 0
+        self._backend_fingerprint = backend_fingerprint(backend)
+        self._circuits = {}
+        # Jobs may be submitted from several threads, see job_manager
+        self._lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            calibration_file = os.path.join(cache_dir, CALIBRATION_FILE)
+            if os.path.exists(calibration_file):
+                with open(calibration_file) as f:
+                    self.calibration_set_id = f.read().strip() or None
+
+        if calibration_set_id:
+            self.update_calibration_set_id(calibration_set_id)
+
+    def key(self, circuit: QuantumCircuit, initial_layout=None, optimization_level=None, **options) -> str:
+        """
+        Returns the cache key of a transpilation.
+        """
+        digest = hashlib.sha256()
+        digest.update(circuit_fingerprint(circuit).encode())
+        digest.update(layout_fingerprint(circuit, initial_layout).encode())
+        digest.update(f"{optimization_level};{sorted(options.items())};".encode())
+        digest.update(self._backend_fingerprint.encode())
+        return digest.hexdigest()
+
+    def transpile(self, circuit: QuantumCircuit, initial_layout=None, optimization_level=None, **options):
+        """
+        Returns the circuit transpiled for the backend, only calling transpile on a cache miss.
+        The returned circuit is shared between calls and should not be modified.
+        """
+        key = self.key(circuit, initial_layout, optimization_level, **options)
+        with self._lock:
+            return self._transpile(key, circuit, initial_layout, optimization_level, **options)
+
+    def _transpile(self, key: str, circuit: QuantumCircuit, initial_layout, optimization_level, **options):
+        if key in self._circuits:
+            self.hits += 1
+            return self._circuits[key]
+
+        path = os.path.join(self.cache_dir, f"{key}.qpy") if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                transpiled = qpy.load(f)[0]
+            self.hits += 1
+        else:
+            transpiled = transpile(
+                circuit, self.backend, initial_layout=initial_layout,
+                optimization_level=optimization_level, **options,
+            )
+            self.misses += 1
+            if path:
+                with open(path, "wb") as f:
+                    qpy.dump(transpiled, f)
+
+        self._circuits[key] = transpiled
+        return transpiled
+
+    def update_calibration_set_id(self, calibration_set_id: str):
+        """
+        Records the calibration set the backend is using, e.g. from result_calibration_set_id.
+        Cached circuits are dropped when it differs from the previously recorded one.
+        """
+        if not calibration_set_id or calibration_set_id == self.calibration_set_id:
+            return
+
+        if self.calibration_set_id is not None:
+            self.clear()
+        self.calibration_set_id = calibration_set_id
+
+        if self.cache_dir:
+            with open(os.path.join(self.cache_dir, CALIBRATION_FILE), "w") as f:
+                f.write(calibration_set_id)
+
+    def clear(self):
+        """
+        Removes every cached circuit from memory and disk.
+        """
+        self._circuits.clear()
+        if self.cache_dir:
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith(".qpy"):
+                    os.remove(os.path.join(self.cache_dir, filename))
@@ -1,45 +1,205 @@
 """
-An example of using the Qiskit experiments library on Helmi
-This example requires installing the qiskit-experiments package e.g,
-python -m pip install qiskit-experiments
+State tomography of a Bell pair on Helmi.
+
+By default the tomography circuits are built by helmi_utils/tomography.py, run as a single job
+and analysed in closed form: linear inversion of the Pauli basis counts followed by a projection
+onto physical density matrices, which takes less than a millisecond.
 
-The StateTomography experiment creates a single job containing several circuits.
-As part of the analysis, the experiment estimates the density matrix of the state based on the results.
+With --all-couplers a Bell pair is prepared on every coupler of the backend. Couplers that
+share no qubit are measured in the same circuits, and the tomography circuits of all couplers
+are submitted as a single job whose counts are split per coupler for the analysis.
+
+With --analysis experiments the example uses the StateTomography experiment of the Qiskit
+experiments library instead, which also creates a single job containing several circuits and
+estimates the density matrix as part of its analysis. This requires installing the
+qiskit-experiments package e.g,
+python -m pip install qiskit-experiments
 
-This example does not show how to vizualize the results of the StateTomography experiment.
+This example does not show how to vizualize the results of the tomography.
 
 Additional details on Qiskit Experiments can be found here: https://qiskit.org/ecosystem/experiments/
 """
+import argparse
 import os
+import sys
+import time
+from argparse import RawTextHelpFormatter
 
-from qiskit_experiments.library import StateTomography
-from qiskit_iqm import IQMProvider
+import numpy as np
+from iqm.qiskit_iqm import IQMProvider
 
-from qiskit import QuantumCircuit
+from qiskit import Aer, QuantumCircuit, transpile
+from qiskit.quantum_info import Statevector
 
-HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
-provider = IQMProvider(HELMI_CORTEX_URL)
-backend = provider.get_backend()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from helmi_utils.noise_model import noisy_simulator  # noqa: E402
+from helmi_utils.tomography import (  # noqa: E402
+    fit_density_matrix,
+    fit_parallel,
+    parallel_tomography_circuits,
+    state_fidelity,
+    tomography_circuits,
+)
+from helmi_utils.topology import HELMI_COUPLING_MAP, disjoint_pair_groups  # noqa: E402
 
-circuit = QuantumCircuit(2, name='Bell pair circuit')
-circuit.h(0)
-circuit.cx(0, 1)
 
-print(circuit.draw(output='text'))
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="State tomography of a Bell pair", formatter_class=RawTextHelpFormatter,
+        epilog="""Example usage:
+        python state-tomography.py --backend helmi
+        python state-tomography.py --backend helmi --qubits 1 2 --shots 1000
+        python state-tomography.py --backend helmi --all-couplers (every coupler in one job)
+        python state-tomography.py --backend helmi --analysis experiments (requires qiskit-experiments)
+        """,
+    )
+    parser.add_argument(
+        "--backend", choices=['helmi', 'simulator', 'noisy-sim'], default='helmi',
+        help="Backend to use: 'helmi', 'simulator' or 'noisy-sim'. Default is 'helmi'.",
+    )
+    parser.add_argument(
+        "--calibration", type=str, default=None,
+        help="Calibration data json file that sets the noise of the 'noisy-sim' backend.",
+    )
+    parser.add_argument(
+        "--qubits", type=int, nargs=2, default=None,
+        help="Physical qubits of the Bell pair. Default is 0 2 (QB1 and QB3).",
+    )
+    parser.add_argument(
+        "--shots", type=int, default=100,
+        help="Number of shots per tomography circuit. Default is 100.",
+    )
+    parser.add_argument(
+        "--all-couplers", action="store_true",
+        help="Run tomography of a Bell pair on every coupler of the backend in a single job.",
+    )
+    parser.add_argument(
+        "--analysis", choices=['fast', 'experiments'], default='fast',
+        help="'fast' linear inversion or the StateTomography experiment of qiskit-experiments.",
+    )
+    args = parser.parse_args()
+    if args.all_couplers and args.qubits is not None:
+        parser.error("--all-couplers measures every coupler and cannot be combined with --qubits")
+    if args.all_couplers and args.analysis == 'experiments':
+        parser.error("--all-couplers only supports --analysis fast")
+    if args.qubits is None:
+        args.qubits = [0, 2]
+    return args
 
-tomography_circuit = StateTomography(circuit, physical_qubits=[0, 2])
 
-# The circuit metadata can be printed like this
-print(tomography_circuit.circuits()[0].metadata)
+def run_experiments(circuit: QuantumCircuit, backend, qubits: list[int], shots: int):
+    """
+    Runs the StateTomography experiment of qiskit-experiments and prints its analysis results.
+    """
+    from qiskit_experiments.library import StateTomography
 
+    tomography_circuit = StateTomography(circuit, physical_qubits=qubits)
+
+    # The circuit metadata can be printed like this
+    print(tomography_circuit.circuits()[0].metadata)
+
+    tomography_data = tomography_circuit.run(
+        backend, seed_simulation=42, shots=shots,
+    )
+    jobs = tomography_data.jobs()
+    print(jobs)
+    print(jobs[0].status())
+
+    tomography_data = tomography_data.block_for_results()
+    for result in tomography_data.analysis_results():
+        print(result)
+
+
+def run_fast(circuit: QuantumCircuit, backend, qubits: list[int], shots: int):
+    """
+    Runs the tomography circuits as one job and prints the density matrix fitted in closed form.
+    """
+    circuits = tomography_circuits(circuit)
+    print(circuits[0].metadata)
+
+    transpiled = transpile(circuits, backend, initial_layout=qubits)
+    job = backend.run(transpiled, shots=shots)
+    print(job.job_id())
+    result = job.result()
+
+    start = time.perf_counter()
+    density_matrix = fit_density_matrix(
+        [result.get_counts(i) for i in range(len(circuits))], [qc.metadata["basis"] for qc in circuits],
+    )
+    analysis_time = time.perf_counter() - start
+
+    print("Density matrix:")
+    print(np.round(density_matrix, 3))
+    print(f"State fidelity: {state_fidelity(density_matrix, Statevector(circuit).data):.4f}")
+    print(f"Purity: {np.real(np.trace(density_matrix @ density_matrix)):.4f}")
+    print(f"Analysis took {analysis_time * 1000:.3f} ms")
+
+
+def run_all_couplers(circuit: QuantumCircuit, backend, shots: int):
+    """
+    Runs tomography of the circuit on every coupler of the backend in one job, measuring
+    couplers that share no qubit at the same time, and prints the fit of each coupler.
+    """
+    if backend.coupling_map is not None:
+        coupling_map = backend.coupling_map.get_edges()
+    else:
+        coupling_map = HELMI_COUPLING_MAP
+    groups = disjoint_pair_groups(coupling_map)
+    circuits, layouts = parallel_tomography_circuits(circuit, groups)
+    print(f"{sum(len(group) for group in groups)} couplers in {len(groups)} groups, {len(circuits)} circuits")
+
+    # Circuits of the same group share a layout, so each group is transpiled at once
+    transpiled = []
+    for start in range(0, len(circuits), 3**circuit.num_qubits):
+        group_circuits = circuits[start:start + 3**circuit.num_qubits]
+        transpiled += transpile(group_circuits, backend, initial_layout=layouts[start])
+    job = backend.run(transpiled, shots=shots)
+    print(job.job_id())
+    result = job.result()
+
+    start = time.perf_counter()
+    density_matrices = fit_parallel([result.get_counts(i) for i in range(len(circuits))], circuits)
+    analysis_time = time.perf_counter() - start
+
+    target = Statevector(circuit).data
+    for (qubit_a, qubit_b), density_matrix in sorted(density_matrices.items()):
+        fidelity = state_fidelity(density_matrix, target)
+        purity = np.real(np.trace(density_matrix @ density_matrix))
+        print(f"QB{qubit_a + 1}-QB{qubit_b + 1}: state fidelity {fidelity:.4f}, purity {purity:.4f}")
+    print(f"Analysis of {len(density_matrices)} couplers took {analysis_time * 1000:.3f} ms")
+
+
+def main():
+    args = get_args()
+
+    if args.backend == 'helmi':
+        HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
+        if not HELMI_CORTEX_URL:
+            raise ValueError(
+                "Environment variable HELMI_CORTEX_URL is not set",
+            )
+        provider = IQMProvider(HELMI_CORTEX_URL)
+        backend = provider.get_backend()
+    elif args.backend == 'noisy-sim':
+        if not args.calibration:
+            raise ValueError("--backend noisy-sim requires --calibration FILE")
+        backend = noisy_simulator(args.calibration)
+    else:
+        backend = Aer.get_backend('aer_simulator')
+
+    circuit = QuantumCircuit(2, name='Bell pair circuit')
+    circuit.h(0)
+    circuit.cx(0, 1)
+
+    print(circuit.draw(output='text'))
+
+    if args.all_couplers:
+        run_all_couplers(circuit, backend, args.shots)
+    elif args.analysis == 'experiments':
+        run_experiments(circuit, backend, args.qubits, args.shots)
+    else:
+        run_fast(circuit, backend, args.qubits, args.shots)
 
-tomography_data = tomography_circuit.run(
-    backend, seed_simulation=42, shots=100,
-)
-jobs = tomography_data.jobs()
-print(jobs)
-print(jobs[0].status())
 
-tomography_data = tomography_data.block_for_results()
-for result in tomography_data.analysis_results():
-    print(result)
+if __name__ == "__main__":
+    main()
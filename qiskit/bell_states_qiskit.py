@@ -1,10 +1,20 @@
 import argparse
 import os
+import sys
 from argparse import RawTextHelpFormatter
 
 from iqm.qiskit_iqm import IQMProvider
 
-from qiskit import Aer, QuantumCircuit, QuantumRegister, execute
+from qiskit import Aer, QuantumCircuit, QuantumRegister
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.calibration import load_calibration_data  # noqa: E402
+from helmi_utils.layout_selector import LayoutSelector  # noqa: E402
+from helmi_utils.noise_model import noisy_simulator  # noqa: E402
+from helmi_utils.result_cache import DEFAULT_CACHE_DIR as DEFAULT_RESULT_CACHE_DIR  # noqa: E402
+from helmi_utils.result_cache import ResultCache, offline_helmi_backend  # noqa: E402
+from helmi_utils.topology import HELMI_COUPLING_MAP  # noqa: E402
+from helmi_utils.transpile_cache import TranspileCache, result_calibration_set_id  # noqa: E402
 
 """
 Create and measure a bell state. User lists the pairs to entangle.
@@ -25,6 +35,9 @@ def get_args():
         epilog="""Example usage:
         python bell_states_qiskit.py --backend simulator
         python bell_states_qiskit.py --backend simulator --verbose (prints circuits)
+        python bell_states_qiskit.py --backend helmi --batch (all pairs in one job)
+        python bell_states_qiskit.py --backend helmi --calibration latest --pairs 2 (two best couplers)
+        python bell_states_qiskit.py --backend helmi --result-cache results (skip jobs that already ran)
         """,
     )
 
@@ -35,11 +48,78 @@ def get_args():
         help="""
         Define the backend for running the program.
         'aer'/'simulator' runs on Qiskit's aer simulator,
-        'helmi' runs on the Helmi Quantum Computer
+        'helmi' runs on the Helmi Quantum Computer,
+        'noisy-sim' runs on Aer with the noise of the --calibration file
         """,
         required=True,
         type=str,
-        choices=["helmi", "simulator"],
+        choices=["helmi", "simulator", "noisy-sim"],
+    )
+
+    args_parser.add_argument(
+        "--batch",
+        help="""
+        Submit the circuits for all qubit pairs as a single job
+        instead of one job per pair. All pairs then use 10000 shots.
+        """,
+        required=False,
+        action="store_true",
+    )
+
+    args_parser.add_argument(
+        "--transpile-cache",
+        help="""
+        Directory for caching transpiled circuits between runs.
+        By default circuits are only cached in memory.
+        """,
+        required=False,
+        type=str,
+        default=None,
+    )
+
+    args_parser.add_argument(
+        "--calibration",
+        help="""
+        Rank the couplers by their calibrated CZ and readout fidelities.
+        Either a calibration data json file from scripts/get_calibration_data.py
+        or 'latest' for the current calibration of Helmi.
+        Also sets the noise of --backend noisy-sim, which needs a file.
+        """,
+        required=False,
+        type=str,
+        default=None,
+    )
+
+    args_parser.add_argument(
+        "--pairs",
+        help="""
+        Only measure this many qubit pairs, the best ones first when --calibration is given.
+        By default every coupler is measured.
+        """,
+        required=False,
+        type=int,
+        default=None,
+    )
+
+    args_parser.add_argument(
+        "--result-cache",
+        help="""
+        Directory for caching job results between runs.
+        A job that already ran with the current calibration set is not submitted again.
+        """,
+        required=False,
+        type=str,
+        default=None,
+    )
+
+    args_parser.add_argument(
+        "--replay",
+        help="""
+        Only use the results in --result-cache (default ~/.cache/helmi_examples/results)
+        and never submit jobs. Works offline also with --backend helmi.
+        """,
+        required=False,
+        action="store_true",
     )
 
     args_parser.add_argument(
@@ -55,13 +135,72 @@ def get_args():
     return args_parser.parse_args()
 
 
+def bell_pair_circuits(qubit_pairs: list[tuple[int, int]]) -> list[tuple[str, QuantumCircuit, dict, int]]:
+    """
+    Returns a (label, circuit, mapping, shots) tuple for both CNOT directions of each
+    (qubit, hub) pair, e.g. (0, 2) for QB1 and QB3.
+    """
+    pairs = []
+    for qb, hub in qubit_pairs:
+        qreg = QuantumRegister(2, "qB")
+        qc = QuantumCircuit(qreg)
+
+        qc.h(qreg[0])
+        qc.cx(qreg[0], qreg[1])
+        qc.measure_all()
+
+        qubit_mapping = {
+            qreg[0]: qb,
+            qreg[1]: hub,
+        }
+        pairs.append(
+            ("Control: QB" + str(qb + 1) + "  Target: QB" + str(hub + 1) + " -> ", qc, qubit_mapping, 10000),
+        )
+
+        qreg = QuantumRegister(2, "qB")
+        qc = QuantumCircuit(qreg)
+
+        qc.h(qreg[1])
+        qc.cx(qreg[1], qreg[0])
+        qc.measure_all()
+
+        qubit_mapping = {
+            qreg[0]: qb,
+            qreg[1]: hub,
+        }
+        pairs.append(
+            ("Control: QB" + str(hub + 1) + "  Target QB" + str(qb + 1) + " -> ", qc, qubit_mapping, 1000),
+        )
+    return pairs
+
+
+def print_bell_counts(counts: dict, shots: int, offset: str):
+    """
+    Prints the percentage of each measured two qubit state.
+    """
+    counts_00 = (counts.get("00", 0) / shots) * 100
+    counts_11 = (counts.get("11", 0) / shots) * 100
+    counts_10 = (counts.get("10", 0) / shots) * 100
+    counts_01 = (counts.get("01", 0) / shots) * 100
+
+    t2 = counts_00 + counts_11
+
+    print(offset + " Percentage counts |00> = ", round(counts_00, 2), "%")
+    print(offset + " Percentage counts |11> = ", round(counts_11, 2), "%")
+    print(offset + " Percentage counts |10> = ", round(counts_10, 2), "%")
+    print(offset + " Percentage counts |01> = ", round(counts_01, 2), "%")
+    print(offset + " Percentage of counts |00> or |11> = ", round(t2, 2), "%")
+
+
 def main():
 
     args = get_args()
 
     print("Running on backend = ", args.backend)
 
-    if args.backend == 'helmi':
+    if args.backend == 'helmi' and args.replay:
+        backend = offline_helmi_backend()
+    elif args.backend == 'helmi':
         HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
         if not HELMI_CORTEX_URL:
             raise ValueError(
@@ -69,10 +208,18 @@ def main():
             )
         provider = IQMProvider(HELMI_CORTEX_URL)
         backend = provider.get_backend()
+    elif args.backend == 'noisy-sim':
+        if not args.calibration or args.calibration == 'latest':
+            raise ValueError("--backend noisy-sim requires --calibration FILE")
+        backend = noisy_simulator(args.calibration)
     else:
         provider = Aer
         backend = provider.get_backend('aer_simulator')
 
+    result_cache = None
+    if args.result_cache or args.replay:
+        result_cache = ResultCache(backend, args.result_cache or DEFAULT_RESULT_CACHE_DIR, replay=args.replay)
+
     print(" ")
     print("   Preparing a Bell State")
     print("   |00> + |11> / sqrt(2)")
@@ -81,99 +228,61 @@ def main():
     offset = " " * 10
     offset2 = " " * 20
 
-    for qb in [0, 1, 3, 4]:
-
-        print(offset + "Control: QB" + str(qb + 1) + "  Target: QB3 -> ")
-        qreg = QuantumRegister(2, "qB")
-        qc = QuantumCircuit(qreg)
-
-        qc.h(qreg[0])
-        qc.cx(qreg[0], qreg[1])
-        qc.measure_all()
+    qubit_pairs = [(qb, 2) for qb in [0, 1, 3, 4]]
+    if args.calibration:
+        client = backend.client if args.backend == 'helmi' else None
+        selector = LayoutSelector(load_calibration_data(args.calibration, client), HELMI_COUPLING_MAP)
+        # Keep QB3 as the second qubit of each pair as in the default order
+        qubit_pairs = [(qb, hub) if hub == 2 else (hub, qb) for qb, hub in selector.ranked_pairs()]
+        print("Qubit pairs from best to worst:", [f"QB{qb + 1}-QB{hub + 1}" for qb, hub in qubit_pairs])
+    qubit_pairs = qubit_pairs[:args.pairs]
+
+    pairs = bell_pair_circuits(qubit_pairs)
+    transpile_cache = TranspileCache(backend, cache_dir=args.transpile_cache)
+
+    if args.batch:
+        # Submit every pair as one multi-circuit job and split the counts afterwards
+        shots = max(pair_shots for _, _, _, pair_shots in pairs)
+        circuits = [
+            transpile_cache.transpile(qc, initial_layout=qubit_mapping)
+            for _, qc, qubit_mapping, _ in pairs
+        ]
 
         if args.verbose:
-            print(qc.draw())
-
-        shots = 10000
-
-        qubit_mapping = {
-            qreg[0]: qb,
-            qreg[1]: 2,
-        }
-
-        job = execute(qc, backend, shots=shots, initial_layout=qubit_mapping)
+            for qc in circuits:
+                print(qc.draw())
 
-        counts = job.result().get_counts()
+        job = result_cache.run(circuits, shots) if result_cache else backend.run(circuits, shots=shots)
+        result = job.result()
+        transpile_cache.update_calibration_set_id(result_calibration_set_id(result))
 
         if args.verbose and "IQM" in str(backend):
             print("Mapping")
-            print(job.result().request.qubit_mapping)
-
-        t2 = ((counts["00"] + counts["11"]) / shots) * 100
+            print(result.request.qubit_mapping)
 
-        counts_00 = (counts["00"] / shots) * 100
-        counts_11 = (counts["11"] / shots) * 100
+        for i, (label, _, _, _) in enumerate(pairs):
+            print(offset + label)
+            print_bell_counts(result.get_counts(i), shots, offset2)
+        return
 
-        if "10" in counts:
-            counts_10 = (counts["10"] / shots) * 100
-        else:
-            counts_10 = 0
+    for label, qc, qubit_mapping, shots in pairs:
 
-        if "01" in counts:
-            counts_01 = (counts["01"] / shots) * 100
-        else:
-            counts_01 = 0
-        print(offset2 + " Percentage counts |00> = ", round(counts_00, 2), "%")
-        print(offset2 + " Percentage counts |11> = ", round(counts_11, 2), "%")
-        print(offset2 + " Percentage counts |10> = ", round(counts_10, 2), "%")
-        print(offset2 + " Percentage counts |01> = ", round(counts_01, 2), "%")
-        print(offset2 + " Percentage of counts |00> or |11> = ", round(t2, 2), "%")
-
-        print(offset + "Control: QB3" + "  Target QB" + str(qb + 1) + " -> ")
-        qreg = QuantumRegister(2, "qB")
-        qc = QuantumCircuit(qreg)
-
-        qc.h(qreg[1])
-        qc.cx(qreg[1], qreg[0])
-        qc.measure_all()
+        print(offset + label)
 
         if args.verbose:
             print(qc.draw())
 
-        shots = 1000
-
-        qubit_mapping = {
-            qreg[0]: qb,
-            qreg[1]: 2,
-        }
-
-        job = execute(qc, backend, shots=shots, initial_layout=qubit_mapping)
+        circuit = transpile_cache.transpile(qc, initial_layout=qubit_mapping)
+        job = result_cache.run(circuit, shots) if result_cache else backend.run(circuit, shots=shots)
 
         counts = job.result().get_counts()
+        transpile_cache.update_calibration_set_id(result_calibration_set_id(job.result()))
 
         if args.verbose and "IQM" in str(backend):
             print("Mapping")
             print(job.result().request.qubit_mapping)
 
-        t2 = ((counts["00"] + counts["11"]) / shots) * 100
-
-        counts_00 = (counts["00"] / shots) * 100
-        counts_11 = (counts["11"] / shots) * 100
-
-        if "10" in counts:
-            counts_10 = (counts["10"] / shots) * 100
-        else:
-            counts_10 = 0
-
-        if "01" in counts:
-            counts_01 = (counts["01"] / shots) * 100
-        else:
-            counts_01 = 0
-        print(offset2 + " Percentage counts |00> = ", round(counts_00, 2), "%")
-        print(offset2 + " Percentage counts |11> = ", round(counts_11, 2), "%")
-        print(offset2 + " Percentage counts |10> = ", round(counts_10, 2), "%")
-        print(offset2 + " Percentage counts |01> = ", round(counts_01, 2), "%")
-        print(offset2 + " Percentage of counts |00> or |11> = ", round(t2, 2), "%")
+        print_bell_counts(counts, shots, offset2)
 
 
 if __name__ == "__main__":
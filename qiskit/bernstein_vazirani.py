@@ -1,12 +1,22 @@
 import argparse
 import os
+import sys
 from argparse import RawTextHelpFormatter
 from collections import Counter
+from functools import partial
 from random import randint
 
 from iqm.qiskit_iqm import IQMProvider
 
-from qiskit import Aer, ClassicalRegister, QuantumCircuit, QuantumRegister, execute, transpile
+from qiskit import Aer, ClassicalRegister, QuantumCircuit, QuantumRegister
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.job_manager import JobManager  # noqa: E402
+from helmi_utils.metrics import mode_confidence  # noqa: E402
+from helmi_utils.noise_model import noisy_simulator  # noqa: E402
+from helmi_utils.parity_oracle import parity_cnots, parity_oracle_layout  # noqa: E402
+from helmi_utils.statistics import proportion_intervals  # noqa: E402
+from helmi_utils.transpile_cache import TranspileCache, result_calibration_set_id  # noqa: E402
 
 """
 
@@ -23,7 +33,8 @@ The Solution:
 - Measure
 
 This is a 5 qubit circuit with the last qubit used as an "output qubit". Hence only needing a classical register
-of size 4 despite having a quantum register of size 5.
+of size 4 despite having a quantum register of size 5. With --dim n the secret has n bits and the circuit n + 1 qubits.
+The CNOTs of the oracle follow the coupling map of the backend, see helmi_utils/parity_oracle.py.
 
 """
 offset = " " * 37
@@ -36,13 +47,15 @@ class BVoracle:
     Class to define the Bernstein-Vazirani Oracle.
     """
 
-    def __init__(self, backend, dim=4, num=None, verbose=False):
-        self._num = num if num else randint(0, 2**dim - 1)
+    def __init__(self, backend, dim=4, num=None, verbose=False, transpile_cache=None):
+        self._num = num if num is not None else randint(0, 2**dim - 1)
         self.dim = dim
         self.backend = backend
+        self.transpile_cache = transpile_cache if transpile_cache else TranspileCache(backend)
         self.ccalls = 0
         self.qcalls = 0
         self.verbose = verbose
+        self._circuit = None
 
     def get(self, x):
         assert len(x) == self.dim
@@ -54,57 +67,84 @@ class BVoracle:
     # Assuming that when one calls the qoracle to be created
     # dim is correctly stated
     def quantum(self, shots=1):
+        return self.counts(self.submit(shots=shots).result())
+
+    def submit(self, shots=1):
+        """
+        Submits the oracle circuit and returns the job without waiting for its result.
+        """
         # qcalls increases every time one queries the oracle
         self.qcalls += 1
-        qreg = QuantumRegister(5, "QB")
-        creg = ClassicalRegister(4, "c")
-        qc = QuantumCircuit(qreg, creg)
+        return self.backend.run(self.circuit(), shots=shots)
 
-        qc = self._prepare_circuit(qc, qreg)
-
-        job = execute(qc, self.backend, shots=shots)
+    def counts(self, result):
+        """
+        Returns the counts of a finished oracle job.
+        """
+        self.transpile_cache.update_calibration_set_id(result_calibration_set_id(result))
+        return result.get_counts()
 
-        return job.result().get_counts()
+    def circuit(self):
+        """
+        Returns the transpiled oracle circuit, which is only built and transpiled on the first call.
+        """
+        if self._circuit is None:
+            qreg = QuantumRegister(self.dim + 1, "QB")
+            creg = ClassicalRegister(self.dim, "c")
+            qc, initial_layout = self._prepare_circuit(QuantumCircuit(qreg, creg), qreg)
+            self._circuit = self.transpile_cache.transpile(qc, initial_layout=initial_layout)
+            if self.verbose:
+                print("Transpiled circuit: ")
+                print(self._circuit.draw())
+        return self._circuit
 
     def _prepare_circuit(self, qc, qreg):
+        ancilla = qreg[self.dim]
+        s = self._to_bin_digits(self._num)[::-1]
+
+        if self.backend.coupling_map is not None:
+            coupling_map = self.backend.coupling_map.get_edges()
+        else:
+            coupling_map = [(q, self.dim) for q in range(self.dim)]
+        physical_ancilla, inputs, parent = parity_oracle_layout(s, coupling_map)
+        virtual = {physical: qreg[q] for q, physical in enumerate(inputs)}
+        virtual[physical_ancilla] = ancilla
+
         # Prepare the additional qubit
-        qc.h(qreg[4])
-        qc.z(qreg[4])
-        for i in range(4):
+        qc.h(ancilla)
+        qc.z(ancilla)
+        for i in range(self.dim):
             qc.h(i)
 
-        s = self._to_bin_digits(self._num)[::-1]
-
-        for q in range(4):
-            if s[q] != 0:
-                qc.cx(q, qreg[4])
+        # The CNOTs act on coupled qubits so that no SWAPs are needed
+        for control, target in parity_cnots(s, inputs, parent, physical_ancilla):
+            qc.cx(virtual[control], virtual[target])
 
-        for i in range(4):
+        for i in range(self.dim):
             qc.h(i)
 
-        qc.measure(range(4), range(4))
+        qc.measure(range(self.dim), range(self.dim))
         if self.verbose:
             print("Created circuit: ")
             print(qc.draw())
-            transpiled_circuit = transpile(qc, self.backend)
-            print("Transpiled circuit: ")
-            print(transpiled_circuit.draw())
 
-        return qc
+        if self.backend.coupling_map is None:
+            return qc, None
+        return qc, {qubit: physical for physical, qubit in virtual.items()}
 
-    def _to_bin_digits(self, num, dim=4):
+    def _to_bin_digits(self, num, dim=None):
         """
         Returns binary representation of num (int) as a list of ints with optional
-        parameter dim to fill with zeroes from left up to length dim.
+        parameter dim to fill with zeroes from left up to length dim, by default self.dim.
         """
         return [int(c) for c in self._to_bin_str(num, dim)]
 
-    def _to_bin_str(self, num, dim=4):
+    def _to_bin_str(self, num, dim=None):
         """
         Returns binary representation of num (int) as a string with optional
-        parameter dim to fill with zeroes from left up to length dim.
+        parameter dim to fill with zeroes from left up to length dim, by default self.dim.
         """
-        return f"{num:0{dim}b}"
+        return f"{num:0{dim or self.dim}b}"
 
 
 def get_args():
@@ -121,6 +161,7 @@ def get_args():
         python bernstein_vazirani.py --backend helmi
         python bernstein_vazirani.py --backend simulator
         python bernstein_vazirani.py --backend helmi -v (prints circuits)
+        python bernstein_vazirani.py --backend helmi --confidence 0.99 (stop once the secret is known)
         """,
     )
     # Parse Arguments
@@ -130,11 +171,23 @@ def get_args():
         help="""
         Define the backend for running the program.
         'aer'/'simulator' runs on Qiskit's aer simulator,
-        'helmi' runs on VTT Helmi Quantum Computer
+        'helmi' runs on VTT Helmi Quantum Computer,
+        'noisy-sim' runs on Aer with the noise of the --calibration file
         """,
         required=True,
         type=str,
-        choices=["helmi", "simulator"],
+        choices=["helmi", "simulator", "noisy-sim"],
+    )
+
+    args_parser.add_argument(
+        "--calibration",
+        help="""
+        Calibration data json file from scripts/get_calibration_data.py
+        that sets the noise of --backend noisy-sim.
+        """,
+        required=False,
+        type=str,
+        default=None,
     )
 
     args_parser.add_argument(
@@ -147,6 +200,17 @@ def get_args():
         action="store_true",
     )
 
+    args_parser.add_argument(
+        "--transpile-cache",
+        help="""
+        Directory for caching transpiled circuits between runs.
+        By default circuits are only cached in memory.
+        """,
+        required=False,
+        type=str,
+        default=None,
+    )
+
     args_parser.add_argument(
         "-o",
         "--option",
@@ -160,6 +224,17 @@ def get_args():
         default=2,
     )
 
+    args_parser.add_argument(
+        "--dim",
+        help="""
+        Number of bits of the secret. The circuit uses one more qubit.
+        Default = 4
+        """,
+        required=False,
+        type=int,
+        default=4,
+    )
+
     args_parser.add_argument(
         "--number",
         help="""
@@ -183,7 +258,35 @@ def get_args():
         default=5,
     )
 
-    return args_parser.parse_args()
+    args_parser.add_argument(
+        "--confidence",
+        help="""
+        Run the repeated Quantum run adaptively: submit --chunk-shots shots at a time and
+        stop as soon as the most frequent bitstring is the secret with this posterior
+        probability, e.g. 0.99. At most --repeats x 1000 shots are used.
+        """,
+        type=float,
+        required=False,
+        default=None,
+    )
+
+    args_parser.add_argument(
+        "--chunk-shots",
+        help="""
+        Number of shots per job of the adaptive run
+        Default = 100
+        """,
+        type=int,
+        required=False,
+        default=100,
+    )
+
+    args = args_parser.parse_args()
+    if args.repeats < 1:
+        args_parser.error("--repeats must be at least 1")
+    if args.chunk_shots < 1:
+        args_parser.error("--chunk-shots must be at least 1")
+    return args
 
 
 # def classical(bv):
@@ -211,6 +314,26 @@ def most_frequent(lst):
     return most_freq_item, freqs[most_freq_item]
 
 
+def adaptive_run(bv, confidence: float, chunk_shots: int, max_shots: int):
+    """
+    Runs the oracle chunk_shots shots at a time until the most frequent bitstring is the most
+    likely outcome with the given posterior probability, or max_shots shots have been used.
+    Returns the bitstring, its posterior probability and the total counts.
+    """
+    counts = Counter()
+    shots = 0
+    print(offset + "Job  Shots      Result     Binary     Confidence")
+    while shots < max_shots:
+        chunk = min(chunk_shots, max_shots - shots)
+        counts.update(bv.quantum(shots=chunk))
+        shots += chunk
+        s, probability = mode_confidence(counts, 2**bv.dim)
+        print(offset + f"{bv.qcalls:<5}{shots:<11}{int(s, 2):<11}{s:<11}{probability * 100:.2f}%")
+        if probability >= confidence:
+            break
+    return s, probability, counts
+
+
 def main():
     args = get_args()
 
@@ -222,13 +345,17 @@ def main():
             )
         provider = IQMProvider(HELMI_CORTEX_URL)
         backend = provider.get_backend()
+    elif args.backend == 'noisy-sim':
+        if not args.calibration:
+            raise ValueError("--backend noisy-sim requires --calibration FILE")
+        backend = noisy_simulator(args.calibration)
     else:
         provider = Aer
         backend = provider.get_backend('aer_simulator')
 
-    if args.number is not None and args.number > 15:
+    if args.number is not None and args.number >= 2**args.dim:
         raise ValueError(
-            "ERROR! Guess must be a 4 bit string number or lower. Less than or equal to 15.",
+            f"ERROR! Guess must be a {args.dim} bit string number or lower. Less than or equal to {2**args.dim - 1}.",
         )
 
     print("Running on backend = ", args.backend)
@@ -236,7 +363,7 @@ def main():
     print_header("initialization")
     NUM = args.number
     if NUM is None:
-        NUM = randint(0, 15)
+        NUM = randint(0, 2**args.dim - 1)
         print(
             offset
             + "The hidden oracle number was chosen randomly and will not be disclosed.",
@@ -247,17 +374,20 @@ def main():
             + f"The hidden oracle number is s = {NUM}. In general it is not dislosed to the testing party.",
         )
 
-    bv = BVoracle(num=NUM, backend=backend, verbose=args.verbose)
+    transpile_cache = TranspileCache(backend, cache_dir=args.transpile_cache)
+    bv = BVoracle(num=NUM, backend=backend, dim=args.dim, verbose=args.verbose, transpile_cache=transpile_cache)
     print(offset + "The oracle is now initialized with given secret oracle index.")
 
     if args.option == 1:
-        guess = bv.quantum(shots=10000)
+        shots = 10000
+        guess = bv.quantum(shots=shots)
         s, amt = most_frequent(guess)
-        success_rate = round((amt / 1000) * 100, 2)
+        _, lower, upper = proportion_intervals([amt], shots)[0] * 100
+        success_rate = round((amt / shots) * 100, 2)
         print(s, amt)
 
         print_header("Single run")
-        print(offset + f"Success Chance: {success_rate}%")
+        print(offset + f"Success Chance: {success_rate}% (95% confidence interval {lower:.2f}% - {upper:.2f}%)")
         print(offset + f"Result: {int(s, 2)}")
         print(offset + f"Binary: {s}")
 
@@ -268,29 +398,53 @@ def main():
         print(offset + f"Quantum oracle was called {bv.qcalls} time(s).")
         print("\n")
 
+    elif args.option == 2 and args.confidence is not None:
+        print_header("Adaptive run")
+        max_shots = args.repeats * 1000
+        s, probability, counts = adaptive_run(bv, args.confidence, args.chunk_shots, max_shots)
+        shots = sum(counts.values())
+
+        if probability >= args.confidence:
+            print(offset + f"Identified s = {int(s, 2)} (binary number {s}) with {probability * 100:.2f}% confidence.")
+        else:
+            print(offset + f"Confidence {args.confidence * 100:.2f}% not reached within {max_shots} shots.")
+            print(offset + f"Most likely s = {int(s, 2)} (binary number {s}) with {probability * 100:.2f}% confidence.")
+        print(offset + f"Used {shots} shots in {bv.qcalls} job(s), success rate {counts[s] / shots * 100:.2f}%.")
+        print("\n")
+
     elif args.option == 2:
         success = []
         result = []
         binary = []
         qcalls = []
         print_header("Repeated run")
-        for i in range(args.repeats):
-            guess = bv.quantum(shots=1000)
+        # All repeats are queued at once instead of waiting for each one in turn
+        job_results = JobManager().run(
+            [partial(bv.submit, shots=1000) for _ in range(args.repeats)],
+        )
+        amts = []
+        for i, job_result in enumerate(job_results):
+            guess = bv.counts(job_result)
             s, amt = most_frequent(guess)
             success_rate = round((amt / 1000) * 100, 2)
             success.append(success_rate)
+            amts.append(amt)
             result.append(int(s, 2))
             binary.append(s)
-            qcalls.append(bv.qcalls)
+            qcalls.append(i + 1)
+        # The intervals of all repeats are computed at once
+        intervals = proportion_intervals(amts, 1000) * 100
 
-        print(offset + "Run  Success      Result     Binary     qcalls")
+        print(offset + "Run  Success      95% interval       Result     Binary     qcalls")
         for i in range(args.repeats):
             print(
                 offset
                 + str(i + 1)
                 + "     "
                 + str(success[i])
-                + "%         "
+                + "%        "
+                + f"{intervals[i, 1]:.1f}% - {intervals[i, 2]:.1f}%"
+                + "         "
                 + str(result[i])
                 + "         "
                 + str(binary[i])
@@ -1,23 +1,39 @@
 import argparse
 import os
+import sys
 from argparse import RawTextHelpFormatter
+from functools import partial
 
-import numpy as np
 from iqm.qiskit_iqm import IQMProvider
 
-from qiskit import Aer, QuantumCircuit, QuantumRegister, execute
+from qiskit import Aer, QuantumCircuit, QuantumRegister, transpile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.calibration import load_calibration_data  # noqa: E402
+from helmi_utils.ghz import ghz_schedule, ghz_target  # noqa: E402
+from helmi_utils.job_manager import JobManager  # noqa: E402
+from helmi_utils.layout_selector import LayoutSelector  # noqa: E402
+from helmi_utils.metrics import distribution_metrics  # noqa: E402
+from helmi_utils.noise_model import noisy_simulator  # noqa: E402
+from helmi_utils.readout_mitigation import ReadoutMitigator  # noqa: E402
+from helmi_utils.result_cache import DEFAULT_CACHE_DIR as DEFAULT_RESULT_CACHE_DIR  # noqa: E402
+from helmi_utils.result_cache import ResultCache, offline_helmi_backend  # noqa: E402
+from helmi_utils.statistics import bootstrap_metrics  # noqa: E402
+from helmi_utils.topology import HELMI_COUPLING_MAP  # noqa: E402
+from helmi_utils.tracing import Tracer  # noqa: E402
 
 """
 
 This example creates a 5 qubit GHZ stats in cirq
 
-First a Bell state is prepared between QB3 and all the other qubits.
-From this we can measure the trace distance between QB3 and each of the other qubits.
+First a Bell state is prepared on every coupler of the backend, between QB3 and all the
+other qubits on Helmi. From this we can measure the trace distance of each coupled pair.
 
-A 5 qubit GHZ state is then created
+A GHZ state is then created, by default with 5 qubits. The CNOTs fan out along the
+coupling map of the backend so that the circuit is as shallow as possible.
 
 In this example we calculate the fidelity and Distance from target state for each bell state
-and then the 5 qubit GHZ state
+and then the GHZ state
 
 - Fidelity is the "closeness" of two quantum states or how distinguishable they are from each other
     - For example a maximum value of 1 is attained if and only if the two states are identical.
@@ -34,12 +50,17 @@ def get_args():
     args_parser = argparse.ArgumentParser(
         description="""
         This example creates a 5 qubit GHZ stats in cirq
-        First a Bell state is prepared between QB3 and all the other qubits.
-        From this we can measure the trace distance between QB3 and each of the other qubits.""",
+        First a Bell state is prepared on every coupler, between QB3 and all the other qubits on Helmi.
+        From this we can measure the trace distance of each coupled pair.""",
         formatter_class=RawTextHelpFormatter,
         epilog="""Example usage:
         python ghz.py --backend simulator
         python ghz.py --backend simulator --verbose (prints circuits)
+        python ghz.py --backend simulator --qubits 3
+        python ghz.py --backend helmi --qubits 3 --calibration latest
+        python ghz.py --backend helmi --calibration latest --mitigate (correct the readout errors)
+        python ghz.py --backend helmi --trace trace.jsonl (time every phase of every job)
+        python ghz.py --backend helmi --replay (reuse the results of the last run, offline)
         """,
     )
     # Parse Arguments
@@ -49,11 +70,79 @@ def get_args():
         help="""
         Define the backend for running the program.
         'aer'/'simulator' runs on Qiskit's aer simulator,
-        'helmi' runs on VTT Helmi Quantum Computer
+        'helmi' runs on VTT Helmi Quantum Computer,
+        'noisy-sim' runs on Aer with the noise of the --calibration file
         """,
         required=True,
         type=str,
-        choices=["helmi", "simulator"],
+        choices=["helmi", "simulator", "noisy-sim"],
+    )
+
+    args_parser.add_argument(
+        "--qubits",
+        help="""
+        Number of qubits in the GHZ state.
+        The CNOTs are laid out along the coupling map of the backend.
+        Default = 5
+        """,
+        required=False,
+        type=int,
+        default=5,
+    )
+
+    args_parser.add_argument(
+        "--calibration",
+        help="""
+        Place the GHZ state on the best calibrated qubits and couplers.
+        Either a calibration data json file from scripts/get_calibration_data.py
+        or 'latest' for the current calibration of Helmi.
+        Also sets the noise of --backend noisy-sim, which needs a file.
+        """,
+        required=False,
+        type=str,
+        default=None,
+    )
+
+    args_parser.add_argument(
+        "--mitigate",
+        help="""
+        Correct the counts for the readout errors of the --calibration data
+        before computing the fidelities.
+        """,
+        required=False,
+        action="store_true",
+    )
+
+    args_parser.add_argument(
+        "--trace",
+        help="""
+        JSON lines file for the time spent building, transpiling, serializing, submitting,
+        queueing, executing, downloading and post-processing each job.
+        """,
+        required=False,
+        type=str,
+        default=None,
+    )
+
+    args_parser.add_argument(
+        "--result-cache",
+        help="""
+        Directory for caching job results between runs.
+        A job that already ran with the current calibration set is not submitted again.
+        """,
+        required=False,
+        type=str,
+        default=None,
+    )
+
+    args_parser.add_argument(
+        "--replay",
+        help="""
+        Only use the results in --result-cache (default ~/.cache/helmi_examples/results)
+        and never submit jobs. Works offline also with --backend helmi.
+        """,
+        required=False,
+        action="store_true",
     )
 
     args_parser.add_argument(
@@ -66,7 +155,41 @@ def get_args():
         action="store_true",
     )
 
-    return args_parser.parse_args()
+    args = args_parser.parse_args()
+    if args.qubits < 1:
+        args_parser.error("--qubits must be at least 1")
+    return args
+
+
+def ghz_circuit(num_qubits: int, coupling_map: list, selector: LayoutSelector = None) -> tuple[QuantumCircuit, dict]:
+    """
+    Returns a GHZ circuit with its CNOTs placed along the coupling map in as few layers
+    as possible, and the mapping of its qubits to physical qubits.
+    """
+    qubits, layers = ghz_schedule(num_qubits, coupling_map, selector)
+    index = {physical: i for i, physical in enumerate(qubits)}
+
+    qreg = QuantumRegister(num_qubits, "qB")
+    circuit = QuantumCircuit(qreg)
+
+    circuit.h(qreg[0])
+    for layer in layers:
+        for control, target in layer:
+            circuit.cx(qreg[index[control]], qreg[index[target]])
+
+    circuit.measure_all()
+
+    mapping = {qreg[i]: physical for i, physical in enumerate(qubits)}
+    return circuit, mapping
+
+
+def mitigate_readout(counts: dict, mapping: dict, calibration_data: dict) -> dict:
+    """
+    Returns the probabilities of the counts of a circuit measured with measure_all,
+    corrected for the readout errors of the physical qubits in the mapping.
+    """
+    mitigator = ReadoutMitigator.from_calibration(calibration_data, list(mapping.values()))
+    return mitigator.mitigate(counts)
 
 
 def main():
@@ -76,7 +199,9 @@ def main():
 
     args = get_args()
 
-    if args.backend == 'helmi':
+    if args.backend == 'helmi' and args.replay:
+        backend = offline_helmi_backend()
+    elif args.backend == 'helmi':
         HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
         if not HELMI_CORTEX_URL:
             raise ValueError(
@@ -84,23 +209,33 @@ def main():
             )
         provider = IQMProvider(HELMI_CORTEX_URL)
         backend = provider.get_backend()
+    elif args.backend == 'noisy-sim':
+        if not args.calibration or args.calibration == 'latest':
+            raise ValueError("--backend noisy-sim requires --calibration FILE")
+        backend = noisy_simulator(args.calibration)
     else:
         provider = Aer
         backend = provider.get_backend('aer_simulator')
 
+    result_cache = None
+    if args.result_cache or args.replay:
+        result_cache = ResultCache(backend, args.result_cache or DEFAULT_RESULT_CACHE_DIR, replay=args.replay)
+
     shots = 10000
 
+    if backend.coupling_map is not None:
+        coupling_map = backend.coupling_map.get_edges()
+    else:
+        coupling_map = HELMI_COUPLING_MAP
+
     bell_vd = []
-    id_dist = [0.5, 0, 0, 0.5]
+    bell_target = {'00': 0.5, '11': 0.5}
+    # One Bell state per coupler, QB3 and each of the other qubits on Helmi
+    bell_pairs = sorted({tuple(sorted(edge)) for edge in coupling_map})
 
-    print(" ")
-    print(offset + "================================ ")
-    print(offset + "    Preparing a Bell State")
-    print(offset + "================================ ")
-    print(" ")
-    count = 0
-    for qb in [0, 1, 3, 4]:
-        print(offset + "QB" + str(qb + 1) + " and QB3 -> ", end=" ")
+    # Build every circuit up front so that all jobs can be queued at the same time
+    circuits = []
+    for qb_a, qb_b in bell_pairs:
         qreg = QuantumRegister(2, "qB")
         circuit = QuantumCircuit(qreg)
 
@@ -109,91 +244,119 @@ def main():
 
         circuit.measure_all()
 
+        # map the virtual qubits to the coupled physical qubits
+        mapping = {qreg[0]: qb_a, qreg[1]: qb_b}
+        circuits.append((circuit, mapping))
+
+    selector = None
+    calibration_data = None
+    if args.calibration:
+        client = backend.client if args.backend == 'helmi' else None
+        calibration_data = load_calibration_data(args.calibration, client)
+        selector = LayoutSelector(calibration_data, coupling_map)
+    if args.mitigate and calibration_data is None:
+        raise ValueError("--mitigate requires --calibration")
+
+    tracer = Tracer(args.trace)
+    with tracer.span("build", qubits=args.qubits):
+        circuits.append(ghz_circuit(args.qubits, coupling_map, selector))
+
+    # Transpile here as the transpiler is not thread safe, then run the jobs for all circuits concurrently
+    with tracer.span("transpile", circuits=len(circuits)):
+        transpiled = [transpile(circuit, backend, initial_layout=mapping) for circuit, mapping in circuits]
+    job_manager = JobManager()
+    submit = partial(tracer.submit, backend)
+    if result_cache is not None:
+        submissions = [partial(result_cache.run, circuit, shots, submit) for circuit in transpiled]
+    else:
+        submissions = [partial(submit, circuit, shots=shots) for circuit in transpiled]
+    results = job_manager.run(submissions)
+
+    # Bootstrap confidence intervals of the fidelities of all Bell pairs at once
+    bell_intervals = bootstrap_metrics([result.get_counts() for result in results[:-1]], bell_target)
+
+    print(" ")
+    print(offset + "================================ ")
+    print(offset + "    Preparing a Bell State")
+    print(offset + "================================ ")
+    print(" ")
+    for count, (qb_a, qb_b) in enumerate(bell_pairs):
+        print(offset + "QB" + str(qb_a + 1) + " and QB" + str(qb_b + 1) + " -> ", end=" ")
+        circuit, _ = circuits[count]
+
         if args.verbose:
             print(" ")
             print(circuit.draw())
 
-        mapping = {
-            qreg[0]: qb,  # map first virtual qubit to qubit in list
-            qreg[1]: 2,
-        }   # map second virtual qubit to QB3
-
-        # Run job on the circuit
-        job = execute(circuit, backend, shots=shots, initial_layout=mapping)
-        counts = job.result().get_counts()
+        counts = results[count].get_counts()
 
         if args.verbose:
             print(counts)
             if "IQM" in str(backend):
-                print(job.result().request.qubit_mapping)
+                print(results[count].request.qubit_mapping)
 
-        values = counts.values()
-        values_list = list(values)
+        if args.mitigate:
+            counts = mitigate_readout(counts, circuits[count][1], calibration_data)
 
-        vd = 0
-        fid1 = 0
-        for i in range(len(counts)):
-            vd += np.abs(values_list[i] / shots - id_dist[i])
-            vd = 0.5 * vd
-            fid1 += np.sqrt((values_list[i] / shots) * id_dist[i])
+        metrics = distribution_metrics(counts, bell_target)
+        fid1 = metrics['fidelity']
 
-        bell_vd.append(vd)
+        bell_vd.append(metrics['tvd'])
 
-        print("Fidelity = ", round(fid1, 3))
+        if args.mitigate:
+            print("Fidelity = ", round(fid1, 3))
+        else:
+            _, lower, upper = bell_intervals['fidelity'][count]
+            print("Fidelity = ", round(fid1, 3), f"(95% interval {lower:.4f} - {upper:.4f})")
         print(offset_2 + offset_3, end=" ")
         print(
             offset_3 +
             "Distance from target ([0,1]) = ", round(bell_vd[count], 3),
         )
 
-        count += 1
-
     print(" ")
     print(offset + "================================ ")
-    print(offset + "    Preparing a GHZ-5 State")
+    print(offset + f"    Preparing a GHZ-{args.qubits} State")
     print(offset + "================================ ")
     print(" ")
 
-    id_dist = [0 for i in range(32)]
-    id_dist[0] = 0.5
-    id_dist[31] = 0.5
-
-    qreg = QuantumRegister(5, "qB")
-    circuit = QuantumCircuit(qreg)
-
-    circuit.h(qreg[2])
-    for qb in [0, 1, 3, 4]:
-        circuit.cx(qreg[2], qreg[qb])
-
-    circuit.measure_all()
+    circuit, _ = circuits[-1]
 
     if args.verbose:
         print(" ")
         print(circuit.draw())
 
-    job = execute(circuit, backend, shots=shots)
-    counts = job.result().get_counts()
+    counts = results[-1].get_counts()
 
     if args.verbose:
         print(counts)
         if "IQM" in str(backend):
             print(
                 offset + "\n" +
-                job.result().request.qubit_mapping[0].physical_name + "\n",
+                results[-1].request.qubit_mapping[0].physical_name + "\n",
             )
 
-    values = counts.values()
-    values_list = list(values)
-
-    vd = 0
-    fid2 = 0
-    for i in range(len(counts)):
-        vd += np.abs(values_list[i] / shots - id_dist[i])
-        vd = 0.5 * vd
-        fid2 += np.sqrt((values_list[i] / shots) * id_dist[i])
-
-    print(offset + "GHZ-5 -> Fidelity = ", round(fid2, 3))
-    print(offset + "GHZ-5 -> Distance from target ([0,1]) = ", round(vd, 3))
+    with tracer.span("postprocess", job_id=job_manager.job_ids.get(len(circuits) - 1)):
+        if args.mitigate:
+            counts = mitigate_readout(counts, circuits[-1][1], calibration_data)
+        metrics = distribution_metrics(counts, ghz_target(args.qubits))
+
+    print(offset + f"GHZ-{args.qubits} -> Fidelity = ", round(metrics['fidelity'], 3))
+    print(offset + f"GHZ-{args.qubits} -> Distance from target ([0,1]) = ", round(metrics['tvd'], 3))
+    print(offset + f"GHZ-{args.qubits} -> Hellinger distance = ", round(metrics['hellinger'], 3))
+    if not args.mitigate:
+        intervals = bootstrap_metrics([counts], ghz_target(args.qubits))
+        for name, label in (('fidelity', 'Fidelity'), ('tvd', 'Distance from target'), ('hellinger', 'Hellinger')):
+            _, lower, upper = intervals[name][0]
+            print(offset + f"GHZ-{args.qubits} -> {label} 95% interval = {lower:.4f} - {upper:.4f}")
+    if args.mitigate:
+        print(offset + "Readout errors were mitigated with the calibration data")
+
+    if args.trace:
+        print(" ")
+        for phase, seconds in tracer.summary().items():
+            print(offset + f"{phase:12} {seconds:.4f} seconds in total")
+        print(offset + f"Spans saved to {args.trace}")
 
     print(" ")
     print(" ")
@@ -3,11 +3,19 @@ A more advanced example to flip qubits with either Helmi or the simulator.
 """
 import argparse
 import os
+import sys
 from argparse import RawTextHelpFormatter
 
 from iqm.qiskit_iqm import IQMProvider
 
-from qiskit import Aer, QuantumCircuit, QuantumRegister, execute
+from qiskit import Aer, QuantumCircuit, QuantumRegister, transpile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.calibration import load_calibration_data  # noqa: E402
+from helmi_utils.noise_model import noisy_simulator  # noqa: E402
+from helmi_utils.readout_mitigation import ReadoutMitigator  # noqa: E402
+from helmi_utils.result_cache import DEFAULT_CACHE_DIR as DEFAULT_RESULT_CACHE_DIR  # noqa: E402
+from helmi_utils.result_cache import ResultCache, offline_helmi_backend  # noqa: E402
 
 
 def get_args():
@@ -15,8 +23,16 @@ def get_args():
         description="Qubit flipping options", formatter_class=RawTextHelpFormatter,
     )
     parser.add_argument(
-        "--backend", choices=['helmi', 'simulator'],
-        help="Backend to use: 'helmi' or 'simulator'", required=True,
+        "--backend", choices=['helmi', 'simulator', 'noisy-sim'],
+        help="Backend to use: 'helmi', 'simulator' or 'noisy-sim'", required=True,
+    )
+    parser.add_argument(
+        "--calibration", type=str, default=None,
+        help="Calibration data json file, or 'latest' on Helmi, for --mitigate. 'noisy-sim' needs a file.",
+    )
+    parser.add_argument(
+        "--mitigate", action="store_true",
+        help="Also report the success probability corrected for the readout errors of --calibration.",
     )
     parser.add_argument(
         "--qubits", type=int, nargs='+',
@@ -26,6 +42,18 @@ def get_args():
         "--shots", type=int, default=1000,
         help="Number of shots to run the circuit. Default is 1000.",
     )
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="Submit all flip circuits as a single job instead of one job per qubit.",
+    )
+    parser.add_argument(
+        "--result-cache", type=str, default=None,
+        help="Directory for caching job results. Jobs that already ran with the current calibration are reused.",
+    )
+    parser.add_argument(
+        "--replay", action="store_true",
+        help="Only use cached results and never submit jobs. Works offline also with --backend helmi.",
+    )
     parser.add_argument(
         "--verbose", "-v", action="store_true",
         help="Verbose output",
@@ -68,11 +96,16 @@ def single_flip_circuit(qubit: int) -> tuple[QuantumCircuit, dict]:
     return qc, mapping
 
 
-def flip_qubits(qubits: list[int], backend: str, shots: int, verbose: bool):
+def flip_qubits(
+    qubits: list[int], backend: str, shots: int, verbose: bool, batch: bool = False, calibration: str = None,
+    result_cache: str = None, replay: bool = False, mitigate: bool = False,
+):
     """
     Function to run the flip circuit
     """
-    if backend == 'helmi':
+    if backend == 'helmi' and replay:
+        backend = offline_helmi_backend()
+    elif backend == 'helmi':
         HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
         if not HELMI_CORTEX_URL:
             raise ValueError(
@@ -80,10 +113,24 @@ def flip_qubits(qubits: list[int], backend: str, shots: int, verbose: bool):
             )
         provider = IQMProvider(HELMI_CORTEX_URL)
         backend = provider.get_backend()
+    elif backend == 'noisy-sim':
+        if not calibration or calibration == 'latest':
+            raise ValueError("--backend noisy-sim requires --calibration FILE")
+        backend = noisy_simulator(calibration)
     else:
         provider = Aer
         backend = provider.get_backend('aer_simulator')
 
+    calibration_data = None
+    if mitigate:
+        if not calibration:
+            raise ValueError("--mitigate requires --calibration")
+        calibration_data = load_calibration_data(calibration, getattr(backend, "client", None))
+
+    cache = None
+    if result_cache or replay:
+        cache = ResultCache(backend, result_cache or DEFAULT_RESULT_CACHE_DIR, replay=replay)
+
     circuit_mapping_pairs = []  # circuit, mapping tuples
     if qubits is None:  # Flip all qubits
         print("Flipping all qubits")
@@ -95,24 +142,45 @@ def flip_qubits(qubits: list[int], backend: str, shots: int, verbose: bool):
             circuit, mapping = single_flip_circuit(qb)
             circuit_mapping_pairs.append((circuit, mapping))
 
+    if batch:
+        # One multi-circuit job for all qubits, results are split per circuit afterwards
+        transpiled_circuits = [
+            transpile(circuit, backend, initial_layout=mapping)
+            for circuit, mapping in circuit_mapping_pairs
+        ]
+        if cache is not None:
+            result = cache.run(transpiled_circuits, shots).result()
+        else:
+            result = backend.run(transpiled_circuits, shots=shots).result()
+        all_counts = [result.get_counts(i) for i in range(len(transpiled_circuits))]
+
+        if verbose and "IQM" in str(backend):
+            print("Mapping")
+            print(result.request.qubit_mapping)
+
     # Calculate success probability
     for i, (circuit, mapping) in enumerate(circuit_mapping_pairs):
         if verbose:
             print(f"Circuit {i+1}:\n")
             print(circuit)
 
-        job = execute(circuit, backend, shots=shots, initial_layout=mapping)
-        counts = job.result().get_counts()
+        if batch:
+            counts = all_counts[i]
+        else:
+            transpiled = transpile(circuit, backend, initial_layout=mapping)
+            job = cache.run(transpiled, shots) if cache is not None else backend.run(transpiled, shots=shots)
+            counts = job.result().get_counts()
 
-        if verbose and "IQM" in str(backend):
-            print("Mapping")
-            print(job.result().request.qubit_mapping)
+            if verbose and "IQM" in str(backend):
+                print("Mapping")
+                print(job.result().request.qubit_mapping)
 
         if qubits is None:
             success_probability = calculate_success_probability(
                 counts, shots, '11111',
             )
         else:
+            print(f"\nQB{qubits[i] + 1}")
             success_probability = calculate_success_probability(
                 counts, shots, '1',
             )
@@ -121,6 +189,12 @@ def flip_qubits(qubits: list[int], backend: str, shots: int, verbose: bool):
 
         print(f"Success probability: {success_probability * 100:.2f}%")
 
+        if mitigate:
+            mitigator = ReadoutMitigator.from_calibration(calibration_data, list(mapping.values()))
+            desired_state = '11111' if qubits is None else '1'
+            mitigated = mitigator.mitigate(counts).get(desired_state, 0)
+            print(f"Success probability (readout mitigated): {mitigated * 100:.2f}%")
+
 
 def main():
     """
@@ -128,7 +202,10 @@ def main():
     """
     args = get_args()
 
-    flip_qubits(args.qubits, args.backend, args.shots, args.verbose)
+    flip_qubits(
+        args.qubits, args.backend, args.shots, args.verbose, args.batch, args.calibration,
+        args.result_cache, args.replay, args.mitigate,
+    )
 
 
 if __name__ == "__main__":
@@ -4,18 +4,26 @@ Kindly contributed by JLenssen
 """
 import collections
 import os
+import sys
 import time
 from datetime import datetime
+from functools import partial
 from itertools import product
 
 import matplotlib.pyplot as plt
 import numpy as np
 from iqm.qiskit_iqm import IQMProvider
 
-from qiskit import Aer, QuantumCircuit, QuantumRegister, execute
+from qiskit import Aer, QuantumCircuit, QuantumRegister, transpile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.job_manager import JobManager  # noqa: E402
+from helmi_utils.tracing import Tracer  # noqa: E402
 
 SIMULATE = False
 SHOTS = 1000
+# Set HELMI_TRACE_FILE to save the timing of every phase of every job, see helmi_utils/tracing.py
+TRACE_FILE = os.getenv('HELMI_TRACE_FILE')
 
 state2index = {'00': (0, 0), '10': (1, 0), '11': (1, 1), '01': (0, 1)}
 
@@ -28,14 +36,17 @@ qubit_combinations = list(product(center_qubit, leaf_qubits)) + \
 fig, axs = plt.subplots(4, 2, figsize=(10, 10))
 
 
-n_qubits = 2
-qreg = QuantumRegister(n_qubits, "qB")
-circuit = QuantumCircuit(qreg)
+tracer = Tracer(TRACE_FILE)
+
+with tracer.span("build"):
+    n_qubits = 2
+    qreg = QuantumRegister(n_qubits, "qB")
+    circuit = QuantumCircuit(qreg)
 
-# Test Circuit
-circuit.h(qreg[0])
-circuit.cx(qreg[0], qreg[1])
-circuit.measure_all()
+    # Test Circuit
+    circuit.h(qreg[0])
+    circuit.cx(qreg[0], qreg[1])
+    circuit.measure_all()
 print(circuit)
 
 if SIMULATE:
@@ -48,30 +59,47 @@ else:
     backend = provider.get_backend()
 
 
-for idx, (qubit_a, qubit_b) in enumerate(qubit_combinations):
-
-    start_time = time.time()
-    qubit_mapping = {  # The qubit mapping can be added optionally
-        qreg[0]: qubit_a,
-        qreg[1]: qubit_b,
-    }
-    job = execute(circuit, backend, shots=SHOTS, initial_layout=qubit_mapping)
-    counts = job.result().get_counts()
-    end_time = time.time() - start_time
+def plot_counts(idx, result):
+    """
+    Plots the counts of one qubit pair as soon as its job has finished.
+    """
+    qubit_a, qubit_b = qubit_combinations[idx]
+    with tracer.span("postprocess", job_id=job_manager.job_ids.get(idx)):
+        counts = result.get_counts()
 
-    ordered_counts = collections.OrderedDict(sorted(counts.items()))
-    print(f"QB{qubit_a+1}-QB{qubit_b+1} ({end_time:.4f} seconds)")
+        ordered_counts = collections.OrderedDict(sorted(counts.items()))
+    print(f"QB{qubit_a+1}-QB{qubit_b+1} ({job_manager.wall_times[idx]:.4f} seconds)")
     print(ordered_counts)
 
     matrix = np.zeros((2, 2))
     for key in ordered_counts.keys():
         matrix[state2index[key]] = ordered_counts[key]
 
-    im = axs[idx % 4, idx//4].imshow(matrix)
+    axs[idx % 4, idx//4].imshow(matrix)
     axs[idx % 4, idx//4].set_title(f"QB{qubit_a}-QB{qubit_b}")
     for (j, i), label in np.ndenumerate(matrix):
         axs[idx % 4, idx//4].text(i, j, int(label), ha='center', va='center')
 
+
+# Submit the jobs for all qubit pairs at once and plot each one as it finishes
+submissions = []
+for qubit_a, qubit_b in qubit_combinations:
+    qubit_mapping = {  # The qubit mapping can be added optionally
+        qreg[0]: qubit_a,
+        qreg[1]: qubit_b,
+    }
+    # Transpile before submitting as the transpiler is not thread safe
+    with tracer.span("transpile", qubits=f"QB{qubit_a+1}-QB{qubit_b+1}"):
+        transpiled = transpile(circuit, backend, initial_layout=qubit_mapping)
+    submissions.append(partial(tracer.submit, backend, transpiled, shots=SHOTS))
+
+job_manager = JobManager()
+start_time = time.time()
+job_manager.run(submissions, callback=plot_counts)
+print(f"All pairs finished in {time.time() - start_time:.4f} seconds")
+for phase, seconds in tracer.summary().items():
+    print(f"  {phase:12} {seconds:.4f} seconds in total")
+
 now = datetime.now()
 formatted_date = now.strftime("%d.%m.%Y")
 plt.suptitle(
@@ -5,7 +5,7 @@
 #SBATCH --error=helmijob.e%j  # Name of stderr error file
 #SBATCH --partition=q_fiqci   # Partition (queue) name
 #SBATCH --ntasks=1              # One task (process)
-#SBATCH --cpus-per-task=1     # Number of cores (threads)
+#SBATCH --cpus-per-task=4     # Number of cores (threads), used to compile circuits in parallel
 #SBATCH --time=00:15:00         # Run time (hh:mm:ss)
 #SBATCH --account=project_xxx  # Project for billing
 
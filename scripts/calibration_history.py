@@ -0,0 +1,82 @@
+"""
+Build and query a columnar store of Helmi's calibration history.
+
+Calibration data saved with get_calibration_data (json) or kept by CalibrationCache (json.gz)
+is flattened into NumPy columns, see helmi_utils/calibration_store.py.
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import sys
+import time
+from argparse import RawTextHelpFormatter
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.calibration import DEFAULT_CACHE_DIR  # noqa: E402
+from helmi_utils.calibration_store import CalibrationStore  # noqa: E402
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Calibration history store", formatter_class=RawTextHelpFormatter,
+        epilog="""Example usage:
+        python calibration_history.py --ingest ~/.cache/helmi_examples/calibration/*.json.gz
+        python calibration_history.py --metric t1_time --component QB3 --days 90
+        """,
+    )
+    parser.add_argument(
+        "--store", default=os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), "history"),
+        help="Directory of the calibration history store.",
+    )
+    parser.add_argument(
+        "--ingest", nargs='+', default=[],
+        help="Calibration data files (.json or .json.gz) to add to the store.",
+    )
+    parser.add_argument(
+        "--metric",
+        help="Figure of merit to print, e.g. t1_time.",
+    )
+    parser.add_argument(
+        "--component", default="",
+        help="Qubit or coupler of the figure of merit, e.g. QB3.",
+    )
+    parser.add_argument(
+        "--days", type=float, default=None,
+        help="Only print the last number of days. Calibration sets without a timestamp are left out.",
+    )
+    return parser.parse_args()
+
+
+def load(filename: str) -> dict:
+    """
+    Loads a calibration data file saved as json or json.gz.
+    """
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, 'rt') as f:
+        return json.load(f)
+
+
+def main():
+    args = get_args()
+
+    store = CalibrationStore(args.store)
+
+    if args.ingest:
+        added = store.ingest(load(filename) for filename in args.ingest)
+        print(f"Added {added} calibration sets to {args.store}")
+
+    if args.metric:
+        start = time.time() - args.days * 86400 if args.days else None
+        series = store.query(args.metric, args.component, start=start)
+        for timestamp, value, calibration_set_id in zip(
+            series["timestamp"], series["value"], series["calibration_set_id"],
+        ):
+            date = "unknown" if math.isnan(timestamp) else f"{datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M}"
+            print(f"{date:<16}  {value:.6g}  {calibration_set_id}")
+
+
+if __name__ == "__main__":
+    main()
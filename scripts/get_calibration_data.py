@@ -1,48 +1,66 @@
-import json
+import argparse
 import os
+import sys
+from argparse import RawTextHelpFormatter
 
-import requests
-from iqm.iqm_client import IQMClient  # Requires iqm_client==15.3
 from iqm.qiskit_iqm import IQMProvider
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.calibration import CalibrationCache, get_calibration_data, get_calibration_data_bulk  # noqa: E402
 
-def get_calibration_data(client: IQMClient, calibration_set_id=None, filename: str = None):
-    """
-    Return the calibration data and figures of merit using IQMClient.
-    Optionally you can input a calibration set id (UUID) to query historical results
-    Optionally save the response to a json file, if filename is provided
-    """
-    headers = {'User-Agent': client._signature}
-    bearer_token = client._get_bearer_token()
-    headers['Authorization'] = bearer_token
 
-    url = os.path.join(client._base_url, 'calibration/metrics/latest')
-    if calibration_set_id:
-        url = os.path.join(url, calibration_set_id)
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Calibration data of Helmi", formatter_class=RawTextHelpFormatter,
+        epilog="""Example usage:
+        python get_calibration_data.py
+        python get_calibration_data.py --cache (reuses the latest calibration for --ttl seconds)
+        python get_calibration_data.py --history <calibration set id> <calibration set id>
+        """,
+    )
+    parser.add_argument(
+        "--cache", action="store_true",
+        help="Read the latest calibration through the local CalibrationCache.",
+    )
+    parser.add_argument(
+        "--ttl", type=float, default=300,
+        help="Seconds the cached latest calibration is used before the server is queried again. Default is 300.",
+    )
+    parser.add_argument(
+        "--history", nargs='+', default=None,
+        help="Calibration set IDs of historical calibrations to fetch concurrently.",
+    )
+    return parser.parse_args()
 
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()  # will raise an HTTPError if the response was not ok
 
-    data = response.json()
-    data_str = json.dumps(data, indent=4)
+def main():
+    args = get_args()
 
-    if filename:
-        with open(filename, 'w') as f:
-            f.write(data_str)
-        print(f"Data saved to {filename}")
+    HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
+    if not HELMI_CORTEX_URL:
+        raise ValueError("Environment variable HELMI_CORTEX_URL is not set")
 
-    return data
+    # Using Qiskit as an example of how to query using this function.
 
+    provider = IQMProvider(HELMI_CORTEX_URL)
+    backend = provider.get_backend()
 
-HELMI_CORTEX_URL = os.getenv('HELMI_CORTEX_URL')
-if not HELMI_CORTEX_URL:
-    raise ValueError("Environment variable HELMI_CORTEX_URL is not set")
+    if args.history:
+        # Many historical calibration sets are fetched concurrently over one pooled connection
+        history = get_calibration_data_bulk(backend.client, args.history, max_workers=8)
+        for calibration_set_id, calibration_data in history.items():
+            print(calibration_set_id)
+            print(calibration_data)
+        return
 
-# Using Qiskit as an example of how to query using this function.
+    if args.cache:
+        # The server is only queried again once the latest calibration set is older than ttl seconds
+        calibration_data = CalibrationCache(backend.client, ttl=args.ttl).get()
+    else:
+        calibration_data = get_calibration_data(backend.client)
 
-provider = IQMProvider(HELMI_CORTEX_URL)
-backend = provider.get_backend()
+    print(calibration_data)
 
-calibration_data = get_calibration_data(backend.client)
 
-print(calibration_data)
+if __name__ == "__main__":
+    main()
@@ -4,4 +4,4 @@
 # > bash int_job.sh 'qb_flip_qiskit.py --backend helmi'
 
 clear
-srun --account project_xxx -t 00:15:00 -c 1 -n 1 --partition q_fiqci python -u $1
+srun --account project_xxx -t 00:15:00 -c 4 -n 1 --partition q_fiqci python -u $1
@@ -0,0 +1,63 @@
+"""
+Run a local stand-in for Helmi's Cortex server, see helmi_utils/mock_cortex.py.
+
+Example usage:
+    python mock_cortex_server.py --port 8000 --queue-delay 2 &
+    export HELMI_CORTEX_URL=http://127.0.0.1:8000
+    python ../qiskit/ghz.py --backend helmi
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.mock_cortex import MockCortex  # noqa: E402
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Helmi Cortex server")
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1",
+        help="Address to listen on. Default is 127.0.0.1.",
+    )
+    parser.add_argument(
+        "--port", type=int, default=8000,
+        help="Port to listen on. Default is 8000.",
+    )
+    parser.add_argument(
+        "--queue-delay", type=float, default=0.0,
+        help="Seconds every job waits in the queue before it runs. Default is 0.",
+    )
+    parser.add_argument(
+        "--execution-delay", type=float, default=0.0,
+        help="Extra seconds spent running every job. Default is 0.",
+    )
+    parser.add_argument(
+        "--calibration", type=str, default=None,
+        help="Calibration data json file to serve and to simulate the noise of. Default is noiseless.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None,
+        help="Seed of the simulator for reproducible results.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    cortex = MockCortex(
+        host=args.host, port=args.port, queue_delay=args.queue_delay,
+        execution_delay=args.execution_delay, calibration_file=args.calibration, seed=args.seed,
+    )
+    with cortex:
+        print(f"Serving on {cortex.url}, set HELMI_CORTEX_URL={cortex.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
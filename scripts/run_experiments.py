@@ -0,0 +1,59 @@
+"""
+Run the experiments of a manifest in one warm process, see helmi_utils/experiment_runner.py.
+
+Example usage:
+    python run_experiments.py nightly.json
+    python run_experiments.py nightly.json --parallel 8
+    sbatch batch_script.sh 'run_experiments.py nightly.json'
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helmi_utils.experiment_runner import ExperimentRunner, load_manifest  # noqa: E402
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Run many example scripts in one process")
+    parser.add_argument(
+        "manifest", type=str,
+        help="JSON list of experiments, each with a script relative to the manifest and its args.",
+    )
+    parser.add_argument(
+        "--parallel", type=int, default=4,
+        help="Number of experiments run at the same time. Default is 4.",
+    )
+    parser.add_argument(
+        "--submitters", type=int, default=1,
+        help="Number of jobs submitted to a backend at the same time. Default is 1.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    experiments = load_manifest(args.manifest)
+    runner = ExperimentRunner(max_parallel=args.parallel, max_submitters=args.submitters)
+
+    def print_output(index, result):
+        print(f"===== [{index + 1}/{len(experiments)}] {result['name']} {' '.join(result['args'])}")
+        print(result["output"], end="", flush=True)
+        print(f"===== {result['status']} in {result['seconds']:.1f} seconds", flush=True)
+
+    start = time.time()
+    results = runner.run(experiments, callback=print_output)
+
+    print(f"\n{'Experiment':<70} {'Status':<8} {'Seconds':>8}")
+    for result in results:
+        name = f"{result['name']} {' '.join(result['args'])}"
+        print(f"{name:<70} {result['status']:<8} {result['seconds']:>8.1f}")
+    failed = sum(result["status"] != "ok" for result in results)
+    print(f"{len(results) - failed} of {len(results)} experiments succeeded in {time.time() - start:.1f} seconds")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()